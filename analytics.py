@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Shift and contract analytics for /api/reports
+The current schedule rows are loaded into pandas columns once per schedule
+import (ScheduleTrips), and the shift assignments once per shift change
+(ScheduleAnalytics). Trip spans, stop durations, driver hours, idle gaps,
+shift utilization and per-facility hourly load are then computed with grouped
+and array operations rather than per-trip Python loops.
+
+Times are minutes after midnight, as in deadhead.py; a trip whose last stop is
+"earlier" than its first runs past midnight.
+"""
+
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from deadhead import TIME_PATTERN, MINUTES_PER_DAY
+
+logger = logging.getLogger(__name__)
+
+# Every current row is needed, so this is one sequential read per generation
+STOPS_SQL = """
+    SELECT contract_hcr_number, trip_id, stop_number, facility,
+           arrive_time, depart_time, load_unload_duration
+    FROM schedule
+    WHERE valid_to IS NULL
+"""
+
+STOP_COLUMNS = ['contract_hcr_number', 'trip_id', 'stop_number', 'facility',
+                'arrive_time', 'depart_time', 'load_unload_duration']
+
+HOURS = 24
+DURATION_CLOCK_PATTERN = r'(\d+):(\d{2})'
+DURATION_NUMBER_PATTERN = r'(\d+(?:\.\d+)?)'
+DURATION_HOURS_PATTERN = r'\d\s*h(?:ou)?rs?\b|\d\s*h\b'
+
+
+def load_stops(database):
+    """Current schedule rows of one database as a DataFrame (empty before the first import)"""
+    with database.connection() as conn:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='schedule'").fetchone():
+            return pd.DataFrame(columns=STOP_COLUMNS)
+        return pd.read_sql_query(STOPS_SQL, conn)
+
+
+def _parse_distinct(values, parse):
+    """Run a string parser over the distinct values only, then map the results back
+
+    Schedules repeat the same few thousand time strings across millions of
+    stops, so regex work scales with the vocabulary, not the row count.
+    """
+    codes, uniques = pd.factorize(values)
+    parsed = parse(pd.Series(uniques, dtype=object).astype(str)).to_numpy(dtype=np.float64)
+    # Missing values have code -1, which picks the trailing NaN
+    return pd.Series(np.append(parsed, np.nan)[codes], index=values.index)
+
+
+def _clock(text):
+    parts = text.str.extract(TIME_PATTERN).astype(float)
+    return parts[0] * 60 + parts[1] + parts[2].fillna(0) / 60
+
+
+def _duration(text):
+    text = text.str.lower()
+    clock = text.str.extract(DURATION_CLOCK_PATTERN).astype(float)
+    number = text.str.extract(DURATION_NUMBER_PATTERN)[0].astype(float)
+    in_hours = text.str.contains(DURATION_HOURS_PATTERN, regex=True)
+    return pd.Series(np.where(clock[0].notna(), clock[0] * 60 + clock[1],
+                              np.where(in_hours, number * 60, number)))
+
+
+def clock_minutes(values):
+    """Vectorised parse_minutes: '08:30:00 ET' -> 510.0, NaN if absent"""
+    return _parse_distinct(values, _clock)
+
+
+def duration_minutes(values):
+    """Load/unload durations such as '30 min', '1:15' or '2 hrs' in minutes; 0 if absent"""
+    return _parse_distinct(values, _duration).fillna(0)
+
+
+def trip_spans(stops):
+    """One row per (contract, trip): origin facility, start/end minute, stop count and dwell"""
+    arrive = clock_minutes(stops['arrive_time'])
+    depart = clock_minutes(stops['depart_time'])
+    stops = stops.assign(
+        start=arrive.fillna(depart),
+        end=depart.fillna(arrive),
+        dwell=duration_minutes(stops['load_unload_duration'])
+    ).sort_values(['contract_hcr_number', 'trip_id', 'stop_number'], kind='stable')
+
+    grouped = stops.groupby(['contract_hcr_number', 'trip_id'], sort=False, dropna=False)
+    # first()/last() skip missing values, so a stop without times is passed over
+    trips = grouped.agg(
+        origin=('facility', 'first'),
+        start=('start', 'first'),
+        end=('end', 'last'),
+        stops=('stop_number', 'size'),
+        stop_minutes=('dwell', 'sum')
+    ).reset_index()
+    trips['end'] = np.where(trips['end'] < trips['start'], trips['end'] + MINUTES_PER_DAY, trips['end'])
+    trips['minutes'] = trips['end'] - trips['start']
+    return trips
+
+
+def shift_assignments(shifts):
+    """(shift_id, trip_id) pairs from the shifts table's comma-separated trip lists"""
+    frame = pd.DataFrame(shifts, columns=['id', 'shift_name', 'trip_ids'])
+    pairs = frame.assign(trip_id=frame['trip_ids'].str.split(',')).explode('trip_id')
+    pairs = pairs[pairs['trip_id'].str.strip().str.len() > 0]
+    return pd.DataFrame({
+        'shift_id': pairs['id'].astype(np.int64).to_numpy(),
+        'trip_id': pairs['trip_id'].astype(np.int64).to_numpy()
+    })
+
+
+def _past_midnight(legs):
+    """Legs sorted by shift and driving order, with trips after midnight moved to the next day
+
+    The grouped form of deadhead.past_midnight_offsets: each shift begins after
+    the longest gap between its trip starts around the 24-hour clock.
+    """
+    legs = legs.sort_values(['shift_id', 'start'], kind='stable')
+    starts = legs.groupby('shift_id', sort=False)['start']
+    position = starts.cumcount()
+    size = starts.transform('size')
+    # The last trip's gap wraps around to the first trip's start the next day
+    gap = (starts.shift(-1) - legs['start']).fillna(starts.transform('first') + MINUTES_PER_DAY - legs['start'])
+    largest = gap == gap.groupby(legs['shift_id']).transform('max')
+    # The last of the largest gaps, so the wrap-around gap wins a tie
+    cut = position.where(largest).groupby(legs['shift_id']).transform('max')
+    moved = (position <= cut) & (cut < size - 1)
+    if not moved.any():
+        return legs
+    legs = legs.copy()
+    legs.loc[moved, ['start', 'end']] += MINUTES_PER_DAY
+    return legs.sort_values(['shift_id', 'start'], kind='stable')
+
+
+def trip_totals(trips):
+    """One row per trip id; a trip id can appear under more than one contract, so take its widest span"""
+    per_trip = trips.groupby('trip_id').agg(start=('start', 'min'), end=('end', 'max'),
+                                            stop_minutes=('stop_minutes', 'sum'))
+    per_trip['minutes'] = per_trip['end'] - per_trip['start']
+    return per_trip
+
+
+def shift_metrics(per_trip, assignments, shift_names):
+    """Driver hours, idle gaps and utilization per shift, from trip_totals()"""
+    legs = assignments.join(per_trip, on='trip_id', how='left')
+    missing = legs[legs['start'].isna()].groupby('shift_id').size()
+    legs = _past_midnight(legs.dropna(subset=['start', 'end']))
+
+    # The gap before a trip is measured from the latest end so far, so overlapping trips are not idle
+    running_end = legs.groupby('shift_id')['end'].cummax()
+    legs['gap'] = (legs['start'] - running_end.groupby(legs['shift_id']).shift()).clip(lower=0)
+    legs['idle_gap'] = legs['gap'] > 0
+
+    metrics = legs.groupby('shift_id').agg(
+        trips=('trip_id', 'size'),
+        start=('start', 'min'),
+        end=('end', 'max'),
+        trip_minutes=('minutes', 'sum'),
+        stop_minutes=('stop_minutes', 'sum'),
+        idle_minutes=('gap', 'sum'),
+        idle_gaps=('idle_gap', 'sum'),
+        longest_gap=('gap', 'max')
+    )
+    metrics['span'] = metrics['end'] - metrics['start']
+    metrics['utilization'] = (metrics['span'] - metrics['idle_minutes']) / metrics['span'].where(metrics['span'] > 0)
+    metrics = metrics.reindex(shift_names.index)
+    metrics['missing_trips'] = missing.reindex(shift_names.index).fillna(0)
+    metrics['shift_name'] = shift_names
+    return metrics
+
+
+def facility_hourly(trips):
+    """Trips in progress during each hour of the day, by origin facility
+
+    A trip counts in every hour its [start, end] interval touches. The counts
+    come from one difference array: +1 at each trip's first hour, -1 after its
+    last, then a cumulative sum; hours past midnight fold onto the next day.
+    """
+    trips = trips.dropna(subset=['origin', 'start', 'end'])
+    codes, facilities = pd.factorize(trips['origin'])
+    start = trips['start'].to_numpy()
+    end = np.minimum(trips['end'].to_numpy(), start + MINUTES_PER_DAY - 1)
+    # Times written as 24:00 or later belong to the next day
+    day_offset = (start // MINUTES_PER_DAY) * MINUTES_PER_DAY
+    start, end = start - day_offset, end - day_offset
+
+    first = (start // 60).astype(np.intp)
+    last = np.maximum(np.ceil(end / 60).astype(np.intp) - 1, first)
+    diff = np.zeros((len(facilities), 2 * HOURS + 1), dtype=np.int64)
+    np.add.at(diff, (codes, first), 1)
+    np.add.at(diff, (codes, last + 1), -1)
+    in_progress = diff.cumsum(axis=1)[:, :2 * HOURS]
+    hourly = in_progress[:, :HOURS] + in_progress[:, HOURS:]
+    trip_counts = np.bincount(codes, minlength=len(facilities))
+    return facilities, hourly, trip_counts
+
+
+def _number(value, digits=2):
+    """JSON-friendly float: rounded, None for NaN"""
+    if value is None or pd.isna(value):
+        return None
+    return round(float(value), digits)
+
+
+def _records(frame):
+    """DataFrame rows as JSON-ready dicts, with None for missing values"""
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+class ScheduleTrips:
+    """Trip spans of the current schedule, built once per schedule import"""
+
+    def __init__(self, stops):
+        started = time.perf_counter()
+        self.trips = trip_spans(stops)
+        self.per_trip = trip_totals(self.trips)
+        self.build_seconds = time.perf_counter() - started
+        logger.info(f"Built trip spans for {len(self.trips)} trips in {self.build_seconds:.2f}s")
+
+    @classmethod
+    def from_store(cls, schedule_store):
+        """Load every current stop (from each shard)"""
+        frames = schedule_store.each(load_stops)
+        return cls(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=STOP_COLUMNS))
+
+
+class ScheduleAnalytics:
+    """Shift metrics over a ScheduleTrips snapshot, built once per data generation"""
+
+    def __init__(self, schedule, shifts):
+        started = time.perf_counter()
+        self.schedule = schedule
+        self.trips = schedule.trips
+        self.assignments = shift_assignments(shifts)
+        self.shift_names = pd.Series({shift['id']: shift['shift_name'] for shift in shifts}, dtype=object)
+        self.shift_names.index = self.shift_names.index.astype(np.int64)
+        self.assigned = self.trips['trip_id'].isin(self.assignments['trip_id'])
+        self.shifts = shift_metrics(schedule.per_trip, self.assignments, self.shift_names)
+        self.build_seconds = time.perf_counter() - started
+        logger.info(f"Built shift analytics for {len(self.shift_names)} shifts in {self.build_seconds:.2f}s")
+
+    @classmethod
+    def from_store(cls, schedule, db):
+        """Read the shifts table and measure its shifts against `schedule`"""
+        shifts = db.execute_query("SELECT id, shift_name, trip_ids FROM shifts")
+        return cls(schedule, shifts)
+
+    def report(self, contracts=None):
+        """The /api/reports payload, optionally limited to some contracts"""
+        trips = self.trips
+        assigned = self.assigned
+        shifts = self.shifts
+        if contracts:
+            selected = trips['contract_hcr_number'].isin(contracts)
+            trips, assigned = trips[selected], assigned[selected]
+            touching = self.assignments.loc[self.assignments['trip_id'].isin(trips['trip_id']), 'shift_id']
+            shifts = shifts[shifts.index.isin(touching)]
+
+        by_contract = trips.assign(assigned=assigned).groupby('contract_hcr_number', dropna=False).agg(
+            trips=('trip_id', 'size'),
+            trip_minutes=('minutes', 'sum'),
+            stop_minutes=('stop_minutes', 'sum'),
+            assigned_trips=('assigned', 'sum')
+        )
+        facilities, hourly, trip_counts = facility_hourly(trips)
+        span = shifts['span'].sum()
+
+        return {
+            'totals': {
+                'trips': int(len(trips)),
+                'trip_hours': _number(trips['minutes'].sum() / 60),
+                'stop_hours': _number(trips['stop_minutes'].sum() / 60),
+                'assigned_trips': int(assigned.sum()),
+                'shifts': int(len(shifts)),
+                'driver_hours': _number(span / 60),
+                'idle_hours': _number(shifts['idle_minutes'].sum() / 60),
+                'utilization': _number((span - shifts['idle_minutes'].sum()) / span if span else None, 3)
+            },
+            'contracts': _records(pd.DataFrame({
+                'contract_hcr_number': by_contract.index,
+                'trips': by_contract['trips'].to_numpy(),
+                'trip_hours': (by_contract['trip_minutes'] / 60).round(2).to_numpy(),
+                'stop_hours': (by_contract['stop_minutes'] / 60).round(2).to_numpy(),
+                'assigned_trips': by_contract['assigned_trips'].to_numpy(),
+                'unassigned_trips': (by_contract['trips'] - by_contract['assigned_trips']).to_numpy()
+            })),
+            'shifts': _records(pd.DataFrame({
+                'shift_id': shifts.index,
+                'shift_name': shifts['shift_name'].to_numpy(),
+                'trips': shifts['trips'].fillna(0).astype(np.int64).to_numpy(),
+                'missing_trips': shifts['missing_trips'].astype(np.int64).to_numpy(),
+                'start_minute': shifts['start'].round(1).to_numpy(),
+                'end_minute': shifts['end'].round(1).to_numpy(),
+                'driver_hours': (shifts['span'] / 60).round(2).to_numpy(),
+                'trip_hours': (shifts['trip_minutes'] / 60).round(2).to_numpy(),
+                'stop_hours': (shifts['stop_minutes'] / 60).round(2).to_numpy(),
+                'idle_hours': (shifts['idle_minutes'] / 60).round(2).to_numpy(),
+                'idle_gaps': shifts['idle_gaps'].fillna(0).astype(np.int64).to_numpy(),
+                'longest_gap_minutes': shifts['longest_gap'].round(1).to_numpy(),
+                'utilization': shifts['utilization'].round(3).to_numpy()
+            })),
+            'facilities': [{
+                'facility': facility,
+                'trips': int(trip_counts[i]),
+                'peak_trips': int(hourly[i].max()),
+                'peak_hour': int(hourly[i].argmax()),
+                'hourly': hourly[i].tolist()
+            } for i, facility in enumerate(facilities)]
+        }
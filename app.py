@@ -4,48 +4,110 @@ MVP Trucking Schedule Management System
 Simple PDF upload and trip management
 """
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, send_file
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 import sqlite3
 import os
+import sys
+import json
+import queue
 import logging
+import tempfile
+import threading
+import time
+import uuid
+import heapq
+import random
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import subprocess
 
+from config import get_config, configure_logging, resolve_path
+from response_cache import ResponseCache, cached_response, skip_response_cache
+from streaming import stream_collection
+from events import EventBroker, EventLog, CHANGE_EVENTS, SCHEDULE_EVENTS
+from backup import BackupService
+from extraction_server import ExtractionClient, ExtractionServerError
+from chunked_upload import UploadSessionStore, UploadSessionError
+from search_index import ensure_search_index, has_search_index, build_match_query, SEARCH_TRIPS_SQL
+from deadhead import MatrixStore, TripEndpoints, check_sequence, feasible_successors
+from sharding import ShardCatalog, SingleStore, ShardedStore
+from profiling import ProfileStore, ProfilingMiddleware, PROFILE_REQUESTED
+from versions import ensure_versioning, list_versions, diff_versions
+from analytics import ScheduleAnalytics, ScheduleTrips
+
+# Configuration is loaded and validated once, at startup
+config = get_config()
+
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+configure_logging(config.logging)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-app.secret_key = os.environ.get('SECRET_KEY', 'dev-key-change-in-production')
+app.secret_key = config.app.secret_key
 CORS(app)
 
 # Configuration
-UPLOAD_FOLDER = 'uploads'
-DATABASE_PATH = 'trucking_schedule.db'
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = resolve_path(config.upload.folder)
+DATABASE_PATH = resolve_path(config.database.path)
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max
+app.config['MAX_CONTENT_LENGTH'] = config.upload.max_file_size_mb * 1024 * 1024
+RESPONSE_CACHE_ENTRIES = config.cache.response_entries
+STREAM_FETCH_SIZE = config.database.fetch_size
+DB_POOL_SIZE = config.database.pool_size
+EXTRACTION_WORKERS = config.server.extraction_workers
 
 class SimpleDB:
     """Simple database operations"""
     
-    def __init__(self, db_path=DATABASE_PATH):
+    def __init__(self, db_path=DATABASE_PATH, pool_size=DB_POOL_SIZE):
         self.db_path = db_path
+        # Idle connections are reused across request threads instead of reopened per query
+        self._pool = queue.LifoQueue(maxsize=pool_size)
     
-    def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=config.database.busy_timeout_ms / 1000,
+                               check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        # WAL (the default journal_mode) lets workers read while an import or shift edit writes
+        config.database.apply_pragmas(conn)
         return conn
     
+    def get_connection(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._connect()
+    
+    def release_connection(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection for the duration of a with-block"""
+        conn = self.get_connection()
+        try:
+            yield conn
+        finally:
+            self.release_connection(conn)
+    
     def execute_query(self, query, params=(), fetch_one=False):
-        with self.get_connection() as conn:
+        with self.connection() as conn:
             cursor = conn.cursor()
             cursor.execute(query, params)
             
-            if query.strip().upper().startswith('SELECT'):
+            if query.strip().upper().startswith(('SELECT', 'WITH')):
                 if fetch_one:
                     result = cursor.fetchone()
                     return dict(result) if result else None
@@ -54,6 +116,28 @@ class SimpleDB:
                 conn.commit()
                 return cursor.lastrowid
     
+    def stream_query(self, query, params=(), fetch_size=STREAM_FETCH_SIZE):
+        """Execute a SELECT now and return a generator that fetches rows lazily"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(query, params)
+        except Exception:
+            self.release_connection(conn)
+            raise
+        
+        def rows():
+            try:
+                while True:
+                    batch = cursor.fetchmany(fetch_size)
+                    if not batch:
+                        break
+                    for row in batch:
+                        yield dict(row)
+            finally:
+                self.release_connection(conn)
+        
+        return rows()
+    
     def ensure_shifts_table(self):
         """Create shifts table if it doesn't exist"""
         try:
@@ -68,22 +152,161 @@ class SimpleDB:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
+            self.execute_query("CREATE INDEX IF NOT EXISTS idx_shifts_created_at ON shifts(created_at)")
         except Exception as e:
             logger.error(f"Error creating shifts table: {e}")
 
 # Initialize database
 db = SimpleDB()
 
+# Schedule rows live in the main database, or in one shard file per contract.
+# Shifts and events always stay in the main database.
+if config.database.sharded:
+    schedule_store = ShardedStore(
+        ShardCatalog(resolve_path(config.database.catalog_path), resolve_path(config.database.shard_dir)),
+        lambda path: SimpleDB(path, pool_size=2),
+        max_workers=config.database.shard_query_workers
+    )
+else:
+    schedule_store = SingleStore(db)
+
+# GET responses are cached until the next upload or shift change bumps the generation
+response_cache = ResponseCache(max_entries=RESPONSE_CACHE_ENTRIES,
+                               max_entry_bytes=config.cache.response_max_entry_mb * 1024 * 1024)
+
+# Upload progress and data change notifications for /api/events subscribers.
+# Events go through a table in the database so every worker process sees them.
+event_log = EventLog(db.connection, retention=config.cache.event_retention)
+events = EventBroker(log=event_log, history_size=config.cache.event_history,
+                     poll_interval=config.cache.event_poll_seconds)
+
+# Id of the latest schedule import; caches derived from schedule rows alone key on it,
+# so they survive shift edits that bump the response cache generation
+schedule_generation = 0
+
+def _on_event(event):
+    global schedule_generation
+    if event['type'] in CHANGE_EVENTS:
+        response_cache.bump(event['id'])
+    if event['type'] in SCHEDULE_EVENTS:
+        schedule_generation = max(schedule_generation, event['id'])
+
+events.add_listener(_on_event)
+
+# PDF extraction runs here, bounded, rather than on the request threads
+extraction_executor = ThreadPoolExecutor(max_workers=EXTRACTION_WORKERS, thread_name_prefix='extraction')
+
+# A long-lived extraction process keeps tabula's JVM warm between uploads
+extraction_client = ExtractionClient(config.extraction) if config.extraction.server_enabled else None
+
+# Facility-to-facility drive times used to check shift feasibility
+deadhead_matrices = MatrixStore(
+    resolve_path(config.deadhead.matrix_path),
+    symmetric=config.deadhead.symmetric,
+    lru_size=config.deadhead.lru_size
+)
+
+# Resumable uploads are assembled here before moving into UPLOAD_FOLDER
+upload_sessions = UploadSessionStore(
+    os.path.join(UPLOAD_FOLDER, '.sessions'),
+    max_size_bytes=config.upload.chunked_max_size_mb * 1024 * 1024,
+    session_ttl_seconds=config.upload.session_ttl_hours * 3600
+)
+
+# Scheduled online snapshots; only one worker process runs the schedule
+backup_service = BackupService.from_config(config.database)
+
+# Opt-in profiling; when disabled the WSGI app is left untouched
+profile_store = ProfileStore.from_config(config.profiling)
+if config.profiling.enabled:
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app, profile_store, config.profiling)
+
+def upgrade_schedule_schema(database):
+    """Bring a database imported by an older release up to the schema reads expect"""
+    with database.connection() as conn:
+        if ensure_versioning(conn):
+            logger.info(f"Added schedule versions to {database.db_path}")
+        # A fresh install has no schedule table yet; the first import creates it with its index
+        if has_search_index(conn) or not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='schedule'").fetchone():
+            return
+        # Several workers may start at once; only the first one builds the index
+        conn.execute("BEGIN IMMEDIATE")
+        if ensure_search_index(conn):
+            logger.info(f"Built the search index of {database.db_path}")
+
+_shared_state_lock = threading.Lock()
+_shared_state_pid = None
+
+@app.before_request
+def init_shared_state():
+    """Sync this worker with the shared generation and start the event relay (once per process)"""
+    global _shared_state_pid
+    if _shared_state_pid == os.getpid():
+        return
+    with _shared_state_lock:
+        if _shared_state_pid == os.getpid():
+            return
+        try:
+            response_cache.instance_id = event_log.epoch()
+            response_cache.bump(event_log.generation())
+            events.start_relay()
+            if config.database.backup_enabled:
+                backup_service.start()
+            if extraction_client:
+                extraction_client.start_monitor()
+            # Reads filter on the version columns and search needs its index, so older databases are upgraded here
+            schedule_store.each(upgrade_schedule_schema)
+        except Exception as e:
+            logger.error(f"Could not initialise shared state: {e}")
+        _shared_state_pid = os.getpid()
+
+def run_with_progress(cmd, timeout, on_progress):
+    """Run a pipeline step, forwarding its PROGRESS lines as they are printed"""
+    with tempfile.TemporaryFile(mode='w+') as stderr_file:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, text=True)
+        timer = threading.Timer(timeout, proc.kill)
+        timer.start()
+        stdout_lines = []
+        try:
+            for line in proc.stdout:
+                if line.startswith('PROGRESS '):
+                    try:
+                        event = json.loads(line[len('PROGRESS '):])
+                    except ValueError:
+                        logger.warning(f"Malformed progress line: {line.strip()}")
+                        continue
+                    # Progress is informational; the step's exit code decides success
+                    try:
+                        on_progress(event)
+                    except Exception as e:
+                        logger.warning(f"Progress event dropped: {e}")
+                else:
+                    stdout_lines.append(line)
+            proc.wait()
+        finally:
+            timed_out = not timer.is_alive()
+            timer.cancel()
+        
+        if timed_out and proc.returncode != 0:
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        
+        stderr_file.seek(0)
+        return subprocess.CompletedProcess(cmd, proc.returncode, ''.join(stdout_lines), stderr_file.read())
+
 # =============================================================================
 # ROUTES - Main Pages
 # =============================================================================
 
 @app.route('/')
+@cached_response(response_cache)
 def index():
     """Main dashboard"""
     try:
-        total_trips = db.execute_query("SELECT COUNT(DISTINCT trip_id) as count FROM schedule")[0]['count']
+        total_trips = sum(row['count'] for row in schedule_store.rows(
+            "SELECT COUNT(DISTINCT trip_id) as count FROM schedule WHERE valid_to IS NULL"))
     except:
+        skip_response_cache()
         total_trips = 0
     return render_template('dashboard.html', total_trips=total_trips)
 
@@ -106,9 +329,130 @@ def shifts_page():
 # API ROUTES - PDF Upload
 # =============================================================================
 
+# Progress stages that end an upload; clients on any worker wait for these
+TERMINAL_PROGRESS_STAGES = ('complete', 'failed')
+
+def publish_progress(upload_id, stage, event):
+    """Publish one upload.progress event for /api/events subscribers"""
+    events.publish('upload.progress', {'upload_id': upload_id, 'stage': stage, **event},
+                   durable=stage in TERMINAL_PROGRESS_STAGES)
+
+def run_extractor(filepath, csv_filepath, on_progress, profile=False):
+    """Extract a PDF to CSV; returns an error message, or None on success
+
+    Uses the warm extraction server, falling back to a one-off extractor
+    process when the server cannot be started.
+    """
+    if extraction_client:
+        try:
+            extraction_client.ensure_running()
+        except ExtractionServerError as e:
+            logger.warning(f"{e}; running the extractor as a subprocess")
+        else:
+            try:
+                reply = extraction_client.extract(filepath, csv_filepath, on_progress, profile=profile)
+            except ExtractionServerError as e:
+                return str(e)
+            logger.info(f"Extraction server result: {reply}")
+            return None if reply.get('ok') else reply.get('error', 'unknown error')
+    
+    cmd = [sys.executable, os.path.join(BASE_DIR, 'trucking_schedule_extractor.py'),
+           filepath, '-o', csv_filepath, '--progress']
+    if profile:
+        cmd.append('--profile')
+    logger.info(f"Running: {' '.join(cmd)}")
+    result = run_with_progress(cmd, config.extraction.extract_timeout_seconds, on_progress)
+    
+    logger.info(f"Extractor output: {result.stdout}")
+    if result.stderr:
+        logger.error(f"Extractor errors: {result.stderr}")
+    
+    if result.returncode != 0:
+        return result.stderr or f'extractor exited with code {result.returncode}'
+    return None
+
+def process_pdf(filepath, filename, timestamp, upload_id, profile=False):
+    """Extract a saved PDF and import it; returns (payload, status) for the client"""
+    csv_filepath = os.path.join(UPLOAD_FOLDER, f"{timestamp}_extracted.csv")
+    imported = {}
+    
+    def on_import_progress(event):
+        if event.get('phase') == 'imported':
+            imported.update(event)
+        publish_progress(upload_id, 'import', event)
+    
+    try:
+        # Run PDF extractor
+        error = run_extractor(filepath, csv_filepath, lambda event: publish_progress(upload_id, 'extract', event),
+                              profile=profile)
+        if error:
+            publish_progress(upload_id, 'failed', {'phase': 'extract', 'error': 'PDF extraction failed'})
+            return {'error': f'PDF extraction failed: {error}', 'upload_id': upload_id}, 500
+        
+        # Import CSV to database
+        cmd = [sys.executable, os.path.join(BASE_DIR, 'csv_to_sqlite.py'), csv_filepath, '--progress']
+        logger.info(f"Running: {' '.join(cmd)}")
+        result = run_with_progress(cmd, config.extraction.import_timeout_seconds, on_import_progress)
+        
+        logger.info(f"Converter output: {result.stdout}")
+        if result.stderr:
+            logger.error(f"Converter errors: {result.stderr}")
+        
+        if result.returncode != 0:
+            publish_progress(upload_id, 'failed', {'phase': 'import', 'error': 'Database import failed'})
+            return {'error': f'Database import failed: {result.stderr}', 'upload_id': upload_id}, 500
+        
+        # Count records
+        try:
+            record_count = sum(row['count'] for row in schedule_store.rows(
+                "SELECT COUNT(*) as count FROM schedule WHERE valid_to IS NULL"))
+        except:
+            record_count = 0
+        
+        # Cleanup
+        if os.path.exists(csv_filepath):
+            os.remove(csv_filepath)
+        
+        logger.info(f"Successfully processed {filename}, {record_count} records")
+        # The import has committed, so failing to announce it does not fail the upload
+        try:
+            # Also bumps the response cache generation in every worker
+            events.publish('contract.imported', {
+                'upload_id': upload_id,
+                'filename': filename,
+                'contracts': imported.get('contracts', []),
+                'trip_ids': imported.get('trip_ids', []),
+                'versions': imported.get('versions', {}),
+                'retired_versions': imported.get('retired_versions', []),
+                'rows': imported.get('rows', 0),
+                'records': record_count
+            })
+        except Exception as e:
+            logger.error(f"Could not publish the import of {filename}: {e}")
+            publish_progress(upload_id, 'complete', {'records': record_count})
+        
+        return {
+            'message': 'PDF processed successfully',
+            'filename': filename,
+            'records': record_count,
+            'upload_id': upload_id
+        }, 200
+        
+    except subprocess.TimeoutExpired:
+        publish_progress(upload_id, 'failed', {'phase': 'timeout', 'error': 'Processing timed out'})
+        return {'error': 'Processing timed out', 'upload_id': upload_id}, 500
+    except Exception as e:
+        logger.error(f"Processing error: {e}")
+        publish_progress(upload_id, 'failed', {'phase': 'error', 'error': str(e)})
+        return {'error': f'Processing failed: {str(e)}', 'upload_id': upload_id}, 500
+
 @app.route('/api/upload', methods=['POST'])
 def upload_pdf():
-    """Upload and process PDF file"""
+    """Upload and process PDF file
+    
+    With ?async=1 the response is a 202 as soon as the file is saved; completion
+    is announced on /api/events as contract.imported or a failed upload.progress.
+    """
     try:
         logger.info(f"Upload request received. Files: {list(request.files.keys())}")
         
@@ -122,125 +466,260 @@ def upload_pdf():
             logger.error("Empty filename")
             return jsonify({'error': 'No file selected'}), 400
         
-        if not file.filename.lower().endswith('.pdf'):
+        if not file.filename.lower().endswith(tuple(ext.lower() for ext in config.upload.allowed_extensions)):
             logger.error(f"Invalid file type: {file.filename}")
             return jsonify({'error': 'File must be a PDF'}), 400
         
+        # Clients pass their own upload_id so they can follow progress on /api/events
+        upload_id = request.form.get('upload_id') or uuid.uuid4().hex
+        
         # Save uploaded file
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"{timestamp}_{file.filename}"
         filepath = os.path.join(UPLOAD_FOLDER, filename)
+        publish_progress(upload_id, 'upload', {'phase': 'saving'})
         file.save(filepath)
         
         logger.info(f"File saved: {filepath}")
         
-        # Process PDF to CSV
-        csv_filepath = os.path.join(UPLOAD_FOLDER, f"{timestamp}_extracted.csv")
-        
-        try:
-            # Run PDF extractor
-            cmd = ['python', 'trucking_schedule_extractor.py', filepath, '-o', csv_filepath]
-            logger.info(f"Running: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            
-            logger.info(f"Extractor output: {result.stdout}")
-            if result.stderr:
-                logger.error(f"Extractor errors: {result.stderr}")
-            
-            if result.returncode != 0:
-                return jsonify({'error': f'PDF extraction failed: {result.stderr}'}), 500
-            
-            # Import CSV to database
-            cmd = ['python', 'csv_to_sqlite.py', csv_filepath]
-            logger.info(f"Running: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-            
-            logger.info(f"Converter output: {result.stdout}")
-            if result.stderr:
-                logger.error(f"Converter errors: {result.stderr}")
-            
-            if result.returncode != 0:
-                return jsonify({'error': f'Database import failed: {result.stderr}'}), 500
-            
-            # Count records
-            try:
-                record_count = db.execute_query("SELECT COUNT(*) as count FROM schedule")[0]['count']
-            except:
-                record_count = 0
-            
-            # Cleanup
-            if os.path.exists(csv_filepath):
-                os.remove(csv_filepath)
-            
-            logger.info(f"Successfully processed {filename}, {record_count} records")
+        return start_processing(filepath, filename, timestamp, upload_id)
             
+    except Exception as e:
+        logger.error(f"Upload error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def prune_uploads():
+    """Remove uploaded PDFs (and stray extraction CSVs) older than upload.retention_days"""
+    cutoff = time.time() - config.upload.retention_days * 86400
+    for entry in os.scandir(UPLOAD_FOLDER):
+        try:
+            # Resumable sessions live in a subdirectory with their own TTL; dotfiles are not uploads
+            if entry.is_file() and not entry.name.startswith('.') and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                logger.info(f"Removed upload older than {config.upload.retention_days} days: {entry.name}")
+        except OSError as e:
+            logger.warning(f"Could not remove old upload {entry.name}: {e}")
+
+def process_session_pdf(session_id, *args):
+    """process_pdf for a resumable upload, recording the outcome on its session"""
+    payload, status = process_pdf(*args)
+    try:
+        upload_sessions.record_result(session_id, payload, status)
+    except Exception as e:
+        logger.error(f"Could not record the result of upload session {session_id}: {e}")
+    return payload, status
+
+def start_processing(filepath, filename, timestamp, upload_id, session_id=None, **extra):
+    """Queue a saved PDF for extraction; waits for the result unless ?async=1
+
+    For a resumable upload the outcome is also kept on its session, where
+    GET /api/uploads/<session_id> reports it.
+    """
+    prune_uploads()
+    # A profiled upload request profiles its extraction as well
+    profile = config.profiling.enabled and (
+        request.environ.get(PROFILE_REQUESTED, False)
+        or random.random() < config.profiling.extraction_sample_rate
+    )
+    args = (filepath, filename, timestamp, upload_id, profile)
+    if session_id:
+        future = extraction_executor.submit(process_session_pdf, session_id, *args)
+    else:
+        future = extraction_executor.submit(process_pdf, *args)
+    if request.args.get('async') == '1':
+        return jsonify({
+            'message': 'PDF accepted for processing',
+            'filename': filename,
+            'upload_id': upload_id,
+            **extra
+        }), 202
+    
+    payload, status = future.result()
+    payload.update(extra)
+    return jsonify(payload), status
+
+# Resumable protocol: POST /api/uploads opens a session, PUT /api/uploads/<id>?offset=N
+# sends raw bytes, GET reports the offset to resume from, POST .../complete processes the file
+
+def upload_session_error(e):
+    body = {'error': str(e)}
+    if e.offset is not None:
+        body['offset'] = e.offset
+    return jsonify(body), e.status
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    """Open a resumable upload session"""
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = secure_filename(data.get('filename') or '')
+        if not filename:
+            return jsonify({'error': 'No file selected'}), 400
+        if not filename.lower().endswith(tuple(ext.lower() for ext in config.upload.allowed_extensions)):
+            return jsonify({'error': 'File must be a PDF'}), 400
+        try:
+            size = int(data.get('size'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'File size is required'}), 400
+        
+        session = upload_sessions.create(filename, size, upload_id=data.get('upload_id'),
+                                         sha256=data.get('sha256'))
+        return jsonify({
+            'session_id': session['session_id'],
+            'upload_id': session['upload_id'],
+            'offset': 0,
+            'size': size,
+            'chunk_size': config.upload.chunk_size_mb * 1024 * 1024
+        }), 201
+    except UploadSessionError as e:
+        return upload_session_error(e)
+    except Exception as e:
+        logger.error(f"Create upload session error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<session_id>', methods=['GET'])
+def get_upload_session(session_id):
+    """Report how many bytes of a session have been received, and its processing result once known"""
+    try:
+        session = upload_sessions.status(session_id)
+        return jsonify({key: session[key] for key in ('session_id', 'upload_id', 'filename', 'size', 'offset', 'result')
+                        if key in session})
+    except UploadSessionError as e:
+        return upload_session_error(e)
+    except Exception as e:
+        logger.error(f"Get upload session error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<session_id>', methods=['PUT'])
+def put_upload_chunk(session_id):
+    """Write one chunk at ?offset=N (or an Upload-Offset header), streaming it to disk"""
+    try:
+        offset = request.args.get('offset', request.headers.get('Upload-Offset'), type=int)
+        if offset is None:
+            return jsonify({'error': 'Chunk offset is required'}), 400
+        new_offset = upload_sessions.write_chunk(session_id, offset, request.stream)
+        return jsonify({'session_id': session_id, 'offset': new_offset})
+    except UploadSessionError as e:
+        return upload_session_error(e)
+    except Exception as e:
+        logger.error(f"Upload chunk error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<session_id>/complete', methods=['POST'])
+def complete_upload_session(session_id):
+    """Finish a session and process the PDF like POST /api/upload"""
+    try:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        meta = upload_sessions.status(session_id)
+        filename = f"{timestamp}_{meta['filename']}"
+        filepath = os.path.join(UPLOAD_FOLDER, filename)
+        
+        session = upload_sessions.complete(session_id, filepath)
+        if session.get('repeated'):
+            # A retried complete: the file is already being (or has been) processed
             return jsonify({
-                'message': 'PDF processed successfully',
-                'filename': filename,
-                'records': record_count
+                'message': 'Upload already completed',
+                'filename': os.path.basename(session['path']),
+                'upload_id': session['upload_id'],
+                'sha256': session['sha256'],
+                'size': session['size']
             })
-            
-        except subprocess.TimeoutExpired:
-            return jsonify({'error': 'Processing timed out'}), 500
-        except Exception as e:
-            logger.error(f"Processing error: {e}")
-            return jsonify({'error': f'Processing failed: {str(e)}'}), 500
-            
+        logger.info(f"File saved: {filepath}")
+        return start_processing(filepath, filename, timestamp, session['upload_id'], session_id=session_id,
+                                sha256=session['sha256'], size=session['size'])
+    except UploadSessionError as e:
+        return upload_session_error(e)
     except Exception as e:
-        logger.error(f"Upload error: {e}")
+        logger.error(f"Complete upload session error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<session_id>', methods=['DELETE'])
+def abort_upload_session(session_id):
+    """Discard a session and the bytes received so far"""
+    try:
+        upload_sessions.abort(session_id)
+        return jsonify({'message': 'Upload session discarded'})
+    except UploadSessionError as e:
+        return upload_session_error(e)
+    except Exception as e:
+        logger.error(f"Abort upload session error: {e}")
         return jsonify({'error': str(e)}), 500
 
+# =============================================================================
+# API ROUTES - Change Notifications
+# =============================================================================
+
+@app.route('/api/events')
+def event_stream():
+    """Server-Sent Events feed of upload progress and data changes"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    response = Response(events.stream(last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 # =============================================================================
 # API ROUTES - Trip Management
 # =============================================================================
 
+def trip_summary_sql(where, group_by='contract_hcr_number, trip_id'):
+    """One summary row per trip, for the schedule rows matching `where`, ordered like `group_by`
+
+    Pick the `group_by` order that matches the index serving `where`, so no sort is needed.
+    """
+    return f"""
+        SELECT 
+            trip_id,
+            MIN(arrive_time) as start_time,
+            MAX(depart_time) as end_time,
+            MIN(facility) as start_location,
+            MAX(facility) as end_location,
+            COUNT(*) as stop_count,
+            MAX(vehicle_type) as vehicle_type,
+            MAX(vehicle_id) as vehicle_id,
+            contract_hcr_number
+        FROM schedule 
+        WHERE {where}
+        GROUP BY {group_by}
+        ORDER BY {group_by}
+    """
+
+def stream_trip_summaries(contracts=None):
+    """Stream one summary row per trip of the current versions, optionally limited to some contracts"""
+    where = 'valid_to IS NULL'
+    params = []
+    if contracts:
+        where += f" AND contract_hcr_number IN ({','.join(['?' for _ in contracts])})"
+        params = list(contracts)
+    
+    # Shards are read in contract order, so the merged stream keeps the same ordering
+    return schedule_store.stream(trip_summary_sql(where), params, contracts=contracts)
+
 @app.route('/api/trips')
+@cached_response(response_cache)
 def get_trips():
     """Get all trips with essential info for shift building"""
     try:
-        trips = db.execute_query("""
-            SELECT 
-                trip_id,
-                MIN(arrive_time) as start_time,
-                MAX(depart_time) as end_time,
-                MIN(facility) as start_location,
-                MAX(facility) as end_location,
-                COUNT(*) as stop_count,
-                MAX(vehicle_type) as vehicle_type,
-                MAX(vehicle_id) as vehicle_id,
-                MAX(contract_hcr_number) as contract_hcr_number
-            FROM schedule 
-            GROUP BY trip_id, contract_hcr_number
-            ORDER BY contract_hcr_number, trip_id
-        """)
+        trips = stream_trip_summaries(request.args.getlist('contract'))
         
-        return jsonify({'trips': trips})
+        return stream_collection('trips', trips)
         
     except Exception as e:
         logger.error(f"Get trips error: {e}")
+        skip_response_cache()
         return jsonify({'trips': []})
 
 @app.route('/api/trips-with-status')
+@cached_response(response_cache)
 def get_trips_with_status():
     """Get all trips with their shift assignment status"""
     try:
-        # First get all trips
-        trips = db.execute_query("""
-            SELECT 
-                trip_id,
-                MIN(arrive_time) as start_time,
-                MAX(depart_time) as end_time,
-                MIN(facility) as start_location,
-                MAX(facility) as end_location,
-                COUNT(*) as stop_count,
-                MAX(vehicle_type) as vehicle_type,
-                MAX(vehicle_id) as vehicle_id,
-                MAX(contract_hcr_number) as contract_hcr_number
-            FROM schedule 
-            GROUP BY trip_id, contract_hcr_number
-            ORDER BY contract_hcr_number, trip_id
-        """)
-        
         # Get all trips that are assigned to shifts
         db.ensure_shifts_table()
         assigned_shifts = db.execute_query("""
@@ -258,31 +737,37 @@ def get_trips_with_status():
                     'shift_name': shift['shift_name']
                 }
         
-        # Add shift status to each trip
-        for trip in trips:
-            trip_id = trip['trip_id']
-            if trip_id in trip_to_shift:
-                trip['shift_status'] = 'in-use'
-                trip['shift_info'] = trip_to_shift[trip_id]
-            else:
-                trip['shift_status'] = 'available'
-                trip['shift_info'] = None
+        # Stream trips from the cursor, adding shift status to each one on the way out
+        trips = stream_trip_summaries(request.args.getlist('contract'))
         
-        return jsonify({'trips': trips})
+        def with_status(rows):
+            for trip in rows:
+                trip_id = trip['trip_id']
+                if trip_id in trip_to_shift:
+                    trip['shift_status'] = 'in-use'
+                    trip['shift_info'] = trip_to_shift[trip_id]
+                else:
+                    trip['shift_status'] = 'available'
+                    trip['shift_info'] = None
+                yield trip
+        
+        return stream_collection('trips', with_status(trips))
         
     except Exception as e:
         logger.error(f"Get trips with status error: {e}")
+        skip_response_cache()
         return jsonify({'trips': []})
 
 @app.route('/api/trips/<int:trip_id>')
+@cached_response(response_cache)
 def get_trip_details(trip_id):
     """Get detailed trip information"""
     try:
-        stops = db.execute_query("""
+        stops = schedule_store.rows("""
             SELECT * FROM schedule 
-            WHERE trip_id = ? 
-            ORDER BY stop_number
-        """, (trip_id,))
+            WHERE trip_id = ? AND valid_to IS NULL
+            ORDER BY contract_hcr_number, stop_number
+        """, (trip_id,), key=lambda stop: (stop['contract_hcr_number'] or '', stop['stop_number']))
         
         if not stops:
             return jsonify({'error': 'Trip not found'}), 404
@@ -293,7 +778,55 @@ def get_trip_details(trip_id):
         logger.error(f"Get trip details error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/search')
+@cached_response(response_cache)
+def search_trips():
+    """Full-text search over facilities, NASS codes, vehicle ids and raw schedule text"""
+    try:
+        match = build_match_query(request.args.get('q', ''))
+        if not match:
+            return jsonify({'error': 'Query parameter q is required'}), 400
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+        
+        def search(database):
+            with database.connection() as conn:
+                # No index means nothing has been imported here yet
+                if not has_search_index(conn):
+                    return []
+                # Rank stops inside the index, then fold the best ones into trips
+                return [dict(row) for row in conn.execute(SEARCH_TRIPS_SQL, (match, limit * 20, limit))]
+        
+        # Each shard returns its own best trips; keep the best-scoring overall
+        hits = heapq.nsmallest(limit, (hit for part in schedule_store.each(search) for hit in part),
+                               key=lambda hit: hit['score'])
+        
+        if not hits:
+            return jsonify({'query': match, 'trips': []})
+        
+        summaries = {
+            (trip['trip_id'], trip['contract_hcr_number']): trip
+            for trip in schedule_store.rows(trip_summary_sql(
+                f"trip_id IN ({','.join(['?' for _ in hits])}) AND valid_to IS NULL",
+                group_by='trip_id, contract_hcr_number'
+            ), [hit['trip_id'] for hit in hits])
+        }
+        
+        trips = []
+        for hit in hits:
+            trip = summaries.get((hit['trip_id'], hit['contract_hcr_number']))
+            if trip is None:
+                continue
+            trips.append(dict(trip, score=round(-hit['score'], 4), matched_stops=hit['matched_stops'],
+                              matched_facilities=json.loads(hit['matched_facilities'])))
+        
+        return jsonify({'query': match, 'trips': trips})
+        
+    except Exception as e:
+        logger.error(f"Search error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/shifts', methods=['GET'])
+@cached_response(response_cache)
 def get_shifts():
     """Get all created shifts with trip details"""
     try:
@@ -313,10 +846,10 @@ def get_shifts():
             # Get contract IDs for each trip
             if trip_ids:
                 placeholders = ','.join(['?' for _ in trip_ids])
-                trip_details = db.execute_query(f"""
+                trip_details = schedule_store.rows(f"""
                     SELECT DISTINCT trip_id, contract_hcr_number
                     FROM schedule 
-                    WHERE trip_id IN ({placeholders})
+                    WHERE trip_id IN ({placeholders}) AND valid_to IS NULL
                     ORDER BY trip_id
                 """, trip_ids)
                 
@@ -335,6 +868,7 @@ def get_shifts():
         
     except Exception as e:
         logger.error(f"Get shifts error: {e}")
+        skip_response_cache()
         return jsonify({'shifts': []})
 
 @app.route('/api/shifts', methods=['POST'])
@@ -349,13 +883,22 @@ def create_shift():
         
         if not trip_ids:
             return jsonify({'error': 'No trips selected'}), 400
+        try:
+            trip_ids = parse_trip_ids(trip_ids)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'trip_ids must be a list of trip ids'}), 400
+        
+        # Refuse sequences a driver cannot physically cover
+        feasibility = check_shift_feasibility(trip_ids)
+        if feasibility and not feasibility['feasible']:
+            return jsonify({'error': describe_infeasible(feasibility), 'feasibility': feasibility}), 409
         
         # Get trip details
         placeholders = ','.join(['?' for _ in trip_ids])
-        trips = db.execute_query(f"""
+        trips = schedule_store.rows(f"""
             SELECT trip_id, MIN(arrive_time) as start_time, MAX(depart_time) as end_time
             FROM schedule 
-            WHERE trip_id IN ({placeholders})
+            WHERE trip_id IN ({placeholders}) AND valid_to IS NULL
             GROUP BY trip_id
         """, trip_ids)
         
@@ -374,17 +917,23 @@ def create_shift():
                 latest_end,
                 len(trip_ids)
             ))
+            shift = {
+                'id': shift_id,
+                'shift_name': shift_name,
+                'trip_ids': trip_ids,
+                'start_time': earliest_start,
+                'end_time': latest_end,
+                'trip_count': len(trip_ids)
+            }
+            events.publish('shift.created', {
+                'shift_id': shift_id,
+                'trip_ids': trip_ids,
+                'shift': shift
+            })
             
             return jsonify({
                 'message': 'Shift created successfully',
-                'shift': {
-                    'id': shift_id,
-                    'shift_name': shift_name,
-                    'trip_ids': trip_ids,
-                    'start_time': earliest_start,
-                    'end_time': latest_end,
-                    'trip_count': len(trip_ids)
-                }
+                'shift': shift
             })
         
         return jsonify({'error': 'No valid trips found'}), 400
@@ -397,12 +946,478 @@ def create_shift():
 def delete_shift(shift_id):
     """Delete a shift"""
     try:
+        shift = db.execute_query("SELECT trip_ids FROM shifts WHERE id = ?", (shift_id,), fetch_one=True)
         db.execute_query("DELETE FROM shifts WHERE id = ?", (shift_id,))
+        events.publish('shift.deleted', {
+            'shift_id': shift_id,
+            'trip_ids': [int(x) for x in shift['trip_ids'].split(',')] if shift else []
+        })
         return jsonify({'message': 'Shift deleted successfully'})
     except Exception as e:
         logger.error(f"Delete shift error: {e}")
         return jsonify({'error': str(e)}), 500
 
+BULK_OPERATIONS = ('create', 'update', 'delete')
+
+def load_trip_spans(trip_ids):
+    """{trip_id: (start_time, end_time)} for the given trips, in one query"""
+    if not trip_ids:
+        return {}
+    placeholders = ','.join(['?' for _ in trip_ids])
+    spans = {}
+    # A trip can appear in more than one contract (or shard); keep its widest span
+    for trip in schedule_store.rows(f"""
+        SELECT trip_id, MIN(arrive_time) as start_time, MAX(depart_time) as end_time
+        FROM schedule 
+        WHERE trip_id IN ({placeholders}) AND valid_to IS NULL
+        GROUP BY trip_id
+    """, list(trip_ids)):
+        start, end = spans.get(trip['trip_id'], (trip['start_time'], trip['end_time']))
+        spans[trip['trip_id']] = (min(start, trip['start_time']), max(end, trip['end_time']))
+    return spans
+
+def parse_trip_ids(value):
+    if not isinstance(value, list) or not value:
+        raise ValueError('trip_ids must be a non-empty list')
+    return [int(t) for t in value]
+
+def validate_bulk_operation(op, spans, existing, seen_shift_ids):
+    """Check one bulk operation against the snapshot; returns the shift row it will write"""
+    kind = op.get('op')
+    if kind not in BULK_OPERATIONS:
+        raise ValueError(f"op must be one of {', '.join(BULK_OPERATIONS)}")
+    
+    shift_id = None
+    if kind != 'create':
+        shift_id = op.get('shift_id')
+        if shift_id not in existing:
+            raise LookupError(f"Shift {shift_id} not found")
+        if shift_id in seen_shift_ids:
+            raise ValueError(f"Shift {shift_id} appears in more than one operation")
+        seen_shift_ids.add(shift_id)
+        if kind == 'delete':
+            return {'id': shift_id, 'trip_ids': existing[shift_id]['trip_ids']}
+    
+    current = existing.get(shift_id, {})
+    trip_ids = parse_trip_ids(op['trip_ids']) if 'trip_ids' in op or kind == 'create' else current['trip_ids']
+    shift_name = op.get('shift_name') or current.get('shift_name') or \
+        f"Shift_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    
+    missing = [t for t in trip_ids if t not in spans]
+    if missing:
+        raise LookupError(f"Trips not found: {', '.join(map(str, missing))}")
+    feasibility = check_shift_feasibility(trip_ids)
+    if feasibility and not feasibility['feasible']:
+        raise ValueError(describe_infeasible(feasibility))
+    
+    return {
+        'id': shift_id,
+        'shift_name': shift_name,
+        'trip_ids': trip_ids,
+        'start_time': min(spans[t][0] for t in trip_ids),
+        'end_time': max(spans[t][1] for t in trip_ids),
+        'trip_count': len(trip_ids)
+    }
+
+@app.route('/api/shifts/bulk', methods=['POST'])
+def bulk_shifts():
+    """Create, update and delete many shifts in one all-or-nothing transaction"""
+    try:
+        db.ensure_shifts_table()
+        
+        operations = (request.get_json(silent=True) or {}).get('operations')
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': 'operations must be a non-empty list'}), 400
+        if not all(isinstance(op, dict) for op in operations):
+            return jsonify({'error': 'Each operation must be an object'}), 400
+        
+        # One snapshot of trip spans serves every operation in the request
+        requested = set()
+        for op in operations:
+            try:
+                requested.update(parse_trip_ids(op['trip_ids']))
+            except (KeyError, TypeError, ValueError):
+                pass  # reported against the operation below
+        spans = load_trip_spans(sorted(requested))
+        matrix = deadhead_matrices.get()
+        if matrix is not None:
+            # Build the endpoint cache now rather than while holding the write lock
+            get_trip_endpoints(matrix)
+        
+        with db.connection() as conn:
+            # Take the write lock first, so the shifts we validate against cannot change under us
+            conn.execute("BEGIN IMMEDIATE")
+            shift_ids = sorted({op['shift_id'] for op in operations if isinstance(op.get('shift_id'), int)})
+            existing = {}
+            if shift_ids:
+                for row in conn.execute(f"""
+                    SELECT id, shift_name, trip_ids FROM shifts
+                    WHERE id IN ({','.join(['?' for _ in shift_ids])})
+                """, shift_ids):
+                    existing[row['id']] = {'shift_name': row['shift_name'],
+                                           'trip_ids': [int(x) for x in row['trip_ids'].split(',')]}
+            # Updates that only rename keep their trips, whose spans were not requested yet
+            spans.update(load_trip_spans(sorted(
+                {t for shift in existing.values() for t in shift['trip_ids']} - spans.keys())))
+            
+            results = []
+            planned = []
+            seen_shift_ids = set()
+            for index, op in enumerate(operations):
+                try:
+                    planned.append((op['op'], validate_bulk_operation(op, spans, existing, seen_shift_ids)))
+                    results.append({'index': index, 'op': op['op'], 'status': 'ok'})
+                except (ValueError, TypeError, KeyError, LookupError) as e:
+                    message = f"Missing field {e}" if isinstance(e, KeyError) else str(e)
+                    results.append({'index': index, 'op': op.get('op'), 'status': 'error', 'error': message})
+            
+            failed = sum(1 for result in results if result['status'] == 'error')
+            if failed:
+                conn.rollback()
+                return jsonify({
+                    'error': f"No changes saved: {failed} of {len(operations)} operations are invalid",
+                    'results': results
+                }), 409
+            
+            changes = {'created': [], 'updated': [], 'deleted': []}
+            for result, (kind, shift) in zip(results, planned):
+                if kind == 'delete':
+                    conn.execute("DELETE FROM shifts WHERE id = ?", (shift['id'],))
+                    changes['deleted'].append({'shift_id': shift['id'], 'trip_ids': shift['trip_ids']})
+                    result['shift_id'] = shift['id']
+                    continue
+                values = (shift['shift_name'], ','.join(map(str, shift['trip_ids'])),
+                          shift['start_time'], shift['end_time'], shift['trip_count'])
+                if kind == 'create':
+                    shift['id'] = conn.execute("""
+                        INSERT INTO shifts (shift_name, trip_ids, start_time, end_time, trip_count)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, values).lastrowid
+                    changes['created'].append(shift)
+                else:
+                    conn.execute("""
+                        UPDATE shifts SET shift_name = ?, trip_ids = ?, start_time = ?, end_time = ?, trip_count = ?
+                        WHERE id = ?
+                    """, values + (shift['id'],))
+                    changes['updated'].append(dict(shift, previous_trip_ids=existing[shift['id']]['trip_ids']))
+                result['shift'] = shift
+            
+            # The change event is written and committed with the shifts: one commit for the whole roster
+            events.publish('shifts.bulk', changes, conn=conn)
+        
+        return jsonify({
+            'message': f"{len(operations)} shift operations saved",
+            'created': len(changes['created']),
+            'updated': len(changes['updated']),
+            'deleted': len(changes['deleted']),
+            'results': results
+        })
+        
+    except Exception as e:
+        logger.error(f"Bulk shifts error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# =============================================================================
+# API ROUTES - Shift Feasibility
+# =============================================================================
+
+_endpoints_lock = threading.Lock()
+_endpoints_cache = {}
+
+def get_trip_endpoints(matrix):
+    """Start/end facility and time of every trip, rebuilt only when a schedule is imported"""
+    key = (schedule_generation, id(matrix))
+    with _endpoints_lock:
+        if key in _endpoints_cache:
+            return _endpoints_cache[key]
+    
+    # Scalar lookups rather than joins, so trips come out in index order with no sort
+    rows = schedule_store.rows("""
+        SELECT 
+            e.trip_id,
+            (SELECT MAX(nass_code) FROM schedule
+             WHERE trip_id = e.trip_id AND stop_number = e.first_stop AND valid_to IS NULL) as start_nass,
+            (SELECT MAX(COALESCE(NULLIF(arrive_time, ''), depart_time)) FROM schedule
+             WHERE trip_id = e.trip_id AND stop_number = e.first_stop AND valid_to IS NULL) as start_time,
+            (SELECT MAX(nass_code) FROM schedule
+             WHERE trip_id = e.trip_id AND stop_number = e.last_stop AND valid_to IS NULL) as end_nass,
+            (SELECT MAX(COALESCE(NULLIF(depart_time, ''), arrive_time)) FROM schedule
+             WHERE trip_id = e.trip_id AND stop_number = e.last_stop AND valid_to IS NULL) as end_time
+        FROM (
+            SELECT trip_id, MIN(stop_number) AS first_stop, MAX(stop_number) AS last_stop
+            FROM schedule
+            WHERE valid_to IS NULL
+            GROUP BY trip_id
+        ) e
+    """)
+    endpoints = TripEndpoints(rows, matrix)
+    with _endpoints_lock:
+        # Only the current generation is worth keeping
+        _endpoints_cache.clear()
+        _endpoints_cache[key] = endpoints
+    return endpoints
+
+def check_shift_feasibility(trip_ids):
+    """Deadhead check for trip ids from parse_trip_ids, or None when no matrix is configured"""
+    matrix = deadhead_matrices.get()
+    if matrix is None:
+        return None
+    return check_sequence(
+        get_trip_endpoints(matrix), trip_ids, matrix,
+        min_turnaround=config.deadhead.min_turnaround_minutes,
+        unknown_policy=config.deadhead.unknown_policy
+    )
+
+def describe_infeasible(feasibility):
+    problems = []
+    for leg in feasibility['legs']:
+        if leg['feasible']:
+            continue
+        if leg['deadhead_minutes'] is None:
+            problems.append(f"no deadhead time known from {leg['from_nass']} to {leg['to_nass']} "
+                            f"(trip {leg['from_trip']} to {leg['to_trip']})")
+        else:
+            problems.append(f"trip {leg['from_trip']} to {leg['to_trip']} leaves {leg['gap_minutes']:g} min "
+                            f"but needs {leg['deadhead_minutes']:g} min deadhead "
+                            f"from {leg['from_nass']} to {leg['to_nass']}")
+    return 'Shift is not feasible: ' + '; '.join(problems)
+
+@app.route('/api/shifts/check', methods=['POST'])
+def check_shift():
+    """Check whether a driver can cover the given trips in order"""
+    try:
+        trip_ids = (request.get_json(silent=True) or {}).get('trip_ids', [])
+        if not trip_ids:
+            return jsonify({'error': 'No trips selected'}), 400
+        try:
+            trip_ids = parse_trip_ids(trip_ids)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'trip_ids must be a list of trip ids'}), 400
+        
+        feasibility = check_shift_feasibility(trip_ids)
+        if feasibility is None:
+            return jsonify({'error': 'No deadhead matrix configured'}), 404
+        return jsonify(feasibility)
+    except Exception as e:
+        logger.error(f"Check shift error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/trips/<int:trip_id>/connections')
+@cached_response(response_cache)
+def get_trip_connections(trip_id):
+    """Trips a driver could take next after this one, tightest connection first"""
+    try:
+        matrix = deadhead_matrices.get()
+        if matrix is None:
+            skip_response_cache()
+            return jsonify({'error': 'No deadhead matrix configured'}), 404
+        
+        endpoints = get_trip_endpoints(matrix)
+        if trip_id not in endpoints.position:
+            return jsonify({'error': 'Trip not found'}), 404
+        
+        limit = request.args.get('limit', 50, type=int)
+        connections = feasible_successors(
+            endpoints, trip_id, matrix,
+            min_turnaround=config.deadhead.min_turnaround_minutes,
+            unknown_policy=config.deadhead.unknown_policy
+        )
+        return jsonify({'trip_id': trip_id, 'connections': connections[:limit], 'total': len(connections)})
+    except Exception as e:
+        logger.error(f"Get trip connections error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/deadhead')
+def get_deadhead():
+    """Drive minutes between two facilities (?from=<nass>&to=<nass>)"""
+    try:
+        matrix = deadhead_matrices.get()
+        if matrix is None:
+            return jsonify({'error': 'No deadhead matrix configured'}), 404
+        origin = request.args.get('from', '')
+        dest = request.args.get('to', '')
+        return jsonify({'from': origin, 'to': dest, 'minutes': matrix.lookup(origin, dest)})
+    except Exception as e:
+        logger.error(f"Get deadhead error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# =============================================================================
+# API ROUTES - Schedule Versions
+# =============================================================================
+
+def contract_versions(contract):
+    """Versions of one contract, newest first (only its shard is opened)"""
+    versions = [version for part in schedule_store.each(lambda database: list_versions(database, contract),
+                                                        contracts=[contract])
+                for version in part]
+    for version in versions:
+        version['current'] = bool(version['current'])
+    return versions
+
+@app.route('/api/contracts/<contract>/versions')
+@cached_response(response_cache)
+def get_contract_versions(contract):
+    """Every imported version of a contract; `current` marks the one reads use"""
+    try:
+        versions = contract_versions(contract)
+        if not versions:
+            return jsonify({'error': 'Contract not found'}), 404
+        return jsonify({'contract': contract, 'versions': versions})
+    except Exception as e:
+        logger.error(f"Get contract versions error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/contracts/<contract>/versions/<int:version_id>/trips')
+@cached_response(response_cache)
+def get_version_trips(contract, version_id):
+    """Trip summaries of one version of a contract, current or superseded"""
+    try:
+        if not any(version['id'] == version_id for version in contract_versions(contract)):
+            return jsonify({'error': 'Version not found'}), 404
+        
+        # A version belongs to one contract, so grouping by trip follows the version index
+        trips = schedule_store.stream(trip_summary_sql('version_id = ?', group_by='trip_id'),
+                                      (version_id,), contracts=[contract])
+        
+        return stream_collection('trips', trips)
+    except Exception as e:
+        logger.error(f"Get version trips error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/contracts/<contract>/versions/diff')
+@cached_response(response_cache)
+def diff_contract_versions(contract):
+    """Trips added, removed and retimed between two versions (?from=<id>&to=<id>)
+
+    Defaults to the current version against the one it replaced.
+    """
+    try:
+        versions = contract_versions(contract)
+        by_id = {version['id']: version for version in versions}
+        current = next((version['id'] for version in versions if version['current']), None)
+        
+        new_id = request.args.get('to', current, type=int)
+        older = [version['id'] for version in versions if new_id is not None and version['id'] < new_id]
+        old_id = request.args.get('from', older[0] if older else None, type=int)
+        if old_id is None or new_id is None:
+            return jsonify({'error': 'Contract needs two versions to compare'}), 400
+        if old_id not in by_id or new_id not in by_id:
+            return jsonify({'error': 'Version not found'}), 404
+        
+        # Set operations over the version index; neither version is loaded into Python
+        diff = schedule_store.each(lambda database: diff_versions(database, old_id, new_id),
+                                   contracts=[contract])[0]
+        
+        return jsonify({
+            'contract': contract,
+            'from': by_id[old_id],
+            'to': by_id[new_id],
+            'counts': {change: len(trip_ids) for change, trip_ids in diff.items()},
+            **diff
+        })
+    except Exception as e:
+        logger.error(f"Diff contract versions error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# =============================================================================
+# API ROUTES - Reports
+# =============================================================================
+
+_analytics_lock = threading.Lock()
+_analytics_cache = {}
+_schedule_trips_cache = {}
+
+def get_schedule_analytics():
+    """Columnar analytics snapshot; a shift change reuses the trip spans, a schedule import reloads them"""
+    key = response_cache.generation
+    schedule_key = schedule_generation
+    # Held while building, so concurrent report requests share one load
+    with _analytics_lock:
+        if key not in _analytics_cache:
+            if schedule_key not in _schedule_trips_cache:
+                schedule = ScheduleTrips.from_store(schedule_store)
+                _schedule_trips_cache.clear()
+                _schedule_trips_cache[schedule_key] = schedule
+            db.ensure_shifts_table()
+            analytics = ScheduleAnalytics.from_store(_schedule_trips_cache[schedule_key], db)
+            # Only the current generation is worth keeping
+            _analytics_cache.clear()
+            _analytics_cache[key] = analytics
+        return _analytics_cache[key]
+
+@app.route('/api/reports')
+@cached_response(response_cache)
+def get_reports():
+    """Driver hours, idle gaps, shift utilization and hourly facility load (?contract=<hcr>)"""
+    try:
+        analytics = get_schedule_analytics()
+        report = analytics.report(request.args.getlist('contract'))
+        report['build_seconds'] = round(analytics.build_seconds, 3)
+        report['schedule_build_seconds'] = round(analytics.schedule.build_seconds, 3)
+        return jsonify(report)
+    except Exception as e:
+        logger.error(f"Get reports error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# =============================================================================
+# Backups
+# =============================================================================
+
+@app.route('/api/backups', methods=['GET'])
+def list_backups():
+    """List database snapshots and backup metrics"""
+    try:
+        snapshots = backup_service.snapshots()
+        for snapshot in snapshots:
+            del snapshot['path']
+        return jsonify({
+            'enabled': config.database.backup_enabled,
+            'snapshots': snapshots,
+            'metrics': backup_service.metrics()
+        })
+    except Exception as e:
+        logger.error(f"List backups error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/backups', methods=['POST'])
+def create_backup():
+    """Take a database snapshot now"""
+    try:
+        metrics = backup_service.backup()
+        return jsonify({'message': 'Backup created successfully', 'backup': metrics}), 201
+    except Exception as e:
+        logger.error(f"Backup error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# =============================================================================
+# API ROUTES - Profiling
+# =============================================================================
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """List saved request and extraction profiles, newest first"""
+    try:
+        return jsonify({
+            'enabled': config.profiling.enabled,
+            'mode': config.profiling.mode,
+            'profiles': profile_store.list()
+        })
+    except Exception as e:
+        logger.error(f"List profiles error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/profiles/<filename>', methods=['GET'])
+def download_profile(filename):
+    """Download one .pstats or .collapsed profile file"""
+    try:
+        path = profile_store.path(filename)
+        if path is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return send_file(path, as_attachment=True, download_name=filename)
+    except Exception as e:
+        logger.error(f"Download profile error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # =============================================================================
 # Error Handlers
 # =============================================================================
@@ -416,4 +1431,5 @@ def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    # Development server; use serve.py for the multi-worker production server
+    app.run(debug=config.app.debug, host=config.app.host, port=config.app.port, threaded=True) 
\ No newline at end of file
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for production servers
+Example: uvicorn asgi:application --workers 4
+
+Flask views stay synchronous; a2wsgi runs each request, and so every blocking
+SQLite call, on a bounded thread pool so the event loop is never blocked.
+"""
+
+from a2wsgi import WSGIMiddleware
+
+from app import app, config
+
+application = WSGIMiddleware(app, workers=config.server.threads)
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Online backups of the schedule database
+Copies the live database with SQLite's backup API a few pages at a time, so
+uploads and requests are only ever blocked for one short step, then stores
+gzip-compressed, rotated snapshots. With sharding enabled a snapshot is a
+.tar.gz of the main database, the shard catalog and every shard.
+
+    python backup.py backup              # take a snapshot now
+    python backup.py list                # show snapshots
+    python backup.py restore <snapshot>  # restore one over the configured database
+"""
+
+import argparse
+import fcntl
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from config import get_config, configure_logging, resolve_path
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SUFFIX = '.db.gz'
+SHARDED_SNAPSHOT_SUFFIX = '.tar.gz'
+METRICS_FILE = 'last_backup.json'
+
+# Names of the database files inside a sharded snapshot
+MAIN_MEMBER = 'main.db'
+CATALOG_MEMBER = 'catalog.db'
+SHARD_PREFIX = 'shards/'
+
+
+class _TooManyRestarts(Exception):
+    """Raised from the progress callback to abandon a paged copy that keeps restarting"""
+
+
+class BackupService:
+    """Takes compressed snapshots of a live SQLite database on a fixed interval
+
+    With `catalog_path` and `shard_dir` (sharded mode) each snapshot also holds
+    the catalog and every shard it lists.
+    """
+
+    def __init__(self, db_path, backup_dir, interval_hours=24, retention=7,
+                 pages_per_step=256, step_sleep_ms=50, busy_timeout_ms=5000, max_restarts=3,
+                 catalog_path=None, shard_dir=None):
+        self.db_path = db_path
+        self.catalog_path = catalog_path
+        self.shard_dir = shard_dir
+        self.sharded = catalog_path is not None
+        self.suffix = SHARDED_SNAPSHOT_SUFFIX if self.sharded else SNAPSHOT_SUFFIX
+        self.backup_dir = backup_dir
+        self.interval_seconds = interval_hours * 3600
+        self.retention = retention
+        self.pages_per_step = pages_per_step
+        self.step_sleep_ms = step_sleep_ms
+        self.busy_timeout_ms = busy_timeout_ms
+        self.max_restarts = max_restarts
+        self.prefix = os.path.splitext(os.path.basename(db_path))[0] + '-'
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self._lock_file = None
+        self.last_backup = None
+        self.backups_taken = 0
+        self.backups_failed = 0
+
+    @classmethod
+    def from_config(cls, settings):
+        """Build a service from the `database` config section"""
+        return cls(
+            resolve_path(settings.path),
+            resolve_path(settings.backup_dir),
+            interval_hours=settings.backup_interval_hours,
+            retention=settings.backup_retention,
+            pages_per_step=settings.backup_pages_per_step,
+            step_sleep_ms=settings.backup_step_sleep_ms,
+            busy_timeout_ms=settings.busy_timeout_ms,
+            max_restarts=settings.backup_max_restarts,
+            catalog_path=resolve_path(settings.catalog_path) if settings.sharded else None,
+            shard_dir=resolve_path(settings.shard_dir) if settings.sharded else None
+        )
+
+    def snapshots(self):
+        """Existing snapshots, newest first"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        result = []
+        for name in os.listdir(self.backup_dir):
+            if name.startswith(self.prefix) and name.endswith((SNAPSHOT_SUFFIX, SHARDED_SNAPSHOT_SUFFIX)):
+                path = os.path.join(self.backup_dir, name)
+                stat = os.stat(path)
+                result.append({
+                    'file': name,
+                    'path': path,
+                    'sharded': name.endswith(SHARDED_SNAPSHOT_SUFFIX),
+                    'size_bytes': stat.st_size,
+                    'created_at': datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds')
+                })
+        # Names carry a sortable timestamp
+        result.sort(key=lambda s: s['file'], reverse=True)
+        return result
+
+    def backup(self):
+        """Take one snapshot now and return its metrics"""
+        with self._run_lock:
+            try:
+                metrics = self._backup()
+            except Exception:
+                self.backups_failed += 1
+                raise
+            self.backups_taken += 1
+            self.last_backup = metrics
+            self._save_metrics(metrics)
+            self._rotate()
+            return metrics
+
+    def _save_metrics(self, metrics):
+        # Other worker processes report the latest run from this file
+        path = os.path.join(self.backup_dir, METRICS_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(metrics, f)
+        os.replace(path + '.tmp', path)
+
+    def _load_metrics(self):
+        try:
+            with open(os.path.join(self.backup_dir, METRICS_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _sources(self):
+        """(name inside the snapshot, live path) of every database file a snapshot holds"""
+        if not self.sharded:
+            return [(MAIN_MEMBER, self.db_path)]
+        # Deferred: only sharded installs need the catalog
+        from sharding import ShardCatalog
+        catalog = ShardCatalog(self.catalog_path, self.shard_dir)
+        return [(MAIN_MEMBER, self.db_path), (CATALOG_MEMBER, self.catalog_path)] + [
+            (f"{SHARD_PREFIX}{os.path.basename(path)}", path)
+            for _, path, _ in catalog.entries() if os.path.exists(path)
+        ]
+
+    def _copy(self, source_path, raw_path, steps):
+        """Copy one live database to raw_path with the backup API; returns the copy mode"""
+        step_sleep = self.step_sleep_ms / 1000
+        step_started = [time.perf_counter()]
+        remaining_before = [None]
+        restarts = [0]
+
+        def record_step():
+            # Each step holds a read lock on the source; nothing is held while we sleep
+            held = time.perf_counter() - step_started[0]
+            steps['count'] += 1
+            steps['hold_total'] += held
+            steps['hold_max'] = max(steps['hold_max'], held)
+
+        def progress(status, remaining, total):
+            record_step()
+            # A write from another connection restarts the copy from page one
+            if remaining_before[0] is not None and remaining >= remaining_before[0]:
+                restarts[0] += 1
+                steps['restarts'] += 1
+                if restarts[0] >= self.max_restarts:
+                    raise _TooManyRestarts()
+            remaining_before[0] = remaining
+            if remaining and step_sleep:
+                time.sleep(step_sleep)
+            step_started[0] = time.perf_counter()
+
+        source = sqlite3.connect(source_path, timeout=self.busy_timeout_ms / 1000)
+        target = sqlite3.connect(raw_path)
+        copy_mode = 'paged'
+        try:
+            try:
+                source.backup(target, pages=self.pages_per_step, progress=progress)
+            except _TooManyRestarts:
+                # One step holds a single read transaction, so writes can no longer restart it
+                logger.warning(f"Backup of {source_path} restarted {restarts[0]} times under "
+                               f"concurrent writes; copying in one step")
+                copy_mode = 'single_step'
+                step_started[0] = time.perf_counter()
+                source.backup(target, pages=-1)
+                record_step()
+            steps['pages'] += target.execute("PRAGMA page_count").fetchone()[0]
+            check = target.execute("PRAGMA quick_check").fetchone()[0]
+            if check != 'ok':
+                raise RuntimeError(f"Snapshot of {source_path} failed integrity check: {check}")
+        finally:
+            target.close()
+            source.close()
+        return copy_mode
+
+    def _backup(self):
+        os.makedirs(self.backup_dir, exist_ok=True)
+        started_at = datetime.now()
+        started = time.perf_counter()
+        steps = {'count': 0, 'hold_total': 0.0, 'hold_max': 0.0, 'pages': 0, 'restarts': 0}
+        sources = self._sources()
+        name = f"{self.prefix}{started_at.strftime('%Y%m%d-%H%M%S')}{self.suffix}"
+        final_path = os.path.join(self.backup_dir, name)
+        partial_path = final_path + '.part'
+
+        work_dir = tempfile.mkdtemp(dir=self.backup_dir)
+        try:
+            copies = []
+            copy_modes = set()
+            for member, source_path in sources:
+                raw_path = os.path.join(work_dir, f"{len(copies)}.db")
+                copy_modes.add(self._copy(source_path, raw_path, steps))
+                copies.append((member, raw_path))
+            copied_at = time.perf_counter()
+
+            if self.sharded:
+                # Each file is a consistent copy of itself; the set is taken file by file
+                with tarfile.open(partial_path, 'w:gz', compresslevel=6) as archive:
+                    for member, raw_path in copies:
+                        archive.add(raw_path, arcname=member)
+            else:
+                with open(copies[0][1], 'rb') as src, gzip.open(partial_path, 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+            # Only complete snapshots ever carry the final name
+            os.replace(partial_path, final_path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        metrics = {
+            'file': name,
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'duration_seconds': round(time.perf_counter() - started, 3),
+            'copy_seconds': round(copied_at - started, 3),
+            'databases': len(sources),
+            'pages': steps['pages'],
+            'steps': steps['count'],
+            'restarts': steps['restarts'],
+            'copy_mode': 'single_step' if 'single_step' in copy_modes else 'paged',
+            'lock_hold_total_ms': round(steps['hold_total'] * 1000, 2),
+            'lock_hold_max_ms': round(steps['hold_max'] * 1000, 2),
+            'size_bytes': os.path.getsize(final_path)
+        }
+        logger.info(f"Backup {name}: {metrics['databases']} database(s), {metrics['pages']} pages in "
+                    f"{metrics['steps']} steps, {metrics['duration_seconds']}s total, "
+                    f"longest lock hold {metrics['lock_hold_max_ms']}ms")
+        return metrics
+
+    def _rotate(self):
+        for snapshot in self.snapshots()[self.retention:]:
+            try:
+                os.remove(snapshot['path'])
+                logger.info(f"Removed old backup {snapshot['file']}")
+            except OSError as e:
+                logger.warning(f"Could not remove old backup {snapshot['file']}: {e}")
+
+    def metrics(self):
+        return {
+            'interval_hours': self.interval_seconds / 3600,
+            'retention': self.retention,
+            'running': self._thread is not None,
+            'backups_taken': self.backups_taken,
+            'backups_failed': self.backups_failed,
+            'last_backup': self.last_backup or self._load_metrics()
+        }
+
+    def start(self):
+        """Start the backup schedule in this process, unless another process already runs it"""
+        if self._thread is not None:
+            return False
+        os.makedirs(self.backup_dir, exist_ok=True)
+        # Every gunicorn worker calls start(); the file lock picks exactly one of them
+        lock_file = open(os.path.join(self.backup_dir, '.scheduler.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self._thread = threading.Thread(target=self._loop, name='db-backup', daemon=True)
+        self._thread.start()
+        logger.info(f"Database backups every {self.interval_seconds / 3600:g}h into {self.backup_dir}")
+        return True
+
+    def _seconds_until_due(self):
+        snapshots = self.snapshots()
+        if not snapshots:
+            return 0
+        age = time.time() - os.path.getmtime(snapshots[0]['path'])
+        return max(0, self.interval_seconds - age)
+
+    def _loop(self):
+        while True:
+            # Scheduling from the newest snapshot keeps restarts from piling up backups
+            time.sleep(self._seconds_until_due())
+            try:
+                self.backup()
+            except Exception as e:
+                logger.error(f"Database backup failed: {e}")
+                time.sleep(min(self.interval_seconds, 600))
+
+
+def _restore_file(raw_path, db_path, busy_timeout_ms):
+    """Copy a checked snapshot file into `db_path` through the backup API"""
+    source = sqlite3.connect(raw_path)
+    target = sqlite3.connect(db_path, timeout=busy_timeout_ms / 1000)
+    try:
+        check = source.execute("PRAGMA quick_check").fetchone()[0]
+        if check != 'ok':
+            raise RuntimeError(f"Snapshot of {os.path.basename(db_path)} failed integrity check: {check}")
+        source.backup(target)
+        # Event ids and generations roll back with the data, so ETags must not match old ones
+        if target.execute("SELECT 1 FROM sqlite_master WHERE name = 'app_state'").fetchone():
+            target.execute("UPDATE app_state SET value = ? WHERE key = 'epoch'", (os.urandom(8).hex(),))
+            target.commit()
+    finally:
+        target.close()
+        source.close()
+
+
+def _sharded_members(archive):
+    """Members of a sharded snapshot, refusing any name that is not one of ours"""
+    members = {}
+    for member in archive.getmembers():
+        shard = member.name[len(SHARD_PREFIX):] if member.name.startswith(SHARD_PREFIX) else None
+        valid = member.name in (MAIN_MEMBER, CATALOG_MEMBER) or (
+            shard and os.path.basename(shard) == shard and shard.endswith('.db'))
+        if not member.isfile() or not valid:
+            raise RuntimeError(f"Unexpected entry in snapshot: {member.name}")
+        members[member.name] = member
+    if MAIN_MEMBER not in members or CATALOG_MEMBER not in members:
+        raise RuntimeError("Snapshot is missing the main or catalog database")
+    return members
+
+
+def restore(snapshot_path, db_path, busy_timeout_ms=5000, catalog_path=None, shard_dir=None):
+    """Replace the contents of `db_path` (and, for a sharded snapshot, the catalog and shards)
+
+    Each copy goes through the backup API into the existing file, so other
+    connections see either the old or the restored file, never a mix. A
+    sharded snapshot needs `catalog_path` and `shard_dir`; a single-file one
+    cannot be restored into a sharded install, whose schedule lives in shards.
+    """
+    sharded_snapshot = snapshot_path.endswith(SHARDED_SNAPSHOT_SUFFIX)
+    if sharded_snapshot != bool(catalog_path):
+        raise RuntimeError(
+            "Snapshot was taken with database.sharded "
+            f"{'enabled' if sharded_snapshot else 'disabled'}; set it the same way to restore it")
+
+    work_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(db_path)))
+    try:
+        if not sharded_snapshot:
+            raw_path = os.path.join(work_dir, MAIN_MEMBER)
+            with gzip.open(snapshot_path, 'rb') as src, open(raw_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            _restore_file(raw_path, db_path, busy_timeout_ms)
+        else:
+            os.makedirs(shard_dir, exist_ok=True)
+            with tarfile.open(snapshot_path, 'r:gz') as archive:
+                members = _sharded_members(archive)
+                targets = {MAIN_MEMBER: db_path, CATALOG_MEMBER: catalog_path}
+                # Shards first and the catalog last, so the catalog never lists a shard not yet restored
+                for name in sorted(members, key=lambda n: (n == CATALOG_MEMBER, n == MAIN_MEMBER, n)):
+                    raw_path = os.path.join(work_dir, 'restore.db')
+                    with archive.extractfile(members[name]) as src, open(raw_path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+                    target = targets.get(name) or os.path.join(shard_dir, name[len(SHARD_PREFIX):])
+                    _restore_file(raw_path, target, busy_timeout_ms)
+                    os.remove(raw_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    logger.info(f"Restored {db_path} from {snapshot_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Back up or restore the schedule database')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('backup', help='Take a snapshot now')
+    sub.add_parser('list', help='List snapshots, newest first')
+    restore_parser = sub.add_parser('restore', help='Restore a snapshot over the database')
+    restore_parser.add_argument('snapshot', help='Snapshot file name or path')
+    restore_parser.add_argument('--db', help='Database to overwrite (default: database.path)')
+    args = parser.parse_args()
+
+    config = get_config()
+    configure_logging(config.logging, fmt='%(asctime)s - %(levelname)s - %(message)s')
+    service = BackupService.from_config(config.database)
+
+    if args.command == 'backup':
+        metrics = service.backup()
+        print(f"✅ {metrics['file']} ({metrics['size_bytes']} bytes, {metrics['duration_seconds']}s, "
+              f"max lock hold {metrics['lock_hold_max_ms']}ms)")
+    elif args.command == 'list':
+        for snapshot in service.snapshots():
+            print(f"{snapshot['file']}  {snapshot['size_bytes']:>12}  {snapshot['created_at']}")
+    else:
+        snapshot = args.snapshot
+        if not os.path.exists(snapshot):
+            snapshot = os.path.join(service.backup_dir, snapshot)
+        if not os.path.exists(snapshot):
+            print(f"❌ Snapshot not found: {args.snapshot}")
+            sys.exit(1)
+        db_path = args.db or resolve_path(config.database.path)
+        try:
+            restore(snapshot, db_path, config.database.busy_timeout_ms,
+                    catalog_path=service.catalog_path, shard_dir=service.shard_dir)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"✅ Restored {db_path} from {snapshot}")
+        print("Restart the app so every worker drops its cached responses")
+
+
+if __name__ == '__main__':
+    main()
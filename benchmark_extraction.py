@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-document extraction latency
+Compares a fresh extractor process per PDF (a cold JVM every time) with the
+long-lived extraction server (one warm JVM for every document).
+
+Examples:
+    python benchmark_extraction.py pdfs/
+    python benchmark_extraction.py a.pdf b.pdf c.pdf --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from config import BASE_DIR, get_config
+from extraction_server import ExtractionClient, ExtractionServerError
+
+
+def collect_pdfs(paths):
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdfs.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                               if name.lower().endswith('.pdf')))
+        else:
+            pdfs.append(path)
+    return pdfs
+
+
+def time_subprocess(pdf, output):
+    cmd = [sys.executable, os.path.join(BASE_DIR, 'trucking_schedule_extractor.py'), pdf, '-o', output]
+    started = time.perf_counter()
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started, result.returncode == 0
+
+
+def time_server(client, pdf, output):
+    started = time.perf_counter()
+    reply = client.extract(pdf, output)
+    return time.perf_counter() - started, bool(reply.get('ok'))
+
+
+def summarize(label, timings, failures):
+    if not timings:
+        print(f"{label:>12}  no successful runs ({failures} failed)")
+        return None
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    mean = statistics.mean(ordered)
+    print(f"{label:>12} {len(ordered):>6} {mean * 1000:>10.0f} {statistics.median(ordered) * 1000:>10.0f} "
+          f"{p95 * 1000:>10.0f} {failures:>8}")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare cold and warm-JVM extraction latency')
+    parser.add_argument('paths', nargs='*', default=[os.path.join(BASE_DIR, 'pdfs')],
+                        help='PDF files or directories of PDFs')
+    parser.add_argument('--repeat', type=int, default=1, help='Passes over the document set')
+    args = parser.parse_args()
+
+    pdfs = collect_pdfs(args.paths) * args.repeat
+    if not pdfs:
+        print("No PDFs found")
+        sys.exit(1)
+
+    settings = get_config().extraction
+    client = ExtractionClient(settings)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        output = os.path.join(workdir, 'out.csv')
+
+        cold, cold_failures = [], 0
+        for pdf in pdfs:
+            seconds, ok = time_subprocess(pdf, output)
+            if ok:
+                cold.append(seconds)
+            else:
+                cold_failures += 1
+
+        started = time.perf_counter()
+        try:
+            try:
+                client.ensure_running()
+            except ExtractionServerError as e:
+                print(f"Could not start the extraction server: {e}")
+                sys.exit(1)
+            startup = time.perf_counter() - started
+
+            warm, warm_failures = [], 0
+            for pdf in pdfs:
+                seconds, ok = time_server(client, pdf, output)
+                if ok:
+                    warm.append(seconds)
+                else:
+                    warm_failures += 1
+        finally:
+            # Only a server started for the benchmark is stopped; one the app is using stays up
+            client.stop()
+
+    print(f"{len(pdfs)} documents; server startup (paid once) {startup:.2f}s")
+    print(f"{'mode':>12} {'docs':>6} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'failed':>8}")
+    cold_mean = summarize('subprocess', cold, cold_failures)
+    warm_mean = summarize('server', warm, warm_failures)
+    if cold_mean and warm_mean:
+        print(f"Warm server is {cold_mean / warm_mean:.1f}x faster per document "
+              f"({(cold_mean - warm_mean) * 1000:.0f} ms saved each)")
+
+
+if __name__ == '__main__':
+    main()
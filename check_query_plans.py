@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Query-plan regression check
+Seeds a large scratch database, drives every API route through Flask's test
+client and runs the importer on a CSV while recording each SQL statement that
+reaches SQLite. Each distinct statement is then run under EXPLAIN QUERY PLAN.
+The check fails on a full table scan or a temporary B-tree, unless the
+statement is listed in ALLOWED with the reason it cannot use an index.
+
+Examples:
+    python check_query_plans.py
+    python check_query_plans.py --trips 20000 --verbose
+"""
+
+import argparse
+import csv
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from contextlib import closing, contextmanager
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (statement pattern, plan pattern, reason) for plans that are expected
+ALLOWED = [
+    (r'FROM shifts( ORDER BY created_at DESC)?$', r'SCAN shifts',
+     'shift listings return every shift'),
+    (r'schedule_fts MATCH', r'USE TEMP B-TREE',
+     'FTS5 hits are ordered by bm25 rank, which no index can provide'),
+    (r'schedule_fts MATCH', r'SCAN hits',
+     'the ranked-hits CTE is grouped after it is computed'),
+    (r"INSERT INTO schedule_fts\(schedule_fts\) VALUES", r'.*',
+     'FTS5 delete-all command'),
+    (r'EXCEPT SELECT trip_id, stop_number', r'USE TEMP B-TREE FOR ORDER BY',
+     'version diffs sort only the stops that differ between the two versions'),
+    (r'load_unload_duration FROM schedule WHERE valid_to IS NULL$', r'SCAN schedule',
+     'the analytics snapshot reads every current row once per data generation'),
+    (r'^SELECT\s+MAX\(id\) FROM app_events', r'.*',
+     'MAX(rowid) is read from the end of the table B-tree'),
+]
+
+STATEMENT_PATTERN = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# Columns of an extractor CSV, in the order the importer reads them
+IMPORT_COLUMNS = ['trip_id', 'stop_number', 'nass_code', 'facility', 'arrive_time', 'depart_time',
+                  'load_unload_duration', 'vehicle_type', 'vehicle_id', 'frequency', 'effective_date',
+                  'expiration_date', 'raw_data', 'contract_hcr_number', 'contract_destination',
+                  'contract_supplier_name', 'contract_supplier_phone', 'contract_supplier_email',
+                  'contract_estimated_annual_miles', 'contract_estimated_annual_hours']
+FACILITIES = ['ATLANTA P&DC', 'MACON P&DF', 'AUGUSTA GA P&DF', 'COLUMBUS GA P&DF',
+              'SAVANNAH GA P&DC', 'ATHENS GA MPO', 'NORTH METRO GA P&DC']
+
+
+def normalize(sql):
+    """Statement text with literals replaced, so repeated calls count once"""
+    return re.sub(r'\s+', ' ', LITERAL_PATTERN.sub('?', sql)).strip()
+
+
+def seed_database(path, contracts, trips_per_contract, stops_per_trip):
+    """Create the importer's schema and fill it with synthetic schedule rows"""
+    from csv_to_sqlite import SimpleTruckingDB
+    from search_index import rebuild_search_index
+    from versions import begin_version, finish_version
+
+    db = SimpleTruckingDB(path)
+    db.connect()
+    db.prepare_schema()
+    rows = []
+    trip_id = 100000
+    for c in range(contracts):
+        contract = f"031L{c:04d}"
+        version_id = begin_version(db.conn, contract, 'seed')
+        finish_version(db.conn, version_id, trips_per_contract * stops_per_trip)
+        for _ in range(trips_per_contract):
+            trip_id += 1
+            for stop in range(1, stops_per_trip + 1):
+                facility = random.choice(FACILITIES)
+                minute = (stop * 47 + trip_id) % (24 * 60)
+                arrive = f"{minute // 60:02d}:{minute % 60:02d}:00 ET"
+                depart = f"{(minute + 30) // 60 % 24:02d}:{(minute + 30) % 60:02d}:00 ET"
+                rows.append((trip_id, stop, f"{FACILITIES.index(facility):03d}", facility, arrive, depart,
+                             '30 min', '45FT', f"V{trip_id % 500}", '1.00', '07/01/2024', '06/30/2025',
+                             f"{trip_id} {stop} {facility}", contract, version_id))
+    db.conn.executemany("""
+        INSERT INTO schedule (trip_id, stop_number, nass_code, facility, arrive_time, depart_time,
+            load_unload_duration, vehicle_type, vehicle_id, frequency, effective_date,
+            expiration_date, raw_data, contract_hcr_number, version_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    rebuild_search_index(db.conn)
+    db.conn.commit()
+    db.close()
+    return trip_id
+
+
+def write_import_csv(path, contract, trip_ids):
+    """A small extractor-style CSV: a new version of one seeded contract"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(IMPORT_COLUMNS)
+        for trip_id in trip_ids:
+            for stop in (1, 2):
+                writer.writerow([trip_id, stop, '001', 'MACON P&DF', '08:00:00 ET', '08:30:00 ET', '30 min',
+                                 '45FT', 'V1', '1.00', '07/01/2024', '06/30/2025', 'raw', contract,
+                                 'MACON', 'DDA TRANSPORT INC', '555-0100', 'ops@example.com', '1000', '50'])
+
+
+def write_matrix(path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['origin_nass', 'dest_nass', 'minutes'])
+        for i in range(len(FACILITIES)):
+            for j in range(len(FACILITIES)):
+                if i != j:
+                    writer.writerow([f"{i:03d}", f"{j:03d}", 20 + 5 * abs(i - j)])
+
+
+def exercise_app(trip_ids, versioned_contract):
+    """Call every route that touches the database; returns the responses that failed"""
+    import app as app_module
+
+    client = app_module.app.test_client()
+    failures = []
+
+    def call(method, path, **kwargs):
+        response = client.open(path, method=method, **kwargs)
+        # Streamed bodies run their queries while being read
+        response.get_data()
+        if response.status_code >= 500:
+            failures.append(f"{method} {path} -> {response.status_code}")
+        return response
+
+    some = trip_ids[:3]
+    call('GET', '/')
+    call('GET', '/api/trips')
+    call('GET', '/api/trips?contract=031L0001&contract=031L0002')
+    call('GET', '/api/trips-with-status')
+    call('GET', f'/api/trips/{some[0]}')
+    call('GET', '/api/search?q=macon')
+    # Single-trip shifts always pass the deadhead check, so they are really written
+    created = call('POST', '/api/shifts', json={'trip_ids': some[:1], 'shift_name': 'Plan check'})
+    call('GET', '/api/shifts')
+    call('POST', '/api/shifts/check', json={'trip_ids': some})
+    call('GET', f'/api/trips/{some[0]}/connections')
+    call('GET', '/api/deadhead?from=001&to=002')
+    versions = (call('GET', f'/api/contracts/{versioned_contract}/versions').get_json(silent=True) or {})
+    for version in versions.get('versions', []):
+        call('GET', f"/api/contracts/{versioned_contract}/versions/{version['id']}/trips")
+    call('GET', f'/api/contracts/{versioned_contract}/versions/diff')
+    call('GET', '/api/reports')
+    shift = (created.get_json(silent=True) or {}).get('shift')
+    if shift:
+        call('POST', '/api/shifts/bulk', json={'operations': [
+            {'op': 'create', 'shift_name': 'Plan check bulk', 'trip_ids': trip_ids[3:4]},
+            {'op': 'update', 'shift_id': shift['id'], 'shift_name': 'Plan check renamed'},
+        ]})
+        call('DELETE', f"/api/shifts/{shift['id']}")
+    # The change-event relay reads app_events on its own thread
+    app_module.event_log.since(0)
+    return failures
+
+
+@contextmanager
+def trace_statements():
+    """Collect each distinct statement run on connections opened inside the with-block"""
+    statements = {}
+    connect = sqlite3.connect
+
+    def traced_connect(*a, **kw):
+        conn = connect(*a, **kw)
+        conn.set_trace_callback(lambda sql: statements.setdefault(normalize(sql), sql)
+                                if STATEMENT_PATTERN.match(sql) else None)
+        return conn
+
+    sqlite3.connect = traced_connect
+    try:
+        yield statements
+    finally:
+        sqlite3.connect = connect
+
+
+def explain(conn, sql):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def check_plan(sql, plan, tables):
+    """Problems in a plan that ALLOWED does not excuse"""
+    problems = []
+    for detail in plan:
+        problem = None
+        scan = re.match(r'SCAN (\w+)(?: USING (COVERING )?INDEX)?', detail)
+        if scan and scan.group(1) in tables and not scan.group(2) and 'VIRTUAL TABLE' not in detail:
+            # A covering-index scan reads only the index; anything else visits every row
+            problem = 'full table scan'
+        elif detail.startswith('USE TEMP B-TREE'):
+            problem = 'temporary B-tree'
+        if problem is None:
+            continue
+        if any(re.search(stmt, sql, re.IGNORECASE) and re.search(pattern, detail)
+               for stmt, pattern, _ in ALLOWED):
+            continue
+        problems.append(f"{problem}: {detail}")
+    return problems
+
+
+def check_statements(db_path, statements):
+    """(statement, plan, problems) per traced statement, sorted; plan is None if it cannot be explained"""
+    results = []
+    with closing(sqlite3.connect(db_path)) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for key, sql in sorted(statements.items()):
+            try:
+                plan = explain(conn, sql)
+            except sqlite3.Error as e:
+                results.append((key, None, [str(e)]))
+                continue
+            results.append((key, plan, check_plan(key, plan, tables)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that every query the app issues uses an index')
+    parser.add_argument('--contracts', type=int, default=20)
+    parser.add_argument('--trips', type=int, default=1000, help='Trips per contract')
+    parser.add_argument('--stops', type=int, default=6, help='Stops per trip')
+    parser.add_argument('--verbose', action='store_true', help='Print every plan, not just failures')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='query-plans-')
+    db_path = os.path.join(workdir, 'schedule.db')
+    matrix_path = os.path.join(workdir, 'matrix.csv')
+    # Point the app and importer at scratch files before they load their configuration
+    os.environ.update({
+        'SCHEDULER_CONFIG': os.path.join(workdir, 'none.json'),
+        'SCHEDULER_DATABASE_PATH': db_path,
+        'SCHEDULER_DATABASE_SHARDED': 'false',
+        'SCHEDULER_UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'SCHEDULER_EXTRACTION_SERVER_ENABLED': 'false',
+        'SCHEDULER_DEADHEAD_MATRIX_PATH': matrix_path,
+        'SCHEDULER_LOGGING_LEVEL': 'WARNING',
+    })
+    sys.path.insert(0, BASE_DIR)
+
+    try:
+        random.seed(7)
+        last_trip_id = seed_database(db_path, args.contracts, args.trips, args.stops)
+        write_matrix(matrix_path)
+        print(f"Seeded {args.contracts * args.trips * args.stops} schedule rows in {db_path}")
+
+        with trace_statements() as statements:
+            # Re-import the second contract: some trips kept, some new, the rest removed
+            from csv_to_sqlite import SimpleTruckingDB
+            csv_path = os.path.join(workdir, 'import.csv')
+            first = 100001 + args.trips
+            write_import_csv(csv_path, '031L0001', [first, first + 1, first + 2, last_trip_id + 1, last_trip_id + 2])
+            importer = SimpleTruckingDB(db_path)
+            importer.connect()
+            importer.prepare_schema()
+            importer.load_csv_data(csv_path)
+            importer.get_stats()
+            importer.close()
+
+            failures = exercise_app(list(range(100001, 100001 + args.trips)), '031L0001')
+
+        failed = 0
+        for key, plan, problems in check_statements(db_path, statements):
+            if plan is None:
+                print(f"? could not explain: {key}\n    {problems[0]}")
+                continue
+            if problems or args.verbose:
+                print(f"{'FAIL' if problems else 'ok  '} {key[:160]}")
+                for detail in plan:
+                    print(f"       {detail}")
+                for problem in problems:
+                    print(f"    -> {problem}")
+            failed += bool(problems)
+
+        for failure in failures:
+            print(f"Route error: {failure}")
+        print(f"{len(statements)} distinct statements checked, {failed} with unexpected plans")
+        sys.exit(1 if failed or failures else 0)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
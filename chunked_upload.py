@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Resumable chunked uploads
+A client opens a session, PUTs the file in chunks at explicit byte offsets and
+then completes it. Chunks are streamed to disk and hashed on the way in, so the
+SHA-256 is ready at completion without reading the file again. After a dropped
+connection the client asks for the session offset and carries on from there.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadSessionError(Exception):
+    """A session request that cannot be honoured; `status` is the HTTP status to return"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class UploadSessionStore:
+    """Upload sessions kept as a data file plus a JSON metadata file per session"""
+
+    def __init__(self, root, max_size_bytes, session_ttl_seconds=24 * 3600):
+        self.root = root
+        self.max_size_bytes = max_size_bytes
+        self.session_ttl_seconds = session_ttl_seconds
+        os.makedirs(root, exist_ok=True)
+        # session id -> (sha256 object, bytes hashed); lost on restart and rebuilt on demand
+        self._hashers = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, session_id):
+        if not SESSION_ID_PATTERN.match(session_id or ''):
+            raise UploadSessionError('Unknown upload session', 404)
+        base = os.path.join(self.root, session_id)
+        return base + '.part', base + '.json'
+
+    def _load(self, session_id):
+        data_path, meta_path = self._paths(session_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadSessionError('Unknown upload session', 404)
+        if meta.get('completed_at'):
+            # The data file has been moved into the upload folder
+            meta['offset'] = meta['size']
+        else:
+            try:
+                meta['offset'] = os.path.getsize(data_path)
+            except FileNotFoundError:
+                raise UploadSessionError('Upload is being completed', 409)
+        return meta
+
+    def _save(self, session_id, meta):
+        _, meta_path = self._paths(session_id)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({key: value for key, value in meta.items() if key != 'offset'}, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def create(self, filename, size, upload_id=None, sha256=None):
+        """Open a session for a file of `size` bytes"""
+        if size <= 0:
+            raise UploadSessionError('File size must be positive')
+        if size > self.max_size_bytes:
+            raise UploadSessionError(
+                f'File is larger than {self.max_size_bytes // (1024 * 1024)} MB', 413)
+        self.cleanup()
+
+        session_id = uuid.uuid4().hex
+        data_path, meta_path = self._paths(session_id)
+        meta = {
+            'session_id': session_id,
+            'filename': filename,
+            'size': size,
+            'upload_id': upload_id or session_id,
+            'expected_sha256': sha256,
+            'created_at': time.time()
+        }
+        open(data_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+        meta['offset'] = 0
+        logger.info(f"Upload session {session_id} opened for {filename} ({size} bytes)")
+        return meta
+
+    def status(self, session_id):
+        return self._load(session_id)
+
+    def _hasher(self, session_id, data_file, offset):
+        """The running hash of the first `offset` bytes"""
+        with self._lock:
+            hasher, hashed = self._hashers.get(session_id, (None, 0))
+        if hasher is None or hashed > offset:
+            hasher, hashed = hashlib.sha256(), 0
+        if hashed < offset:
+            # Only after a restart or when another worker took the earlier chunks
+            data_file.seek(hashed)
+            while hashed < offset:
+                block = data_file.read(min(READ_SIZE, offset - hashed))
+                if not block:
+                    break
+                hasher.update(block)
+                hashed += len(block)
+        return hasher, hashed
+
+    def write_chunk(self, session_id, offset, stream):
+        """Append bytes read from `stream` at `offset`; returns the new offset"""
+        data_path, _ = self._paths(session_id)
+        meta = self._load(session_id)
+        if meta.get('completed_at'):
+            raise UploadSessionError('Upload already completed', 409, offset=meta['size'])
+
+        with open(data_path, 'r+b') as data_file:
+            # Serialise writers to one session, across threads and worker processes
+            fcntl.flock(data_file, fcntl.LOCK_EX)
+            if not os.path.exists(data_path):
+                # Completed while we waited: the open file is now the finished upload
+                raise UploadSessionError('Upload already completed', 409, offset=meta['size'])
+            current = os.fstat(data_file.fileno()).st_size
+            if offset != current:
+                raise UploadSessionError(
+                    f'Offset mismatch: expected {current}, got {offset}', 409, offset=current)
+
+            hasher, hashed = self._hasher(session_id, data_file, current)
+            data_file.seek(current)
+            try:
+                while True:
+                    block = stream.read(READ_SIZE)
+                    if not block:
+                        break
+                    if current + len(block) > meta['size']:
+                        raise UploadSessionError('Chunk runs past the declared file size', 400,
+                                                 offset=current)
+                    data_file.write(block)
+                    hasher.update(block)
+                    current += len(block)
+            finally:
+                # Whatever arrived before a dropped connection is kept and hashed
+                data_file.flush()
+                data_file.truncate(current)
+                with self._lock:
+                    self._hashers[session_id] = (hasher, current)
+        return current
+
+    def complete(self, session_id, destination):
+        """Move a fully received file to `destination`; returns its session metadata with sha256
+
+        Runs under the same lock as chunk writes. A repeated complete (a retried
+        request) returns the first one's metadata with `repeated` set and moves
+        nothing; `path` says where the file went.
+        """
+        data_path, meta_path = self._paths(session_id)
+        try:
+            data_file = open(data_path, 'rb')
+        except FileNotFoundError:
+            return self._completed(session_id)
+
+        with data_file:
+            fcntl.flock(data_file, fcntl.LOCK_EX)
+            if not os.path.exists(data_path):
+                return self._completed(session_id)
+            meta = self._load(session_id)
+            if meta['offset'] != meta['size']:
+                raise UploadSessionError(
+                    f"Upload incomplete: {meta['offset']} of {meta['size']} bytes received", 409,
+                    offset=meta['offset'])
+
+            hasher, _ = self._hasher(session_id, data_file, meta['size'])
+            digest = hasher.hexdigest()
+            data_file.seek(0)
+            if not data_file.read(5).startswith(b'%PDF'):
+                raise UploadSessionError('File is not a PDF')
+
+            if meta.get('expected_sha256') and meta['expected_sha256'].lower() != digest:
+                self.abort(session_id)
+                raise UploadSessionError('Checksum mismatch; the upload was discarded', 422)
+
+            os.replace(data_path, destination)
+            # The metadata stays behind (until the session TTL) so a retry can be answered
+            meta.update(sha256=digest, path=destination, completed_at=time.time())
+            self._save(session_id, meta)
+        with self._lock:
+            self._hashers.pop(session_id, None)
+        logger.info(f"Upload session {session_id} completed: {destination} sha256={digest}")
+        return meta
+
+    def record_result(self, session_id, payload, status):
+        """Keep the processing outcome of a completed session for clients polling its status"""
+        meta = self._load(session_id)
+        meta['result'] = dict(payload, ok=status < 400)
+        self._save(session_id, meta)
+
+    def _completed(self, session_id):
+        meta = self._load(session_id)
+        if not meta.get('completed_at'):
+            raise UploadSessionError('Unknown upload session', 404)
+        meta['repeated'] = True
+        return meta
+
+    def abort(self, session_id):
+        for path in self._paths(session_id):
+            if os.path.exists(path):
+                os.remove(path)
+        with self._lock:
+            self._hashers.pop(session_id, None)
+
+    def cleanup(self):
+        """Remove sessions that have not been written to within the TTL"""
+        cutoff = time.time() - self.session_ttl_seconds
+        for name in os.listdir(self.root):
+            if not name.endswith('.json'):
+                continue
+            session_id = name[:-len('.json')]
+            try:
+                data_path, meta_path = self._paths(session_id)
+                last_write = os.path.getmtime(data_path) if os.path.exists(data_path) else 0
+                if max(last_write, os.path.getmtime(meta_path)) < cutoff:
+                    logger.info(f"Removing expired upload session {session_id}")
+                    self.abort(session_id)
+            except (OSError, UploadSessionError):
+                continue
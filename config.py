@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Configuration for the MVP
+Typed settings shared by app.py, the extractor and the importer. Values come from
+config.json (or the file named by SCHEDULER_CONFIG), then from environment
+variables named SCHEDULER_<SECTION>_<KEY>, e.g. SCHEDULER_SERVER_WORKERS=8.
+"""
+
+import json
+import os
+import logging
+from dataclasses import dataclass, field, fields, asdict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.environ.get('SCHEDULER_CONFIG', os.path.join(BASE_DIR, 'config.json'))
+ENV_PREFIX = 'SCHEDULER_'
+
+JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+LOG_LEVELS = {'DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'}
+
+
+class ConfigError(ValueError):
+    """Raised when the configuration file or environment holds invalid settings"""
+
+
+@dataclass
+class DatabaseConfig:
+    path: str = 'trucking_schedule.db'
+    backup_enabled: bool = False
+    backup_interval_hours: float = 24
+    backup_dir: str = 'backups'
+    backup_retention: int = 7
+    backup_pages_per_step: int = 256
+    backup_step_sleep_ms: int = 50
+    # Paged copies restarted this often by concurrent writes finish in one step instead
+    backup_max_restarts: int = 3
+    pool_size: int = 8
+    busy_timeout_ms: int = 5000
+    journal_mode: str = 'WAL'
+    synchronous: str = 'NORMAL'
+    cache_size_kb: int = 16384
+    mmap_size_mb: int = 0
+    fetch_size: int = 500
+    # One schedule file per contract, listed in a catalog database
+    sharded: bool = False
+    shard_dir: str = 'shards'
+    catalog_path: str = 'catalog.db'
+    shard_query_workers: int = 8
+
+    def validate(self, errors):
+        _positive(errors, 'database', self, 'pool_size', 'busy_timeout_ms', 'fetch_size',
+                  'backup_interval_hours', 'backup_retention', 'backup_pages_per_step', 'backup_max_restarts',
+                  'shard_query_workers')
+        _non_negative(errors, 'database', self, 'cache_size_kb', 'mmap_size_mb', 'backup_step_sleep_ms')
+        if self.journal_mode.upper() not in JOURNAL_MODES:
+            errors.append(f"database.journal_mode must be one of {sorted(JOURNAL_MODES)}")
+        if self.synchronous.upper() not in SYNCHRONOUS_MODES:
+            errors.append(f"database.synchronous must be one of {sorted(SYNCHRONOUS_MODES)}")
+
+    def apply_pragmas(self, conn):
+        """Apply the configured pragmas to a freshly opened sqlite3 connection"""
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA journal_mode={self.journal_mode.upper()}")
+        conn.execute(f"PRAGMA synchronous={self.synchronous.upper()}")
+        # Negative cache_size is in KiB rather than pages
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size_mb) * 1024 * 1024}")
+
+
+@dataclass
+class UploadConfig:
+    folder: str = 'uploads'
+    max_file_size_mb: int = 50
+    allowed_extensions: List[str] = field(default_factory=lambda: ['.pdf'])
+    retention_days: int = 30
+    chunk_size_mb: int = 4
+    chunked_max_size_mb: int = 500
+    session_ttl_hours: int = 24
+
+    def validate(self, errors):
+        _positive(errors, 'upload', self, 'max_file_size_mb', 'retention_days', 'chunk_size_mb',
+                  'chunked_max_size_mb', 'session_ttl_hours')
+        if self.chunk_size_mb >= self.max_file_size_mb:
+            errors.append("upload.chunk_size_mb must be below upload.max_file_size_mb")
+        if not self.allowed_extensions:
+            errors.append("upload.allowed_extensions must not be empty")
+
+
+@dataclass
+class AppConfig:
+    # Only used by the development server (python app.py or serve.py --dev)
+    debug: bool = False
+    host: str = '0.0.0.0'
+    port: int = 5000
+    secret_key: str = 'dev-key-change-in-production'
+
+    def validate(self, errors):
+        if not 0 < self.port < 65536:
+            errors.append("app.port must be between 1 and 65535")
+
+
+@dataclass
+class ServerConfig:
+    interface: str = 'wsgi'
+    workers: int = 2
+    threads: int = 16
+    timeout: int = 120
+    extraction_workers: int = 2
+
+    def validate(self, errors):
+        _positive(errors, 'server', self, 'workers', 'threads', 'timeout', 'extraction_workers')
+        if self.interface not in ('wsgi', 'asgi'):
+            errors.append("server.interface must be 'wsgi' or 'asgi'")
+
+
+@dataclass
+class CacheConfig:
+    response_entries: int = 256
+    response_max_entry_mb: int = 32
+    event_history: int = 500
+    event_retention: int = 5000
+    event_poll_seconds: float = 1.0
+
+    def validate(self, errors):
+        _positive(errors, 'cache', self, 'response_entries', 'response_max_entry_mb',
+                  'event_history', 'event_retention', 'event_poll_seconds')
+
+
+@dataclass
+class ExtractionConfig:
+    extract_timeout_seconds: int = 300
+    import_timeout_seconds: int = 60
+    import_chunk_size: int = 5000
+    page_batch_size: int = 10
+    layout_engine: bool = True
+    layout_cache: str = 'layout_templates.json'
+    server_enabled: bool = True
+    server_socket: str = 'extraction.sock'
+    server_concurrency: int = 2
+    server_max_documents: int = 200
+    server_health_check_seconds: int = 30
+    # Consecutive unanswered health checks before a live server is killed and restarted
+    server_max_missed_pings: int = 3
+    server_start_timeout_seconds: int = 60
+    # Past this much RSS growth during one extraction, parsed rows spill to sorted run files on disk (0 disables the budget)
+    memory_budget_mb: int = 1024
+    memory_tracemalloc: bool = False
+    memory_sample_ms: int = 50
+    spill_dir: Optional[str] = None
+
+    def validate(self, errors):
+        _positive(errors, 'extraction', self, 'extract_timeout_seconds',
+                  'import_timeout_seconds', 'import_chunk_size', 'server_concurrency',
+                  'server_health_check_seconds', 'server_max_missed_pings', 'server_start_timeout_seconds',
+                  'memory_sample_ms')
+        _non_negative(errors, 'extraction', self, 'page_batch_size', 'server_max_documents',
+                      'memory_budget_mb')
+
+
+@dataclass
+class DeadheadConfig:
+    matrix_path: str = 'facility_matrix.csv'
+    symmetric: bool = True
+    min_turnaround_minutes: float = 0
+    # 'allow' treats facility pairs missing from the matrix as no deadhead; 'reject' refuses them
+    unknown_policy: str = 'allow'
+    lru_size: int = 65536
+
+    def validate(self, errors):
+        _positive(errors, 'deadhead', self, 'lru_size')
+        _non_negative(errors, 'deadhead', self, 'min_turnaround_minutes')
+        if self.unknown_policy not in ('allow', 'reject'):
+            errors.append("deadhead.unknown_policy must be 'allow' or 'reject'")
+
+
+@dataclass
+class ProfilingConfig:
+    enabled: bool = False
+    # 'cprofile' saves .pstats files; 'sample' saves collapsed stacks with far less overhead
+    mode: str = 'cprofile'
+    directory: str = 'profiles'
+    retention: int = 50
+    header: str = 'X-Profile'
+    query_flag: str = 'profile'
+    # Fractions of requests and extractions profiled without being asked
+    sample_rate: float = 0.0
+    extraction_sample_rate: float = 0.0
+    sample_interval_ms: float = 5
+
+    def validate(self, errors):
+        _positive(errors, 'profiling', self, 'retention', 'sample_interval_ms')
+        if self.mode not in ('cprofile', 'sample'):
+            errors.append("profiling.mode must be 'cprofile' or 'sample'")
+        for name in ('sample_rate', 'extraction_sample_rate'):
+            if not 0 <= getattr(self, name) <= 1:
+                errors.append(f"profiling.{name} must be between 0 and 1")
+
+
+@dataclass
+class LoggingConfig:
+    level: str = 'INFO'
+    file: Optional[str] = None
+
+    def validate(self, errors):
+        if self.level.upper() not in LOG_LEVELS:
+            errors.append(f"logging.level must be one of {sorted(LOG_LEVELS)}")
+
+
+@dataclass
+class Config:
+    database: DatabaseConfig = field(default_factory=DatabaseConfig)
+    upload: UploadConfig = field(default_factory=UploadConfig)
+    app: AppConfig = field(default_factory=AppConfig)
+    server: ServerConfig = field(default_factory=ServerConfig)
+    cache: CacheConfig = field(default_factory=CacheConfig)
+    extraction: ExtractionConfig = field(default_factory=ExtractionConfig)
+    deadhead: DeadheadConfig = field(default_factory=DeadheadConfig)
+    profiling: ProfilingConfig = field(default_factory=ProfilingConfig)
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+
+    def validate(self):
+        errors = []
+        for section in fields(self):
+            getattr(self, section.name).validate(errors)
+        if errors:
+            raise ConfigError("Invalid configuration: " + '; '.join(errors))
+        return self
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def resolve_path(path):
+    """A configured path, with relative paths taken from the project directory rather than the CWD"""
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+
+def _positive(errors, section, settings, *names):
+    for name in names:
+        if getattr(settings, name) <= 0:
+            errors.append(f"{section}.{name} must be positive")
+
+
+def _non_negative(errors, section, settings, *names):
+    for name in names:
+        if getattr(settings, name) < 0:
+            errors.append(f"{section}.{name} must not be negative")
+
+
+def _coerce(value, annotation, where):
+    """Convert a JSON or environment value to the field's declared type"""
+    if annotation == Optional[str]:
+        return None if value in (None, '') else str(value)
+    try:
+        if annotation is bool:
+            if isinstance(value, str):
+                if value.lower() in ('1', 'true', 'yes', 'on'):
+                    return True
+                if value.lower() in ('0', 'false', 'no', 'off'):
+                    return False
+                raise ValueError(value)
+            return bool(value)
+        if annotation is int:
+            if isinstance(value, bool):
+                raise ValueError(value)
+            return int(value)
+        if annotation is float:
+            return float(value)
+        if annotation == List[str]:
+            if isinstance(value, str):
+                return [item.strip() for item in value.split(',') if item.strip()]
+            return [str(item) for item in value]
+        return str(value)
+    except (TypeError, ValueError):
+        raise ConfigError(f"{where}: cannot use {value!r} as {getattr(annotation, '__name__', annotation)}")
+
+
+def _apply(section_obj, values: Dict[str, Any], section_name, source):
+    known = {f.name: f for f in fields(section_obj)}
+    for key, value in values.items():
+        if key not in known:
+            raise ConfigError(f"{source}: unknown setting {section_name}.{key}")
+        setattr(section_obj, key, _coerce(value, known[key].type, f"{source} {section_name}.{key}"))
+
+
+def load_config(path=None, environ=None):
+    """Build and validate a Config from a JSON file plus environment overrides"""
+    path = path or CONFIG_PATH
+    environ = os.environ if environ is None else environ
+    config = Config()
+
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ConfigError(f"Could not read config file {path}: {e}")
+        for section_name, values in data.items():
+            if not hasattr(config, section_name) or not isinstance(values, dict):
+                raise ConfigError(f"{path}: unknown section {section_name!r}")
+            _apply(getattr(config, section_name), values, section_name, path)
+
+    for section in fields(config):
+        section_obj = getattr(config, section.name)
+        for setting in fields(section_obj):
+            name = f"{ENV_PREFIX}{section.name}_{setting.name}".upper()
+            if name in environ:
+                _apply(section_obj, {setting.name: environ[name]}, section.name, name)
+
+    # Conventional variables kept for existing deployments
+    if environ.get('SECRET_KEY'):
+        config.app.secret_key = environ['SECRET_KEY']
+    if environ.get('WEB_CONCURRENCY'):
+        _apply(config.server, {'workers': environ['WEB_CONCURRENCY']}, 'server', 'WEB_CONCURRENCY')
+
+    return config.validate()
+
+
+_config = None
+
+
+def get_config():
+    """The process-wide configuration, loaded and validated on first use"""
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
+
+
+def configure_logging(settings: LoggingConfig, fmt=None):
+    """Set up root logging from the `logging` section"""
+    handlers = [logging.StreamHandler()]
+    if settings.file:
+        handlers.append(logging.FileHandler(resolve_path(settings.file)))
+    kwargs = {'format': fmt} if fmt else {}
+    logging.basicConfig(level=settings.level.upper(), handlers=handlers, **kwargs)
@@ -7,25 +7,53 @@ Basic trucking schedule database for PDF upload and trip management
 import sqlite3
 import pandas as pd
 import re
+import json
 from datetime import datetime, time
 import logging
 import sys
 import os
 
+from config import get_config, configure_logging, resolve_path
+from search_index import ensure_search_index, max_indexed_id, index_rows_after
+from sharding import ShardCatalog
+from versions import ensure_versioning, begin_version, finish_version
+
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+config = get_config()
+configure_logging(config.logging, fmt='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Checked by check_query_plans.py: every API query must be served by one of these
+# or by the version indexes in versions.py
+SCHEDULE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_arrive_time ON schedule(arrive_time);",
+    "CREATE INDEX IF NOT EXISTS idx_vehicle_id ON schedule(vehicle_id);"
+]
+
+# Leading-column prefixes of the composite version indexes in versions.py
+REDUNDANT_INDEXES = ['idx_trip_id', 'idx_contract_hcr_number']
+
 class SimpleTruckingDB:
-    def __init__(self, db_path='trucking_schedule.db'):
+    def __init__(self, db_path=None, progress_callback=None, catalog=None):
         """Initialize database connection."""
-        self.db_path = db_path
+        self.db_path = db_path or resolve_path(config.database.path)
         self.conn = None
+        self.progress_callback = progress_callback
+        self.chunk_size = config.extraction.import_chunk_size
+        # With a shard catalog, schedule rows go to one database file per contract
+        self.catalog = catalog
+        self.shards_written = {}
+    
+    def _report_progress(self, phase, **fields):
+        """Forward a progress event to the caller, if one is listening."""
+        if self.progress_callback:
+            self.progress_callback({'phase': phase, **fields})
         
     def connect(self):
         """Create database connection."""
         try:
-            self.conn = sqlite3.connect(self.db_path)
+            self.conn = sqlite3.connect(self.db_path, timeout=config.database.busy_timeout_ms / 1000)
+            config.database.apply_pragmas(self.conn)
             logger.info(f"Connected to database: {self.db_path}")
         except Exception as e:
             logger.error(f"Failed to connect to database: {e}")
@@ -58,27 +86,22 @@ class SimpleTruckingDB:
             contract_supplier_email TEXT,
             contract_estimated_annual_miles TEXT,
             contract_estimated_annual_hours TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            version_id INTEGER,
+            valid_to TIMESTAMP
         );
         """
         
-        # Basic indexes for performance
-        indexes_sql = [
-            "CREATE INDEX IF NOT EXISTS idx_trip_id ON schedule(trip_id);",
-            "CREATE INDEX IF NOT EXISTS idx_facility ON schedule(facility);",
-            "CREATE INDEX IF NOT EXISTS idx_arrive_time ON schedule(arrive_time);",
-            "CREATE INDEX IF NOT EXISTS idx_vehicle_id ON schedule(vehicle_id);",
-            "CREATE INDEX IF NOT EXISTS idx_contract_hcr_number ON schedule(contract_hcr_number);"
-        ]
-        
         try:
             cursor = self.conn.cursor()
             cursor.execute(schedule_table_sql)
             
-            for index_sql in indexes_sql:
+            for index_sql in SCHEDULE_INDEXES:
                 cursor.execute(index_sql)
             
             self.conn.commit()
+            ensure_versioning(self.conn)
+            ensure_search_index(self.conn)
             logger.info("Simple database schema created successfully")
             
         except Exception as e:
@@ -111,54 +134,60 @@ class SimpleTruckingDB:
                     logger.info(f"Adding column: {column_name}")
                     cursor.execute(f"ALTER TABLE schedule ADD COLUMN {column_name} {column_type}")
             
-            # Add missing index
-            if 'contract_hcr_number' not in existing_columns:
-                cursor.execute("CREATE INDEX IF NOT EXISTS idx_contract_hcr_number ON schedule(contract_hcr_number);")
+            self.conn.commit()
+            
+            # Rows imported before versioning become each contract's first version
+            if ensure_versioning(self.conn):
+                logger.info("Added schedule versions")
+            
+            # Composite indexes replace the single-column trip and contract ones
+            for index_sql in SCHEDULE_INDEXES:
+                cursor.execute(index_sql)
+            for index_name in REDUNDANT_INDEXES:
+                cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
             
             self.conn.commit()
+            
+            # Databases created before full-text search get their index built once
+            if ensure_search_index(self.conn):
+                logger.info("Added full-text search index")
+            
             logger.info("Database schema migration completed")
             
         except Exception as e:
             logger.error(f"Failed to migrate schema: {e}")
             raise
     
+    def prepare_schema(self):
+        """Create the schedule schema, or migrate it if the table already exists."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='schedule'")
+            table_exists = cursor.fetchone() is not None
+            
+            if table_exists:
+                logger.info(f"Existing schedule table found, migrating schema...")
+                self.migrate_schema()
+            else:
+                logger.info(f"Creating new database schema...")
+                self.create_schema()
+        except Exception as e:
+            logger.info(f"Creating new database schema...")
+            self.create_schema()
+    
+    def _open_shard(self, contract):
+        """Connection to the shard file for one contract, schema ready."""
+        shard = SimpleTruckingDB(self.catalog.path_for(contract))
+        shard.connect()
+        shard.prepare_schema()
+        return shard
+    
     def load_csv_data(self, csv_file_path):
         """Load CSV data with flexible column handling."""
+        targets = {}
         try:
             logger.info(f"Reading CSV file: {csv_file_path}")
-            df = pd.read_csv(csv_file_path)
-            logger.info(f"Loaded {len(df)} records from CSV")
-            
-            # Clean and prepare data
-            records = []
-            for _, row in df.iterrows():
-                try:
-                    record = (
-                        int(row['trip_id']) if pd.notna(row['trip_id']) else None,
-                        int(row['stop_number']) if pd.notna(row['stop_number']) else None,
-                        str(row['nass_code']) if pd.notna(row['nass_code']) else None,
-                        str(row['facility']) if pd.notna(row['facility']) else None,
-                        str(row['arrive_time']) if pd.notna(row['arrive_time']) else None,
-                        str(row['depart_time']) if pd.notna(row['depart_time']) else None,
-                        str(row['load_unload_duration']) if pd.notna(row['load_unload_duration']) else None,
-                        str(row['vehicle_type']) if pd.notna(row['vehicle_type']) else None,
-                        str(row['vehicle_id']) if pd.notna(row['vehicle_id']) else None,
-                        str(row['frequency']) if pd.notna(row['frequency']) else None,
-                        str(row['effective_date']) if pd.notna(row['effective_date']) else None,
-                        str(row['expiration_date']) if pd.notna(row['expiration_date']) else None,
-                        str(row['raw_data']) if pd.notna(row['raw_data']) else None,
-                        str(row['contract_hcr_number']) if pd.notna(row['contract_hcr_number']) else None,
-                        str(row['contract_destination']) if pd.notna(row['contract_destination']) else None,
-                        str(row['contract_supplier_name']) if pd.notna(row['contract_supplier_name']) else None,
-                        str(row['contract_supplier_phone']) if pd.notna(row['contract_supplier_phone']) else None,
-                        str(row['contract_supplier_email']) if pd.notna(row['contract_supplier_email']) else None,
-                        str(row['contract_estimated_annual_miles']) if pd.notna(row['contract_estimated_annual_miles']) else None,
-                        str(row['contract_estimated_annual_hours']) if pd.notna(row['contract_estimated_annual_hours']) else None
-                    )
-                    records.append(record)
-                except Exception as e:
-                    logger.warning(f"Skipping row due to error: {e}")
-                    continue
+            self._report_progress('reading')
             
             # Insert records
             insert_sql = """
@@ -168,20 +197,114 @@ class SimpleTruckingDB:
              effective_date, expiration_date, raw_data, contract_hcr_number, 
              contract_destination, contract_supplier_name, contract_supplier_phone, 
              contract_supplier_email, contract_estimated_annual_miles, 
-             contract_estimated_annual_hours)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+             contract_estimated_annual_hours, version_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """
             
-            cursor = self.conn.cursor()
-            cursor.executemany(insert_sql, records)
-            self.conn.commit()
+            # Each target database gets its own transaction: the main database,
+            # or in sharded mode one shard per contract, so imports of different
+            # contracts never wait on each other's write lock
+            def target(contract):
+                if contract not in targets:
+                    db = self._open_shard(contract) if self.catalog else self
+                    targets[contract] = (db, max_indexed_id(db.conn), [0])
+                return targets[contract]
+            
+            # Each contract in the file becomes a new version of that contract;
+            # it replaces the previous one when its target commits
+            versions = {}
+            source = os.path.basename(csv_file_path)
+            
+            def version(contract):
+                if contract not in versions:
+                    db = target(contract if self.catalog else None)[0]
+                    versions[contract] = (db, begin_version(db.conn, contract, source), [0])
+                return versions[contract]
             
-            logger.info(f"Successfully inserted {len(records)} schedule records")
-            return len(records)
+            total_records = 0
+            contracts = set()
+            trip_ids = set()
+            
+            # Read and insert in chunks so memory does not grow with the CSV;
+            # everything still commits as one transaction per target database
+            for df in pd.read_csv(csv_file_path, chunksize=self.chunk_size):
+                # Clean and prepare data
+                records = []
+                for _, row in df.iterrows():
+                    try:
+                        record = (
+                            int(row['trip_id']) if pd.notna(row['trip_id']) else None,
+                            int(row['stop_number']) if pd.notna(row['stop_number']) else None,
+                            str(row['nass_code']) if pd.notna(row['nass_code']) else None,
+                            str(row['facility']) if pd.notna(row['facility']) else None,
+                            str(row['arrive_time']) if pd.notna(row['arrive_time']) else None,
+                            str(row['depart_time']) if pd.notna(row['depart_time']) else None,
+                            str(row['load_unload_duration']) if pd.notna(row['load_unload_duration']) else None,
+                            str(row['vehicle_type']) if pd.notna(row['vehicle_type']) else None,
+                            str(row['vehicle_id']) if pd.notna(row['vehicle_id']) else None,
+                            str(row['frequency']) if pd.notna(row['frequency']) else None,
+                            str(row['effective_date']) if pd.notna(row['effective_date']) else None,
+                            str(row['expiration_date']) if pd.notna(row['expiration_date']) else None,
+                            str(row['raw_data']) if pd.notna(row['raw_data']) else None,
+                            str(row['contract_hcr_number']) if pd.notna(row['contract_hcr_number']) else None,
+                            str(row['contract_destination']) if pd.notna(row['contract_destination']) else None,
+                            str(row['contract_supplier_name']) if pd.notna(row['contract_supplier_name']) else None,
+                            str(row['contract_supplier_phone']) if pd.notna(row['contract_supplier_phone']) else None,
+                            str(row['contract_supplier_email']) if pd.notna(row['contract_supplier_email']) else None,
+                            str(row['contract_estimated_annual_miles']) if pd.notna(row['contract_estimated_annual_miles']) else None,
+                            str(row['contract_estimated_annual_hours']) if pd.notna(row['contract_estimated_annual_hours']) else None
+                        )
+                        records.append(record)
+                    except Exception as e:
+                        logger.warning(f"Skipping row due to error: {e}")
+                        continue
+                
+                groups = {}
+                for record in records:
+                    groups.setdefault(record[13], []).append(record)
+                for contract, group in groups.items():
+                    db, version_id, version_rows = version(contract)
+                    db.conn.executemany(insert_sql, [record + (version_id,) for record in group])
+                    version_rows[0] += len(group)
+                    target(contract if self.catalog else None)[2][0] += len(group)
+                
+                total_records += len(records)
+                contracts.update(r[13] for r in records if r[13] is not None)
+                trip_ids.update(r[0] for r in records if r[0] is not None)
+                self._report_progress('inserting', rows=total_records)
+            
+            # Index the new rows in one pass, inside the same transaction as the insert
+            self._report_progress('indexing', rows=total_records)
+            retired = []
+            for contract, (db, version_id, version_rows) in versions.items():
+                retired.extend(finish_version(db.conn, version_id, version_rows[0]))
+            for contract, (db, last_indexed_id, written) in targets.items():
+                index_rows_after(db.conn, last_indexed_id)
+                db.conn.commit()
+                if self.catalog:
+                    row_count = db.conn.execute("SELECT COUNT(*) FROM schedule WHERE valid_to IS NULL").fetchone()[0]
+                    self.catalog.register(contract, row_count)
+                    self.shards_written[contract or ''] = written[0]
+            
+            # Tell listeners exactly which contracts and trips changed
+            self._report_progress(
+                'imported',
+                rows=total_records,
+                contracts=sorted(contracts),
+                trip_ids=sorted(trip_ids),
+                versions={contract or '': version_id for contract, (_, version_id, _) in versions.items()},
+                retired_versions=retired
+            )
+            logger.info(f"Successfully inserted {total_records} schedule records")
+            return total_records
             
         except Exception as e:
             logger.error(f"Failed to load CSV data: {e}")
             raise
+        finally:
+            if self.catalog:
+                for db, _, _ in targets.values():
+                    db.close()
     
     def get_stats(self):
         """Get basic database statistics."""
@@ -189,15 +312,15 @@ class SimpleTruckingDB:
             cursor = self.conn.cursor()
             
             # Total records
-            cursor.execute("SELECT COUNT(*) FROM schedule")
+            cursor.execute("SELECT COUNT(*) FROM schedule WHERE valid_to IS NULL")
             total_records = cursor.fetchone()[0]
             
             # Unique trips
-            cursor.execute("SELECT COUNT(DISTINCT trip_id) FROM schedule")
+            cursor.execute("SELECT COUNT(DISTINCT trip_id) FROM schedule WHERE valid_to IS NULL")
             unique_trips = cursor.fetchone()[0]
             
             # Unique facilities
-            cursor.execute("SELECT COUNT(DISTINCT facility) FROM schedule")
+            cursor.execute("SELECT COUNT(DISTINCT facility) FROM schedule WHERE valid_to IS NULL")
             unique_facilities = cursor.fetchone()[0]
             
             return {
@@ -215,49 +338,49 @@ class SimpleTruckingDB:
             self.conn.close()
             logger.info("Database connection closed")
 
+def print_progress(event):
+    """Write a progress event as a single PROGRESS line for the parent process."""
+    print(f"PROGRESS {json.dumps(event)}", flush=True)
+
 def main():
     """Main function to process CSV and create database."""
     
     # Get CSV file from command line argument
-    if len(sys.argv) < 2:
-        print("Usage: python csv_to_sqlite.py <csv_file>")
+    args = [arg for arg in sys.argv[1:] if arg != '--progress']
+    if len(args) < 1:
+        print("Usage: python csv_to_sqlite.py <csv_file> [--progress]")
         sys.exit(1)
     
-    csv_file = sys.argv[1]
-    db_file = 'trucking_schedule.db'
+    csv_file = args[0]
+    db_file = resolve_path(config.database.path)
     
     # Check if CSV file exists
     if not os.path.exists(csv_file):
         logger.error(f"CSV file not found: {csv_file}")
         sys.exit(1)
     
+    catalog = None
+    if config.database.sharded:
+        catalog = ShardCatalog(resolve_path(config.database.catalog_path), resolve_path(config.database.shard_dir))
+    
     # Create database
-    db = SimpleTruckingDB(db_file)
+    db = SimpleTruckingDB(db_file, progress_callback=print_progress if '--progress' in sys.argv else None,
+                          catalog=catalog)
     
     try:
         # Connect and setup
         db.connect()
-        
-        # Check if schedule table exists to determine if we need to create or migrate
-        try:
-            cursor = db.conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='schedule'")
-            table_exists = cursor.fetchone() is not None
-            
-            if table_exists:
-                logger.info(f"Existing schedule table found, migrating schema...")
-                db.migrate_schema()
-            else:
-                logger.info(f"Creating new database schema...")
-                db.create_schema()
-        except Exception as e:
-            logger.info(f"Creating new database schema...")
-            db.create_schema()
+        db.prepare_schema()
         
         # Load data
         logger.info("Starting data import...")
         record_count = db.load_csv_data(csv_file)
         
+        if catalog:
+            for contract, rows in sorted(db.shards_written.items()):
+                logger.info(f"Shard {catalog.path_for(contract)}: {rows} records imported")
+            return
+        
         # Get stats
         stats = db.get_stats()
         
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Facility-to-facility deadhead times for shift feasibility
+A CSV of (origin NASS code, destination NASS code, minutes) is loaded into a
+dense NumPy matrix indexed by facility ordinal, so checking thousands of trip
+pairs is a handful of array operations.
+
+CSV columns: origin_nass, dest_nass, minutes[, miles]
+"""
+
+import csv
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TIME_PATTERN = re.compile(r'(\d{1,2}):(\d{2})(?::(\d{2}))?')
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_minutes(value):
+    """'08:30:00 ET' -> 510.0 minutes after midnight; NaN if absent"""
+    match = TIME_PATTERN.search(value or '')
+    if not match:
+        return np.nan
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 60 + int(minutes) + int(seconds or 0) / 60
+
+
+def past_midnight_offsets(starts):
+    """Minutes to add to each trip start so a shift crossing midnight sorts in driving order
+
+    A shift spans less than a day, so it is taken to begin after the longest gap
+    between its trip starts around the 24-hour clock; 22:00 then 01:00 becomes
+    22:00 then 25:00. Ties keep the shift within one day. Missing starts get 0.
+    """
+    offsets = np.zeros(len(starts))
+    known = np.flatnonzero(~np.isnan(starts))
+    if len(known) < 2:
+        return offsets
+    order = known[np.argsort(starts[known], kind='stable')]
+    ordered = starts[order]
+    gaps = np.append(np.diff(ordered), ordered[0] + MINUTES_PER_DAY - ordered[-1])
+    # The last of the largest gaps, so the wrap-around gap wins a tie
+    k = len(gaps) - 1 - int(np.argmax(gaps[::-1]))
+    if k < len(gaps) - 1:
+        offsets[order[:k + 1]] = MINUTES_PER_DAY
+    return offsets
+
+
+class DeadheadMatrix:
+    """Dense origin x destination matrix of drive minutes between facilities"""
+
+    def __init__(self, codes, minutes, lru_size=65536):
+        self.codes = list(codes)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        # NaN marks pairs the CSV does not cover
+        self.minutes = minutes
+        self.lookup = lru_cache(maxsize=lru_size)(self._lookup)
+
+    @classmethod
+    def from_csv(cls, path, symmetric=True, lru_size=65536):
+        """Load a matrix; a missing reverse direction is filled from the forward one if `symmetric`"""
+        pairs = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                try:
+                    pairs.append((row['origin_nass'].strip(), row['dest_nass'].strip(), float(row['minutes'])))
+                except (KeyError, TypeError, ValueError):
+                    logger.warning(f"Skipping malformed deadhead row: {row}")
+
+        codes = sorted({p[0] for p in pairs} | {p[1] for p in pairs})
+        index = {code: i for i, code in enumerate(codes)}
+        minutes = np.full((len(codes), len(codes)), np.nan, dtype=np.float32)
+        np.fill_diagonal(minutes, 0)
+        if pairs:
+            origins = np.fromiter((index[p[0]] for p in pairs), dtype=np.intp, count=len(pairs))
+            dests = np.fromiter((index[p[1]] for p in pairs), dtype=np.intp, count=len(pairs))
+            values = np.fromiter((p[2] for p in pairs), dtype=np.float32, count=len(pairs))
+            if symmetric:
+                minutes[dests, origins] = values
+            # Explicit rows win over mirrored ones
+            minutes[origins, dests] = values
+
+        logger.info(f"Loaded deadhead matrix for {len(codes)} facilities from {path}")
+        return cls(codes, minutes, lru_size=lru_size)
+
+    def _lookup(self, origin, dest):
+        i = self.index.get(origin)
+        j = self.index.get(dest)
+        if i is None or j is None:
+            return None if origin != dest else 0.0
+        value = self.minutes[i, j]
+        return None if np.isnan(value) else float(value)
+
+    def ordinals(self, codes):
+        """Matrix ordinals for NASS codes; -1 for codes not in the matrix"""
+        return np.fromiter((self.index.get(code, -1) for code in codes), dtype=np.intp, count=len(codes))
+
+    def pair_minutes(self, origin_ordinals, dest_ordinals):
+        """Deadhead minutes for broadcastable ordinal arrays; NaN where unknown"""
+        origin_ordinals, dest_ordinals = np.broadcast_arrays(origin_ordinals, dest_ordinals)
+        result = np.full(origin_ordinals.shape, np.nan, dtype=np.float32)
+        known = (origin_ordinals >= 0) & (dest_ordinals >= 0)
+        result[known] = self.minutes[origin_ordinals[known], dest_ordinals[known]]
+        return result
+
+
+class TripEndpoints:
+    """Where and when each trip starts and ends, as parallel arrays"""
+
+    def __init__(self, rows, matrix):
+        self.trip_ids = np.array([r['trip_id'] for r in rows], dtype=np.int64)
+        self.start_nass = np.array([r['start_nass'] for r in rows], dtype=object)
+        self.end_nass = np.array([r['end_nass'] for r in rows], dtype=object)
+        self.start = np.array([parse_minutes(r['start_time']) for r in rows], dtype=np.float64)
+        self.end = np.array([parse_minutes(r['end_time']) for r in rows], dtype=np.float64)
+        # A trip that ends "earlier" than it starts runs past midnight
+        self.end = np.where(self.end < self.start, self.end + MINUTES_PER_DAY, self.end)
+        self.start_ordinals = matrix.ordinals(self.start_nass)
+        self.end_ordinals = matrix.ordinals(self.end_nass)
+        self.position = {int(trip_id): i for i, trip_id in enumerate(self.trip_ids)}
+
+    def __len__(self):
+        return len(self.trip_ids)
+
+
+def check_sequence(endpoints, trip_ids, matrix, min_turnaround=0.0, unknown_policy='allow'):
+    """Check that a driver can cover `trip_ids` in start-time order
+
+    Trips after midnight follow the evening's trips (see past_midnight_offsets).
+    Returns a dict with `feasible` and one entry per consecutive leg.
+    """
+    positions = np.array([endpoints.position[t] for t in trip_ids if t in endpoints.position], dtype=np.intp)
+    missing = [t for t in trip_ids if t not in endpoints.position]
+    offsets = past_midnight_offsets(endpoints.start[positions])
+    starts = endpoints.start[positions] + offsets
+    ends = endpoints.end[positions] + offsets
+    sequence = np.argsort(starts, kind='stable')
+    order, starts, ends = positions[sequence], starts[sequence], ends[sequence]
+
+    prev, nxt = order[:-1], order[1:]
+    gap = starts[1:] - ends[:-1]
+    deadhead = matrix.pair_minutes(endpoints.end_ordinals[prev], endpoints.start_ordinals[nxt])
+    # Staying at the same facility needs no matrix entry
+    deadhead[endpoints.end_nass[prev] == endpoints.start_nass[nxt]] = 0
+    unknown = np.isnan(deadhead)
+    effective = np.where(unknown, 0, deadhead)
+    slack = gap - effective - min_turnaround
+    ok = slack >= 0
+    if unknown_policy == 'reject':
+        ok &= ~unknown
+
+    legs = []
+    for k in range(len(prev)):
+        a, b = prev[k], nxt[k]
+        legs.append({
+            'from_trip': int(endpoints.trip_ids[a]),
+            'to_trip': int(endpoints.trip_ids[b]),
+            'from_nass': endpoints.end_nass[a],
+            'to_nass': endpoints.start_nass[b],
+            'gap_minutes': None if np.isnan(gap[k]) else round(float(gap[k]), 1),
+            'deadhead_minutes': None if unknown[k] else round(float(deadhead[k]), 1),
+            'slack_minutes': None if np.isnan(slack[k]) else round(float(slack[k]), 1),
+            'feasible': bool(ok[k]) or bool(np.isnan(gap[k]))
+        })
+
+    return {
+        'feasible': all(leg['feasible'] for leg in legs),
+        'order': [int(endpoints.trip_ids[p]) for p in order],
+        'legs': legs,
+        'unknown_pairs': int(unknown.sum()),
+        'missing_trips': missing
+    }
+
+
+def feasible_successors(endpoints, trip_id, matrix, min_turnaround=0.0, unknown_policy='allow'):
+    """Every trip a driver could take after `trip_id`, with its slack in minutes"""
+    i = endpoints.position[trip_id]
+    gap = endpoints.start - endpoints.end[i]
+    deadhead = matrix.pair_minutes(endpoints.end_ordinals[i], endpoints.start_ordinals)
+    deadhead[endpoints.start_nass == endpoints.end_nass[i]] = 0
+    unknown = np.isnan(deadhead)
+    slack = gap - np.where(unknown, 0, deadhead) - min_turnaround
+    ok = slack >= 0
+    if unknown_policy == 'reject':
+        ok &= ~unknown
+    ok[i] = False
+    candidates = np.flatnonzero(ok)
+    candidates = candidates[np.argsort(slack[candidates], kind='stable')]
+    return [{
+        'trip_id': int(endpoints.trip_ids[j]),
+        'start_nass': endpoints.start_nass[j],
+        'deadhead_minutes': None if unknown[j] else round(float(deadhead[j]), 1),
+        'slack_minutes': round(float(slack[j]), 1)
+    } for j in candidates]
+
+
+class MatrixStore:
+    """Loads the matrix CSV on first use and reloads it when the file changes"""
+
+    def __init__(self, path, symmetric=True, lru_size=65536):
+        self.path = path
+        self.symmetric = symmetric
+        self.lru_size = lru_size
+        self._matrix = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The current matrix, or None when no matrix file is configured"""
+        if not self.path or not os.path.exists(self.path):
+            return None
+        mtime = os.path.getmtime(self.path)
+        with self._lock:
+            if self._matrix is None or mtime != self._mtime:
+                self._matrix = DeadheadMatrix.from_csv(self.path, self.symmetric, self.lru_size)
+                self._mtime = mtime
+            return self._matrix
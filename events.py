@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Server-Sent Events broker for upload progress and data change notifications
+Each subscriber gets a bounded queue. Events are appended to a shared SQLite log
+so that every worker process can relay them to its own subscribers.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Events that mean the data behind cached GET responses has changed
+CHANGE_EVENTS = {'contract.imported', 'shift.created', 'shift.deleted', 'shifts.bulk'}
+
+# Events that change the schedule rows themselves, rather than only shifts
+SCHEDULE_EVENTS = {'contract.imported'}
+
+# Other events (upload progress) are transient: they wait this long for the
+# write lock, then go to this worker's subscribers only. Events published with
+# durable=True (an upload's outcome) wait the normal busy timeout instead.
+TRANSIENT_WAIT_MS = 100
+
+
+class EventLog:
+    """Append-only event table shared by all worker processes"""
+
+    def __init__(self, connection_factory, retention=5000):
+        self.connection_factory = connection_factory
+        self.retention = retention
+        self._ready = False
+
+    def _ensure_tables(self, conn):
+        if self._ready:
+            return
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS app_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                origin TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS app_state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        # A fresh database restarts event ids, so it also gets a fresh epoch
+        conn.execute("INSERT OR IGNORE INTO app_state (key, value) VALUES ('epoch', ?)",
+                     (os.urandom(8).hex(),))
+        conn.commit()
+        self._ready = True
+
+    def append(self, event_type, data, origin, conn=None, busy_timeout_ms=None):
+        """Insert an event and commit; a given `conn` commits its open transaction with it
+
+        `busy_timeout_ms` shortens how long a write lock held elsewhere is waited for.
+        """
+        if conn is not None:
+            return self._append(conn, event_type, data, origin)
+        with self.connection_factory() as conn:
+            if busy_timeout_ms is None:
+                return self._append(conn, event_type, data, origin)
+            previous = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+            conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+            try:
+                return self._append(conn, event_type, data, origin)
+            finally:
+                conn.execute(f"PRAGMA busy_timeout = {int(previous)}")
+
+    def _append(self, conn, event_type, data, origin):
+        self._ensure_tables(conn)
+        cursor = conn.execute(
+            "INSERT INTO app_events (type, data, origin) VALUES (?, ?, ?)",
+            (event_type, json.dumps(data, default=str), origin)
+        )
+        event_id = cursor.lastrowid
+        if event_type in CHANGE_EVENTS:
+            conn.execute("INSERT OR REPLACE INTO app_state (key, value) VALUES ('generation', ?)",
+                         (str(event_id),))
+        if event_id % 100 == 0:
+            conn.execute("DELETE FROM app_events WHERE id <= ?", (event_id - self.retention,))
+        conn.commit()
+        return event_id
+
+    def since(self, last_id, limit=500):
+        with self.connection_factory() as conn:
+            self._ensure_tables(conn)
+            rows = conn.execute(
+                "SELECT id, type, data, origin FROM app_events WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, limit)
+            ).fetchall()
+        return [{'id': r[0], 'type': r[1], 'data': json.loads(r[2]), 'origin': r[3]} for r in rows]
+
+    def latest_id(self):
+        with self.connection_factory() as conn:
+            self._ensure_tables(conn)
+            row = conn.execute("SELECT MAX(id) FROM app_events").fetchone()
+        return row[0] or 0
+
+    def _state(self, key):
+        with self.connection_factory() as conn:
+            self._ensure_tables(conn)
+            row = conn.execute("SELECT value FROM app_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def epoch(self):
+        """Random token identifying this database file"""
+        return self._state('epoch')
+
+    def generation(self):
+        """Id of the most recent data change event"""
+        return int(self._state('generation') or 0)
+
+
+class EventBroker:
+    """Publish/subscribe hub feeding /api/events streams"""
+
+    def __init__(self, log=None, history_size=500, subscriber_queue_size=1000,
+                 heartbeat_seconds=15, poll_interval=1.0):
+        self.log = log
+        self.history_size = history_size
+        self.subscriber_queue_size = subscriber_queue_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_interval = poll_interval
+        self._token = os.urandom(4).hex()
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._relay = None
+
+    @property
+    def origin(self):
+        """Identifies this worker; forked workers share the token but not the pid"""
+        return f"{os.getpid()}-{self._token}"
+
+    def add_listener(self, callback):
+        """Call `callback(event)` for every event, local or relayed from another worker"""
+        self._listeners.append(callback)
+
+    def publish(self, event_type, data, conn=None, durable=False):
+        """Send an event to every connected subscriber, in this and other workers
+
+        With `conn`, the event is logged in that connection's open transaction,
+        so the caller's writes and the event are committed together.
+
+        Only change events must reach the log. Any other event that cannot be
+        logged (an import in this database holds the write lock) is delivered
+        locally without an id, which leaves the client's Last-Event-ID alone.
+        A `durable` event waits the full busy timeout before giving up, since
+        clients on other workers wait for it.
+        """
+        if self.log is not None:
+            required = event_type in CHANGE_EVENTS or conn is not None
+            try:
+                event_id = self.log.append(event_type, data, self.origin, conn=conn,
+                                           busy_timeout_ms=None if required or durable else TRANSIENT_WAIT_MS)
+            except sqlite3.OperationalError as e:
+                if required:
+                    raise
+                log = logger.warning if durable else logger.debug
+                log(f"Event {event_type} not logged ({e}); delivering locally")
+                event_id = None
+        else:
+            if conn is not None:
+                conn.commit()
+            with self._lock:
+                event_id = self._next_id
+                self._next_id += 1
+        self._deliver({'id': event_id, 'type': event_type, 'data': data})
+        return event_id
+
+    def _deliver(self, event):
+        with self._lock:
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Event listener failed: {e}")
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A stalled client is dropped; it reconnects and replays via Last-Event-ID
+                logger.warning("Dropping slow event subscriber")
+                self._unsubscribe(subscriber)
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                    subscriber.queue.append(None)
+                    subscriber.not_empty.notify()
+
+    def start_relay(self):
+        """Start relaying events published by other workers (idempotent, call after fork)"""
+        if self.log is None or self._relay is not None:
+            return
+        with self._lock:
+            if self._relay is not None:
+                return
+            self._relay = threading.Thread(target=self._relay_loop, name='event-relay', daemon=True)
+        self._relay.start()
+
+    def _relay_loop(self):
+        last_id = self.log.latest_id()
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                for event in self.log.since(last_id):
+                    last_id = event['id']
+                    # Our own events were delivered when they were published
+                    if event.pop('origin') != self.origin:
+                        self._deliver(event)
+            except Exception as e:
+                logger.error(f"Event relay error: {e}")
+
+    def subscribe(self, last_event_id=None):
+        """Register a subscriber queue, pre-filled with any events it missed
+
+        The queue is registered before the missed events are read, so an event
+        published in between reaches it live; replayed copies are dropped by id.
+        """
+        subscriber = queue.Queue(maxsize=self.subscriber_queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            history = list(self._history)
+        if last_event_id is None:
+            return subscriber
+
+        if self.log is not None:
+            missed = self.log.since(last_event_id, limit=self.subscriber_queue_size // 2)
+        else:
+            missed = [e for e in history if e['id'] is not None and e['id'] > last_event_id]
+        if not missed:
+            return subscriber
+        replayed = {event['id'] for event in missed}
+        with subscriber.mutex:
+            live = [event for event in subscriber.queue
+                    if event is None or event['id'] is None or event['id'] not in replayed]
+            subscriber.queue.clear()
+            for event in missed:
+                event.pop('origin', None)
+                subscriber.queue.append(event)
+            subscriber.queue.extend(live)
+            subscriber.not_empty.notify()
+        return subscriber
+
+    def _unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def stream(self, last_event_id=None):
+        """Generator of SSE-formatted text for one client connection"""
+        subscriber = self.subscribe(last_event_id)
+        try:
+            # Tell EventSource how long to wait before reconnecting
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = subscriber.get(timeout=self.heartbeat_seconds)
+                except queue.Empty:
+                    # Comment lines keep proxies from closing an idle connection
+                    yield f': heartbeat {int(time.time())}\n\n'
+                    continue
+                if event is None:
+                    break
+                yield format_sse(event)
+        finally:
+            self._unsubscribe(subscriber)
+
+
+def format_sse(event):
+    """Render one event in text/event-stream framing"""
+    payload = json.dumps(event['data'], separators=(',', ':'), default=str)
+    if event['id'] is None:
+        return f"event: {event['type']}\ndata: {payload}\n\n"
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
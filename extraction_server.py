@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Long-lived PDF extraction server
+tabula-py runs tabula-java inside the Python process through jpype, so a fresh
+extractor process pays for a JVM start on every upload. This server keeps one
+process, and therefore one warm JVM, alive on a local Unix socket and extracts
+document after document. The client starts it on demand, health-checks it and
+restarts it when it dies, hangs or has served `max_documents`.
+
+Protocol: one JSON request line per connection; the server answers with
+{"progress": {...}} lines followed by a final {"ok": ...} line.
+
+    python extraction_server.py serve    # run in the foreground
+    python extraction_server.py ping
+"""
+
+import argparse
+import fcntl
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+from config import BASE_DIR, get_config, configure_logging, resolve_path
+from profiling import profile_extraction
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionServerError(Exception):
+    """The server could not be reached or did not answer in time"""
+
+
+def _blank_pdf():
+    """A one-page empty PDF, extracted once at startup to bring the JVM up"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def resolve_socket_path(settings):
+    return resolve_path(settings.server_socket)
+
+
+# =============================================================================
+# Server
+# =============================================================================
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def _send(self, message):
+        self.wfile.write((json.dumps(message, default=str) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline() or b'{}')
+        except ValueError:
+            self._send({'ok': False, 'error': 'Malformed request'})
+            return
+
+        server = self.server
+        if request.get('op') == 'ping':
+            self._send({'ok': True, 'pid': os.getpid(), 'documents': server.documents,
+                        'uptime_seconds': round(time.monotonic() - server.started, 1)})
+            return
+        if request.get('op') != 'extract':
+            self._send({'ok': False, 'error': f"Unknown op {request.get('op')!r}"})
+            return
+
+        with server.slots:
+            started = time.perf_counter()
+            try:
+                extractor = server.extractor_class(
+                    request['pdf'],
+                    progress_callback=lambda event: self._send({'progress': event}),
+                    page_batch_size=server.page_batch_size
+                )
+                reply = {'ok': True}
+                if request.get('profile'):
+                    reply['output'], reply['profile'] = profile_extraction(
+                        get_config().profiling, extractor, request.get('output'),
+                        f"extract {os.path.basename(request['pdf'])}")
+                else:
+                    reply['output'] = extractor.extract_to_csv(request.get('output'))
+                reply['seconds'] = round(time.perf_counter() - started, 3)
+                reply['memory'] = extractor.memory
+                self._send(reply)
+            except Exception as e:
+                logger.error(f"Extraction of {request.get('pdf')} failed: {e}")
+                self._send({'ok': False, 'error': str(e)})
+
+        with server.count_lock:
+            server.documents += 1
+            recycle = server.max_documents and server.documents == server.max_documents
+        if recycle:
+            # Recycle before long-run JVM heap growth matters; the client starts a fresh one
+            logger.info(f"Served {server.documents} documents, exiting for a restart")
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+
+class ExtractionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, concurrency=2, max_documents=0, page_batch_size=10):
+        # Deferred so the app can import the client without pandas, tabula or a JVM
+        from trucking_schedule_extractor import TruckingScheduleExtractor
+        self.extractor_class = TruckingScheduleExtractor
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.max_documents = max_documents
+        self.page_batch_size = page_batch_size
+        self.documents = 0
+        # Handlers run on their own threads
+        self.count_lock = threading.Lock()
+        self.started = time.monotonic()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o600)
+
+    def warm_up(self):
+        import tabula
+        import tempfile
+        started = time.perf_counter()
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as blank:
+            blank.write(_blank_pdf())
+            blank.flush()
+            try:
+                tabula.read_pdf(blank.name, pages=1, silent=True)
+            except Exception as e:
+                logger.warning(f"JVM warm-up failed: {e}")
+        logger.info(f"Extraction server ready in {time.perf_counter() - started:.2f}s")
+
+
+def serve(settings):
+    socket_path = resolve_socket_path(settings)
+    server = ExtractionServer(
+        socket_path,
+        concurrency=settings.server_concurrency,
+        max_documents=settings.server_max_documents,
+        page_batch_size=settings.page_batch_size
+    )
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    with open(socket_path + '.pid', 'w') as f:
+        f.write(str(os.getpid()))
+    server.warm_up()
+    logger.info(f"Extraction server listening on {socket_path} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        for path in (socket_path, socket_path + '.pid'):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+# =============================================================================
+# Client
+# =============================================================================
+
+class ExtractionClient:
+    """Talks to the extraction server, starting or restarting it as needed"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.socket_path = resolve_socket_path(settings)
+        self.lock_path = self.socket_path + '.lock'
+        self._process = None
+        self._monitor = None
+        self.restarts = 0
+
+    def _request(self, message, timeout):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.socket_path)
+            sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+            with sock.makefile('rb') as reader:
+                for line in reader:
+                    yield json.loads(line)
+        except (OSError, ValueError) as e:
+            raise ExtractionServerError(f"Extraction server unavailable: {e}")
+        finally:
+            sock.close()
+
+    def ping(self, timeout=2):
+        """Server status, or None when it does not answer"""
+        try:
+            for reply in self._request({'op': 'ping'}, timeout):
+                return reply
+        except ExtractionServerError:
+            return None
+
+    def ensure_running(self):
+        """Start the server unless it is running; only one process may start it at a time
+
+        A server that is alive but not answering is left alone: it is shared by
+        every worker and may only be busy. The health monitor restarts it once
+        it has missed `server_max_missed_pings` pings in a row.
+        """
+        if self.ping():
+            return
+        with open(self.lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if self.ping():
+                return
+            if self._server_pid() is not None:
+                raise ExtractionServerError("Extraction server is running but not answering")
+            self._start()
+
+    def restart(self):
+        """Replace a server that has stopped answering, unless it has recovered meanwhile"""
+        with open(self.lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if self.ping():
+                return
+            self._start()
+
+    def stop(self, timeout=10):
+        """Shut down the server this client started, if any; servers started elsewhere keep running"""
+        if self._process is None or self._process.poll() is not None:
+            return
+        self._process.terminate()
+        try:
+            self._process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Extraction server (pid {self._process.pid}) ignored SIGTERM; killing it")
+            self._process.kill()
+            self._process.wait()
+
+    def _server_pid(self):
+        """Pid of the running server, whichever worker started it, or None if it has exited"""
+        if self._process is not None:
+            # Reap a server this worker started, so it does not linger as a zombie
+            self._process.poll()
+        try:
+            with open(self.socket_path + '.pid') as f:
+                pid = int(f.read().strip())
+            # A pid file left by a crash may name an unrelated process by now
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                if b'extraction_server.py' not in f.read():
+                    return None
+        except (OSError, ValueError):
+            return None
+        return pid
+
+    def _stop_stale(self):
+        """Kill a server that is alive but not answering"""
+        pid = self._server_pid()
+        if pid is None:
+            return
+        try:
+            os.kill(pid, signal.SIGKILL)
+            logger.warning(f"Killed unresponsive extraction server (pid {pid})")
+        except OSError:
+            pass
+        if self._process is not None:
+            self._process.poll()
+
+    def _start(self):
+        self._stop_stale()
+        logger.info("Starting extraction server")
+        self._process = subprocess.Popen(
+            [sys.executable, os.path.join(BASE_DIR, 'extraction_server.py'), 'serve'],
+            cwd=BASE_DIR, stdout=subprocess.DEVNULL, start_new_session=True
+        )
+        self.restarts += 1
+        deadline = time.monotonic() + self.settings.server_start_timeout_seconds
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise ExtractionServerError(f"Extraction server exited with code {self._process.returncode}")
+            if self.ping():
+                return
+            time.sleep(0.2)
+        self._process.kill()
+        raise ExtractionServerError("Extraction server did not become ready in time")
+
+    def extract(self, pdf_path, output_path, on_progress=None, timeout=None, profile=False):
+        """Extract a PDF to CSV on the server, forwarding its progress events"""
+        self.ensure_running()
+        request = {'op': 'extract', 'pdf': os.path.abspath(pdf_path), 'output': os.path.abspath(output_path),
+                   'profile': profile}
+        # The timeout bounds the silence between progress events, not the whole document.
+        # Running out of it (perhaps only queued behind other documents) fails this
+        # extraction alone: the server is shared, so only the health monitor restarts it.
+        for reply in self._request(request, timeout or self.settings.extract_timeout_seconds):
+            if 'progress' in reply:
+                if on_progress:
+                    on_progress(reply['progress'])
+                continue
+            return reply
+        raise ExtractionServerError("Extraction server closed the connection without a result")
+
+    def start_monitor(self):
+        """Ping the server periodically and restart it if it stops answering"""
+        if self._monitor is not None:
+            return
+        self._monitor = threading.Thread(target=self._monitor_loop, name='extraction-health', daemon=True)
+        self._monitor.start()
+
+    def _monitor_loop(self):
+        missed = 0
+        while True:
+            try:
+                if self.ping():
+                    missed = 0
+                elif self._server_pid() is None:
+                    # Exited (crashed, or recycled after max_documents): start a fresh one
+                    missed = 0
+                    self.ensure_running()
+                else:
+                    missed += 1
+                    logger.warning(f"Extraction server missed {missed} health check(s)")
+                    if missed >= self.settings.server_max_missed_pings:
+                        missed = 0
+                        self.restart()
+            except Exception as e:
+                logger.error(f"Extraction server health check failed: {e}")
+            time.sleep(self.settings.server_health_check_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Long-lived PDF extraction server')
+    parser.add_argument('command', choices=['serve', 'ping'])
+    args = parser.parse_args()
+
+    config = get_config()
+    configure_logging(config.logging, fmt='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'serve':
+        serve(config.extraction)
+    else:
+        status = ExtractionClient(config.extraction).ping()
+        print(json.dumps(status) if status else "Extraction server is not running")
+        sys.exit(0 if status else 1)
+
+
+if __name__ == '__main__':
+    main()
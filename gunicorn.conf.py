@@ -0,0 +1,22 @@
+"""
+Gunicorn settings for the production server (started by serve.py)
+Host and port come from the `app` section of config.json, sizing from `server`
+"""
+
+from config import get_config
+
+_config = get_config()
+
+bind = f"{_config.app.host}:{_config.app.port}"
+
+# Threaded workers: SQLite calls block a request thread, not the whole worker,
+# and each open /api/events stream holds one thread
+worker_class = 'gthread'
+workers = _config.server.workers
+threads = _config.server.threads
+
+timeout = _config.server.timeout
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Learned page-layout templates for schedule PDFs
+Column x-boundaries are inferred once from pdfplumber word coordinates on page 1
+(the header row plus the whitespace gutters between data columns). Later pages,
+and later documents with the same layout, are sliced into fields by position
+instead of being re-parsed with regular expressions.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Every row carries all of these so the importer always finds its columns
+FIELDS = [
+    'trip_id', 'stop_number', 'nass_code', 'facility', 'arrive_time',
+    'load_unload_duration', 'depart_time', 'vehicle_type', 'vehicle_id',
+    'frequency', 'effective_date', 'expiration_date'
+]
+
+# Header label keywords, checked in order; the first unclaimed field matching wins
+HEADER_KEYWORDS = [
+    ('trip_id', ('trip',)),
+    ('stop_number', ('stop',)),
+    ('nass_code', ('nass',)),
+    ('load_unload_duration', ('load', 'unload', 'dur')),
+    ('arrive_time', ('arr',)),
+    ('depart_time', ('dep',)),
+    ('vehicle_type', ('type',)),
+    ('vehicle_id', ('vehicle', 'equip')),
+    ('frequency', ('freq',)),
+    ('effective_date', ('eff',)),
+    ('expiration_date', ('exp',)),
+    ('facility', ('facility', 'name', 'location')),
+]
+
+REQUIRED_FIELDS = ('trip_id', 'stop_number', 'facility')
+LINE_TOLERANCE = 3.0
+CONTINUATION_GAP = 14.0
+LEARNING_ROWS = 200
+DIGITS = re.compile(r'^\d+$')
+
+
+def group_lines(words: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Group pdfplumber words into visual lines, each ordered left to right"""
+    lines = []
+    for word in sorted(words, key=lambda w: (round(w['top']), w['x0'])):
+        if lines and abs(word['top'] - lines[-1][0]['top']) <= LINE_TOLERANCE:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    for line in lines:
+        line.sort(key=lambda w: w['x0'])
+    return lines
+
+
+def _is_data_line(line) -> bool:
+    return len(line) >= 2 and DIGITS.match(line[0]['text']) and DIGITS.match(line[1]['text'])
+
+
+def _is_header_line(line) -> bool:
+    text = ' '.join(w['text'] for w in line).lower()
+    return 'trip' in text and 'stop' in text
+
+
+def _header_key(header_words, page_width) -> str:
+    text = ' '.join(w['text'].lower() for w in sorted(header_words, key=lambda w: w['x0']))
+    return f"{re.sub(r'[^a-z0-9 ]', '', text)}@{round(page_width)}"
+
+
+class LayoutTemplate:
+    """Column boundaries and the field each column holds"""
+
+    def __init__(self, boundaries: List[float], fields: List[Optional[str]], key: str = ''):
+        # boundaries[i] separates column i from column i + 1
+        self.boundaries = boundaries
+        self.fields = fields
+        self.key = key
+
+    def to_dict(self):
+        return {'boundaries': self.boundaries, 'fields': self.fields, 'key': self.key}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['boundaries'], data['fields'], data.get('key', ''))
+
+    @classmethod
+    def learn(cls, words: List[Dict[str, Any]], page_width: float) -> Optional['LayoutTemplate']:
+        """Infer a template from one page, or None if it has no recognisable header and rows"""
+        lines = group_lines(words)
+        header_index = next((i for i, line in enumerate(lines) if _is_header_line(line)), None)
+        if header_index is None:
+            return None
+
+        # The header band runs from the header line down to the first data row,
+        # so stacked labels such as "Trip" over "ID #" are kept together
+        header_words = []
+        data_lines = []
+        for line in lines[header_index:]:
+            if _is_data_line(line):
+                data_lines.append(line)
+                if len(data_lines) >= LEARNING_ROWS:
+                    break
+            elif not data_lines:
+                header_words.extend(line)
+        if not data_lines:
+            return None
+
+        # Columns are the x-ranges covered by header or data text; gutters separate them
+        spans = sorted((w['x0'], w['x1']) for line in data_lines for w in line)
+        spans += sorted((w['x0'], w['x1']) for w in header_words)
+        spans.sort()
+        blocks = []
+        for x0, x1 in spans:
+            if blocks and x0 <= blocks[-1][1]:
+                blocks[-1][1] = max(blocks[-1][1], x1)
+            else:
+                blocks.append([x0, x1])
+
+        labels = [[] for _ in blocks]
+        starts = [b[0] for b in blocks]
+        for word in sorted(header_words, key=lambda w: (w['top'], w['x0'])):
+            center = (word['x0'] + word['x1']) / 2
+            labels[max(0, bisect_right(starts, center) - 1)].append(word['text'])
+
+        # A block with no label holds overflow from the labelled column to its left
+        columns = []
+        for block, label in zip(blocks, labels):
+            if not label and columns:
+                columns[-1][0][1] = block[1]
+            else:
+                columns.append([block, ' '.join(label)])
+
+        fields = []
+        claimed = set()
+        for _, label in columns:
+            lowered = label.lower()
+            field = None
+            for name, keywords in HEADER_KEYWORDS:
+                if name not in claimed and any(k in lowered for k in keywords):
+                    field = name
+                    break
+            if field:
+                claimed.add(field)
+            fields.append(field)
+
+        if not all(name in claimed for name in REQUIRED_FIELDS):
+            logger.info(f"Layout not recognised; header columns: {[label for _, label in columns]}")
+            return None
+
+        boundaries = [(columns[i][0][1] + columns[i + 1][0][0]) / 2 for i in range(len(columns) - 1)]
+        return cls(boundaries, fields, _header_key(header_words, page_width))
+
+    def _slice(self, line) -> List[List[str]]:
+        cells = [[] for _ in self.fields]
+        for word in line:
+            center = (word['x0'] + word['x1']) / 2
+            cells[bisect_right(self.boundaries, center)].append(word['text'])
+        return cells
+
+    def parse_page(self, words: List[Dict[str, Any]]):
+        """Yield (fields, raw_text) for each schedule row, and (None, raw_text) for
+        lines that look like rows but do not fit the template"""
+        pending = None
+        pending_bottom = 0.0
+        for line in group_lines(words):
+            cells = self._slice(line)
+            raw = ' '.join(w['text'] for w in line)
+            row = {field: ' '.join(cell) for field, cell in zip(self.fields, cells) if field}
+
+            if DIGITS.match(row.get('trip_id', '')) and DIGITS.match(row.get('stop_number', '')):
+                if pending:
+                    yield pending
+                pending = (row, raw)
+                pending_bottom = line[0]['bottom']
+            elif (pending and not row.get('trip_id') and not row.get('stop_number')
+                    and line[0]['top'] - pending_bottom <= CONTINUATION_GAP):
+                # A wrapped cell, e.g. a long facility name on two lines
+                for field, value in row.items():
+                    if value:
+                        pending[0][field] = f"{pending[0].get(field, '')} {value}".strip()
+                pending = (pending[0], f"{pending[1]} {raw}")
+                pending_bottom = line[0]['bottom']
+            else:
+                if pending:
+                    yield pending
+                    pending = None
+                if _is_data_line(line):
+                    yield None, raw
+        if pending:
+            yield pending
+
+
+class LayoutTemplateCache:
+    """Templates keyed by header layout, persisted as JSON so every extractor process shares them"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._templates = None
+        self._lock = threading.Lock()
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable layout cache {self.path}: {e}")
+            return {}
+
+    def _load(self):
+        if self._templates is None:
+            self._templates = self._read()
+        return self._templates
+
+    def template_for(self, words: List[Dict[str, Any]], page_width: float) -> Optional[LayoutTemplate]:
+        """The cached template for this page's header, learning and storing it if new"""
+        lines = group_lines(words)
+        header_index = next((i for i, line in enumerate(lines) if _is_header_line(line)), None)
+        if header_index is None:
+            return None
+        header_words = []
+        for line in lines[header_index:]:
+            if _is_data_line(line):
+                break
+            header_words.extend(line)
+        key = _header_key(header_words, page_width)
+
+        with self._lock:
+            cached = self._load().get(key)
+        if cached:
+            return LayoutTemplate.from_dict(cached)
+
+        template = LayoutTemplate.learn(words, page_width)
+        if template is None:
+            return None
+        logger.info(f"Learned layout template {key!r}: {template.fields}")
+        with self._lock:
+            self._load()[key] = template.to_dict()
+            self._save()
+        return template
+
+    def _save(self):
+        """Merge our templates into the file, keeping ones other processes learned meanwhile"""
+        if not self.path:
+            return
+        try:
+            # The file itself is replaced on every save, so the lock lives beside it
+            with open(self.path + '.lock', 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                merged = self._read()
+                merged.update(self._templates)
+                f = tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(self.path)),
+                                                prefix='.layout-', suffix='.tmp', delete=False)
+                try:
+                    with f:
+                        json.dump(merged, f, indent=2)
+                    os.replace(f.name, self.path)
+                except OSError:
+                    os.unlink(f.name)
+                    raise
+            self._templates = merged
+        except OSError as e:
+            logger.warning(f"Could not save layout cache {self.path}: {e}")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Load test for the trucking schedule API
+Measures throughput and latency, optionally across several gunicorn worker counts
+
+Examples:
+    python load_test.py --url http://127.0.0.1:5000
+    python load_test.py --workers 1 2 4 8 --bust-cache
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from itertools import count
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATHS = ['/api/trips-with-status', '/api/shifts', '/api/trips']
+
+
+def run_load(base_url, paths, concurrency, duration, bust_cache):
+    """Hammer `paths` from `concurrency` threads for `duration` seconds"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = count()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        local_latencies = []
+        local_errors = 0
+        while time.monotonic() < deadline:
+            n = next(counter)
+            path = paths[n % len(paths)]
+            if bust_cache:
+                # A unique query string defeats the response cache, so every request hits SQLite
+                path += ('&' if '?' in path else '?') + f'_lt={n}'
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + path, timeout=30) as response:
+                    response.read()
+                local_latencies.append(time.perf_counter() - started)
+            except (urllib.error.URLError, OSError):
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99)
+    }
+
+
+def wait_for_server(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + '/api/shifts', timeout=2):
+                return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.3)
+    return False
+
+
+def start_server(workers, port):
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+           '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+           '--access-logfile', '/dev/null', 'wsgi:app']
+    return subprocess.Popen(cmd, cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def print_row(label, result):
+    print(f"{label:>8} {result['rps']:>10.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+          f"{result['p99_ms']:>9.1f} {result['requests']:>9} {result['errors']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the trucking schedule API')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Server to test when --workers is not given')
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS, help='Request paths to rotate through')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client threads')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per measurement')
+    parser.add_argument('--bust-cache', action='store_true', help='Bypass the response cache')
+    parser.add_argument('--workers', type=int, nargs='+', help='Start gunicorn with each worker count and compare')
+    parser.add_argument('--port', type=int, default=5099, help='Port for servers started with --workers')
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'requests':>9} {'errors':>7}")
+
+    if not args.workers:
+        print_row('-', run_load(args.url, args.paths, args.concurrency, args.duration, args.bust_cache))
+        return
+
+    base_url = f'http://127.0.0.1:{args.port}'
+    for workers in args.workers:
+        server = start_server(workers, args.port)
+        try:
+            if not wait_for_server(base_url):
+                print(f"{workers:>8} server did not start")
+                continue
+            # Warm up connections and caches before measuring
+            run_load(base_url, args.paths, args.concurrency, 2, args.bust_cache)
+            print_row(str(workers), run_load(base_url, args.paths, args.concurrency,
+                                             args.duration, args.bust_cache))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Memory accounting and a spill-to-disk row buffer for PDF extraction
+The extractor hands over parsed rows one table or page batch at a time. They
+stay in memory until the extraction has grown the process past its memory
+budget. Then the buffered rows are sorted and written to a temporary run file,
+and the final CSV is a k-way merge of the runs. A large schedule therefore
+costs disk, not an OOM kill.
+The budget is measured from the RSS when the extraction starts, so memory that
+was already resident (the extraction server's JVM, other documents in flight)
+does not count against it.
+"""
+
+import csv
+import gc
+import heapq
+import logging
+import math
+import os
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+SORT_COLUMNS = ('trip_id', 'stop_number')
+# Spilling tiny runs would trade memory for thousands of open files in the merge
+MIN_SPILL_ROWS = 1000
+# Most run files open at once; more runs are merged in passes of this many
+MERGE_FAN_IN = 64
+
+
+def current_rss_bytes():
+    """Resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryTracker:
+    """Peak RSS (and optionally tracemalloc peak) per named phase of one extraction"""
+
+    def __init__(self, budget_mb=0, use_tracemalloc=False, sample_ms=50):
+        self.budget_bytes = int(budget_mb * MB)
+        self.use_tracemalloc = use_tracemalloc
+        self.sample_interval = sample_ms / 1000
+        self.phases = {}
+        # The budget covers what the extraction adds on top of this
+        self.baseline_rss = current_rss_bytes()
+        self.peak_rss = self.baseline_rss
+        self._phase = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if self.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._sampler = threading.Thread(target=self._sample_loop, name='memory-sampler', daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.sample_interval):
+            self.sample()
+
+    def sample(self):
+        """Record the current RSS against the running phase; returns it"""
+        rss = current_rss_bytes()
+        self.peak_rss = max(self.peak_rss, rss)
+        phase = self._phase
+        if phase is not None:
+            phase['peak_rss'] = max(phase['peak_rss'], rss)
+        return rss
+
+    @contextmanager
+    def phase(self, name):
+        """Attribute memory used inside the with-block to `name`"""
+        previous = self._phase
+        phase = self.phases.setdefault(name, {'peak_rss': 0, 'peak_traced': 0, 'seconds': 0.0})
+        self._phase = phase
+        if self.use_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        self.sample()
+        try:
+            yield
+        finally:
+            self.sample()
+            phase['seconds'] += time.perf_counter() - started
+            if self.use_tracemalloc and tracemalloc.is_tracing():
+                phase['peak_traced'] = max(phase['peak_traced'], tracemalloc.get_traced_memory()[1])
+            self._phase = previous
+
+    def over_budget(self):
+        return bool(self.budget_bytes) and self.sample() - self.baseline_rss > self.budget_bytes
+
+    def summary(self):
+        """Peak memory per phase in MB, for the extraction summary and server replies"""
+        phases = {}
+        for name, phase in self.phases.items():
+            phases[name] = {'peak_rss_mb': round(phase['peak_rss'] / MB, 1), 'seconds': round(phase['seconds'], 3)}
+            if self.use_tracemalloc:
+                phases[name]['peak_traced_mb'] = round(phase['peak_traced'] / MB, 1)
+        return {
+            'peak_rss_mb': round(self.peak_rss / MB, 1),
+            'baseline_rss_mb': round(self.baseline_rss / MB, 1),
+            'budget_mb': round(self.budget_bytes / MB, 1) if self.budget_bytes else None,
+            'phases': phases
+        }
+
+
+def _sort_key(row):
+    """Numeric (trip_id, stop_number) with blanks last, like DataFrame.sort_values"""
+    key = []
+    for column in SORT_COLUMNS:
+        try:
+            value = float(row.get(column) or 'nan')
+        except ValueError:
+            value = math.nan
+        key.extend((math.isnan(value), 0.0 if math.isnan(value) else value))
+    return key
+
+
+class SpillingRowBuffer:
+    """Collects row batches and writes them as one CSV sorted by trip and stop
+
+    `extra_columns` (the contract header fields) are added to each batch as it
+    arrives. When the tracker reports the memory budget exceeded, buffered
+    batches are sorted and spilled to a run file in `spill_dir`.
+    """
+
+    def __init__(self, tracker, extra_columns=None, spill_dir=None, on_spill=None):
+        self.tracker = tracker
+        self.extra_columns = extra_columns or {}
+        self.spill_dir = spill_dir
+        self.on_spill = on_spill
+        self.columns = []
+        self.rows = 0
+        self.trip_ids = set()
+        self.spilled_rows = 0
+        self._batches = []
+        self._buffered_rows = 0
+        self._runs = []
+
+    def add(self, df):
+        """Take ownership of one batch of parsed rows"""
+        df = df.dropna(how='all')
+        if df.empty:
+            return
+        for key, value in self.extra_columns.items():
+            df[f'contract_{key}'] = value
+        for column in SORT_COLUMNS:
+            if column in df.columns:
+                df[column] = pd.to_numeric(df[column], errors='coerce')
+        for column in df.columns:
+            if column not in self.columns:
+                self.columns.append(column)
+        if 'trip_id' in df.columns:
+            self.trip_ids.update(df['trip_id'].dropna().unique().tolist())
+        self.rows += len(df)
+        self._batches.append(df)
+        self._buffered_rows += len(df)
+        if self._buffered_rows >= MIN_SPILL_ROWS and self.tracker.over_budget():
+            self.spill()
+
+    def _sorted_buffer(self):
+        df = pd.concat(self._batches, ignore_index=True)
+        self._batches = []
+        self._buffered_rows = 0
+        if all(column in df.columns for column in SORT_COLUMNS):
+            df = df.sort_values(list(SORT_COLUMNS))
+        return df
+
+    def spill(self):
+        """Write the buffered rows to a sorted run file and release them"""
+        if not self._batches:
+            return
+        df = self._sorted_buffer()
+        fd, path = tempfile.mkstemp(prefix='extract-run-', suffix='.csv', dir=self.spill_dir)
+        with os.fdopen(fd, 'w', newline='') as f:
+            df.to_csv(f, index=False)
+        self._runs.append(path)
+        self.spilled_rows += len(df)
+        logger.info(f"Memory budget reached: spilled {len(df)} rows to {path}")
+        if self.on_spill:
+            self.on_spill(len(df))
+        del df
+        gc.collect()
+
+    def clear(self):
+        """Drop everything collected so far (before retrying with another parser)"""
+        self._batches = []
+        self._buffered_rows = 0
+        self.columns = []
+        self.rows = 0
+        self.spilled_rows = 0
+        self.trip_ids = set()
+        self._remove_runs()
+
+    def _remove_runs(self):
+        for path in self._runs:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        self._runs = []
+
+    def _merge(self, paths, output_path):
+        """Stream-merge sorted run files into one sorted CSV with every column"""
+        files = [open(path, newline='') for path in paths]
+        try:
+            readers = [csv.DictReader(f) for f in files]
+            with open(output_path, 'w', newline='') as out:
+                writer = csv.DictWriter(out, fieldnames=self.columns, restval='')
+                writer.writeheader()
+                writer.writerows(heapq.merge(*readers, key=_sort_key))
+        finally:
+            for f in files:
+                f.close()
+
+    def write(self, output_path):
+        """Write every collected row to output_path, sorted by trip_id and stop_number"""
+        try:
+            if not self._runs:
+                df = self._sorted_buffer() if self._batches else pd.DataFrame(columns=self.columns)
+                df.to_csv(output_path, index=False)
+                return
+            self.spill()
+            # Each run is sorted, so a streaming merge keeps memory flat; merging
+            # at most MERGE_FAN_IN runs at a time bounds the open files
+            while len(self._runs) > MERGE_FAN_IN:
+                group, rest = self._runs[:MERGE_FAN_IN], self._runs[MERGE_FAN_IN:]
+                fd, path = tempfile.mkstemp(prefix='extract-run-', suffix='.csv', dir=self.spill_dir)
+                os.close(fd)
+                self._runs = rest + [path]
+                self._merge(group, path)
+                for run in group:
+                    os.unlink(run)
+            self._merge(self._runs, output_path)
+        finally:
+            self._remove_runs()
+
+    def head(self, output_path, rows=5):
+        return pd.read_csv(output_path, nrows=rows) if self.rows else pd.DataFrame(columns=self.columns)
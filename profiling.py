@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Opt-in profiling for requests and PDF extraction
+A request is profiled when it carries the configured header or query flag, or
+is picked by the sampling rate. Profiles are written to `profiling.directory`
+as .pstats files (cProfile) or .collapsed stack files (sampling, ready for
+flamegraph.pl or speedscope), each with a small .json description. With
+profiling disabled the middleware is never installed, so requests pay nothing.
+
+    python -m pstats profiles/<name>.pstats
+"""
+
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from config import resolve_path
+
+logger = logging.getLogger(__name__)
+
+# Set in the WSGI environ when the client asked for a profile, so work the
+# request hands off (such as extraction) can be profiled too
+PROFILE_REQUESTED = 'scheduler.profile_requested'
+PROFILE_EXTENSIONS = ('.pstats', '.collapsed')
+
+# On Python 3.12+ cProfile hooks sys.monitoring, which is process-wide, so a
+# second concurrent cProfile session fails. Only one runs at a time; the
+# others use the sampling profiler.
+_cprofile_lock = threading.Lock()
+
+
+class Sampler:
+    """Samples one thread's Python stack at a fixed interval"""
+
+    def __init__(self, thread_id, interval_ms=5):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+
+class ProfileStore:
+    """Profile files in one directory, pruned to the newest `retention`"""
+
+    def __init__(self, directory, retention=50):
+        self.directory = directory
+        self.retention = retention
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, settings):
+        return cls(resolve_path(settings.directory), settings.retention)
+
+    def new_name(self, label):
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')[:60] or 'profile'
+        # Microseconds keep names, and so retention order, sortable within a second
+        return f"{datetime.now():%Y%m%d-%H%M%S-%f}-{slug}-{uuid.uuid4().hex[:6]}"
+
+    def save(self, name, label, seconds, profiler=None, stacks=None):
+        """Write a cProfile profiler or a Counter of collapsed stacks"""
+        os.makedirs(self.directory, exist_ok=True)
+        if profiler is not None:
+            filename = name + '.pstats'
+            profiler.dump_stats(os.path.join(self.directory, filename))
+        else:
+            filename = name + '.collapsed'
+            with open(os.path.join(self.directory, filename), 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.directory, name + '.json'), 'w') as f:
+            json.dump({
+                'name': name,
+                'file': filename,
+                'label': label,
+                'duration_ms': round(seconds * 1000, 1),
+                'created_at': datetime.now().isoformat(timespec='seconds')
+            }, f)
+        self._prune()
+        logger.info(f"Saved profile {filename} for {label} ({seconds * 1000:.0f} ms)")
+        return filename
+
+    def list(self):
+        """Saved profiles, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for entry in os.listdir(self.directory):
+            if not entry.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, entry)) as f:
+                    meta = json.load(f)
+                meta['size_bytes'] = os.path.getsize(os.path.join(self.directory, meta['file']))
+            except (OSError, ValueError, KeyError):
+                continue
+            profiles.append(meta)
+        profiles.sort(key=lambda meta: meta['name'], reverse=True)
+        return profiles
+
+    def path(self, filename):
+        """Full path of a saved profile file, or None if there is no such profile"""
+        if os.path.basename(filename) != filename or not filename.endswith(PROFILE_EXTENSIONS):
+            return None
+        path = os.path.join(self.directory, filename)
+        return path if os.path.exists(path) else None
+
+    def _prune(self):
+        with self._lock:
+            for meta in self.list()[self.retention:]:
+                for filename in (meta['file'], meta['name'] + '.json'):
+                    try:
+                        os.unlink(os.path.join(self.directory, filename))
+                    except OSError:
+                        pass
+
+
+class Profile:
+    """Profiles the calling thread between start() and stop(), then saves the result"""
+
+    def __init__(self, store, label, mode='cprofile', interval_ms=5):
+        self.store = store
+        self.label = label
+        self.mode = mode
+        self.interval_ms = interval_ms
+        self.name = store.new_name(label)
+        self.filename = None
+        self._profiler = None
+        self._sampler = None
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        if self.mode != 'sample' and _cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:
+                # Another profiler (not one of ours) holds the hook
+                _cprofile_lock.release()
+                logger.info(f"cProfile unavailable for {self.label} ({e}); sampling instead")
+            else:
+                self._profiler = profiler
+                return self
+        elif self.mode != 'sample':
+            logger.info(f"Another cProfile session is running; sampling {self.label} instead")
+        self._sampler = Sampler(threading.get_ident(), self.interval_ms)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        if self._started is None:
+            return None
+        seconds = time.perf_counter() - self._started
+        self._started = None
+        try:
+            if self._profiler is not None:
+                try:
+                    self._profiler.disable()
+                finally:
+                    _cprofile_lock.release()
+                self.filename = self.store.save(self.name, self.label, seconds, profiler=self._profiler)
+            else:
+                self.filename = self.store.save(self.name, self.label, seconds, stacks=self._sampler.stop())
+        except OSError as e:
+            logger.warning(f"Could not save profile for {self.label}: {e}")
+        return self.filename
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+class _ProfiledBody:
+    """A WSGI response body that stops its profile once the server has sent it"""
+
+    def __init__(self, body, profile):
+        self.body = body
+        self.profile = profile
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.profile.stop()
+
+
+class ProfilingMiddleware:
+    """Wraps a WSGI app; profiles requests that ask for it or are sampled.
+
+    The profile covers the whole response, including streamed bodies, and its
+    name is returned in an X-Profile-Id header.
+    """
+
+    def __init__(self, wsgi_app, store, settings):
+        self.wsgi_app = wsgi_app
+        self.store = store
+        self.settings = settings
+        self.environ_header = 'HTTP_' + settings.header.upper().replace('-', '_')
+
+    def requested(self, environ):
+        if environ.get(self.environ_header, '').lower() in ('1', 'true', 'yes'):
+            return True
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        return query.get(self.settings.query_flag, [''])[0].lower() in ('1', 'true', 'yes')
+
+    def __call__(self, environ, start_response):
+        requested = self.requested(environ)
+        if not requested and not (self.settings.sample_rate and random.random() < self.settings.sample_rate):
+            return self.wsgi_app(environ, start_response)
+
+        environ[PROFILE_REQUESTED] = requested
+        profile = Profile(self.store, f"{environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')}",
+                          mode=self.settings.mode, interval_ms=self.settings.sample_interval_ms)
+
+        def profiled_start_response(status, headers, exc_info=None):
+            return start_response(status, list(headers) + [('X-Profile-Id', profile.name)], exc_info)
+
+        try:
+            profile.start()
+            body = self.wsgi_app(environ, profiled_start_response)
+        except Exception:
+            profile.stop()
+            raise
+        return _ProfiledBody(body, profile)
+
+
+def profile_extraction(settings, extractor, output_path, label):
+    """Run extractor.extract_to_csv under a profile; returns (output, profile file)"""
+    profile = Profile(ProfileStore.from_config(settings), label,
+                      mode=settings.mode, interval_ms=settings.sample_interval_ms)
+    with profile:
+        output = extractor.extract_to_csv(output_path)
+    return output, profile.filename
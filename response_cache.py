@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+In-memory HTTP response cache for the MVP API
+GET responses are keyed on a data generation counter that is bumped on every write
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, make_response, g
+
+
+class ResponseCache:
+    """LRU cache of rendered GET responses, invalidated by a generation counter"""
+
+    def __init__(self, max_entries=256, max_entry_bytes=32 * 1024 * 1024, instance_id=None):
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        # Without a shared id, generations restart with the process and so must its ETags
+        self.instance_id = instance_id or os.urandom(8).hex()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def bump(self, generation=None):
+        """Invalidate every cached response after the underlying data changed
+
+        Workers sharing an event log pass the change event id, so every
+        process agrees on the generation and therefore on ETags.
+        """
+        with self._lock:
+            if generation is None:
+                self._generation += 1
+            elif generation > self._generation:
+                self._generation = generation
+            else:
+                return self._generation
+            # Entries from older generations can never be hit again
+            self._entries.clear()
+            return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            # Drop responses rendered while a write was in flight
+            if key[-1] != self._generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'generation': self._generation,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+def make_etag(cache, key):
+    """Derive a strong ETag from the cache key alone, so 304s need no rendering"""
+    raw = repr((cache.instance_id,) + key).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()[:20]
+
+
+def skip_response_cache():
+    """Mark the current response as uncacheable (e.g. an error fallback)"""
+    g.skip_response_cache = True
+
+
+def _request_variant():
+    """Negotiated representation, so JSON/NDJSON and gzip/identity never collide"""
+    return (request.headers.get('Accept', ''), 'gzip' in request.accept_encodings)
+
+
+def _vary_on_variant(response):
+    """The cache key depends on Accept and Accept-Encoding, so shared caches must too"""
+    response.vary.add('Accept')
+    response.vary.add('Accept-Encoding')
+
+
+def _replayed_headers(response):
+    """Headers a cached copy has to send again for the body to be read correctly"""
+    return {name: response.headers[name]
+            for name in ('Content-Encoding', 'Vary') if name in response.headers}
+
+
+def _tee_into_cache(cache, key, response):
+    """Pass a streamed body through while collecting it for the cache"""
+    body = response.response
+    headers = _replayed_headers(response)
+    mimetype = response.mimetype
+
+    def generate():
+        parts = []
+        size = 0
+        for chunk in body:
+            if parts is not None:
+                size += len(chunk)
+                if size > cache.max_entry_bytes:
+                    parts = None
+                else:
+                    parts.append(chunk)
+            yield chunk
+        if parts is not None:
+            cache.put(key, {'body': b''.join(parts), 'mimetype': mimetype, 'headers': headers})
+
+    response.response = generate()
+    return response
+
+
+def cached_response(cache):
+    """Decorator serving GET responses from `cache` with ETag/304 support"""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            key = (request.path, request.query_string, _request_variant(), cache.generation)
+            etag = make_etag(cache, key)
+
+            if etag in request.if_none_match:
+                response = make_response('', 304)
+                _vary_on_variant(response)
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+
+            entry = cache.get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or g.get('skip_response_cache'):
+                    return response
+                _vary_on_variant(response)
+                if response.is_streamed:
+                    # Keep streaming the first load; the cache fills once it completes
+                    response.set_etag(etag)
+                    response.headers['Cache-Control'] = 'no-cache'
+                    return _tee_into_cache(cache, key, response)
+                entry = {
+                    'body': response.get_data(),
+                    'mimetype': response.mimetype,
+                    'headers': _replayed_headers(response)
+                }
+                cache.put(key, entry)
+
+            response = make_response(entry['body'], 200)
+            response.mimetype = entry['mimetype']
+            response.headers.update(entry['headers'])
+            response.set_etag(etag)
+            # Browsers must revalidate, which costs them a 304 at most
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        return wrapper
+
+    return decorator
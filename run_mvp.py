@@ -7,19 +7,24 @@ import subprocess
 import sys
 import os
 
+from config import get_config, resolve_path
+
 def main():
     print("🚛 Trucking Schedule MVP")
     print("=" * 40)
     
+    config = get_config()
+    
     # Check if database exists
-    if os.path.exists('trucking_schedule.db'):
+    if os.path.exists(resolve_path(config.database.path)):
         print("✅ Database found")
     else:
         print("⚠️  No database found - upload a PDF to get started")
     
-    print("🌐 Starting server at http://localhost:5000")
-    print("📤 Upload PDFs at http://localhost:5000/upload")
-    print("🗂️  Manage trips at http://localhost:5000/trips")
+    port = config.app.port
+    print(f"🌐 Starting server at http://localhost:{port}")
+    print(f"📤 Upload PDFs at http://localhost:{port}/upload")
+    print(f"🗂️  Manage trips at http://localhost:{port}/trips")
     print("-" * 40)
     print("Press Ctrl+C to stop the server")
     print()
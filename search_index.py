@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Full-text search over schedule stops
+An FTS5 index on facility, NASS code, vehicle id and the raw PDF row text.
+The importer indexes the rows it inserts; the app queries it for /api/search.
+"""
+
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# External content: the index stores only tokens, text is read back from `schedule`.
+# prefix='2 3' keeps short prefix queries like "AT*" off the full term scan.
+FTS_TABLE_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS schedule_fts USING fts5(
+    facility, nass_code, vehicle_id, raw_data,
+    content='schedule', content_rowid='id',
+    prefix='2 3',
+    tokenize='unicode61 remove_diacritics 2'
+)
+"""
+
+# Column weights for bm25: codes and vehicle ids are the most specific matches
+RANK_FUNCTION = 'bm25(4.0, 8.0, 8.0, 1.0)'
+
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def ensure_search_index(conn):
+    """Create the index if missing, building it from existing rows; returns True if built"""
+    if has_search_index(conn):
+        return False
+    conn.execute(FTS_TABLE_SQL)
+    conn.execute("INSERT INTO schedule_fts(schedule_fts, rank) VALUES('rank', ?)", (RANK_FUNCTION,))
+    rebuild_search_index(conn)
+    conn.commit()
+    logger.info("Built full-text search index")
+    return True
+
+
+def has_search_index(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='schedule_fts'"
+    ).fetchone() is not None
+
+
+def rebuild_search_index(conn):
+    """Re-index every current schedule row (caller commits)
+
+    FTS5's own 'rebuild' would also index rows of superseded versions.
+    """
+    conn.execute("INSERT INTO schedule_fts(schedule_fts) VALUES('delete-all')")
+    return index_rows_after(conn, 0)
+
+
+def max_indexed_id(conn):
+    """Highest schedule id present before an import, so only new rows are indexed"""
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM schedule").fetchone()[0]
+
+
+def index_rows_after(conn, last_id):
+    """Add current schedule rows with id > last_id to the index (caller commits)"""
+    cursor = conn.execute("""
+        INSERT INTO schedule_fts(rowid, facility, nass_code, vehicle_id, raw_data)
+        SELECT id, facility, nass_code, vehicle_id, raw_data
+        FROM schedule WHERE id > ? AND valid_to IS NULL
+    """, (last_id,))
+    return cursor.rowcount
+
+
+def unindex_version(conn, version_id):
+    """Remove a superseded version's rows from the index (caller commits)"""
+    # External-content deletes must repeat the indexed values
+    cursor = conn.execute("""
+        INSERT INTO schedule_fts(schedule_fts, rowid, facility, nass_code, vehicle_id, raw_data)
+        SELECT 'delete', id, facility, nass_code, vehicle_id, raw_data
+        FROM schedule WHERE version_id = ? AND valid_to IS NULL
+    """, (version_id,))
+    return cursor.rowcount
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix
+
+    Words are quoted, so FTS5 operators and punctuation in user input are inert.
+    """
+    terms = TERM_PATTERN.findall(text or '')
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+SEARCH_TRIPS_SQL = """
+    WITH hits AS (
+        SELECT rowid, rank
+        FROM schedule_fts
+        WHERE schedule_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    )
+    SELECT
+        s.trip_id,
+        s.contract_hcr_number,
+        MIN(hits.rank) AS score,
+        COUNT(*) AS matched_stops,
+        JSON_GROUP_ARRAY(DISTINCT s.facility) AS matched_facilities
+    FROM hits
+    JOIN schedule s ON s.id = hits.rowid
+    WHERE s.valid_to IS NULL
+    GROUP BY s.trip_id, s.contract_hcr_number
+    ORDER BY score
+    LIMIT ?
+"""
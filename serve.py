@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Production server launcher
+Runs gunicorn (WSGI) or uvicorn (ASGI) with the settings from config.json
+"""
+
+import argparse
+import os
+import sys
+
+from config import get_config
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the trucking schedule server')
+    parser.add_argument('--dev', action='store_true', help='Run the Flask development server')
+    parser.add_argument('--interface', choices=['wsgi', 'asgi'], help='Override server.interface')
+    parser.add_argument('--workers', type=int, help='Override server.workers')
+    args = parser.parse_args()
+
+    config = get_config()
+    workers = args.workers or config.server.workers
+    interface = args.interface or config.server.interface
+
+    os.chdir(BASE_DIR)
+
+    # The Werkzeug server (and its debugger when app.debug is on) is never a silent fallback
+    if args.dev:
+        from app import app
+        app.run(debug=config.app.debug, host=config.app.host,
+                port=config.app.port, threaded=True)
+        return
+
+    if interface == 'asgi':
+        cmd = [sys.executable, '-m', 'uvicorn', 'asgi:application',
+               '--host', config.app.host, '--port', str(config.app.port),
+               '--workers', str(workers), '--timeout-keep-alive', '5']
+    else:
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+               '--workers', str(workers), 'wsgi:app']
+
+    print(f"Starting {interface.upper()} server with {workers} workers on "
+          f"{config.app.host}:{config.app.port}")
+    os.execv(sys.executable, cmd)
+
+
+if __name__ == '__main__':
+    main()
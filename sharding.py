@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Optional per-contract sharding of the schedule table
+In sharded mode every contract_hcr_number gets its own SQLite file and a small
+catalog database lists them. Imports of different contracts write to different
+files, so they never wait on each other or on shift edits in the main database.
+Reads fan out to the shards in parallel and merge the results in contract order.
+
+    python sharding.py split    # copy an existing single-file schedule into shards
+    python sharding.py list
+"""
+
+import argparse
+import hashlib
+import heapq
+import logging
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from config import get_config, configure_logging, resolve_path
+from search_index import rebuild_search_index
+from versions import ensure_versioning
+
+logger = logging.getLogger(__name__)
+
+UNASSIGNED = ''
+
+
+class ShardCatalog:
+    """The catalog database: which contracts have a shard and where it lives"""
+
+    def __init__(self, catalog_path, shard_dir):
+        self.catalog_path = catalog_path
+        self.shard_dir = shard_dir
+        os.makedirs(shard_dir, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shards (
+                    contract_hcr_number TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    row_count INTEGER,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.commit()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.catalog_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def path_for(self, contract):
+        """Stable shard file name for a contract (the hash keeps sanitised names unique)"""
+        contract = contract or UNASSIGNED
+        safe = re.sub(r'[^A-Za-z0-9_-]', '_', contract)[:48] or 'unassigned'
+        digest = hashlib.sha1(contract.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.shard_dir, f"{safe}-{digest}.db")
+
+    def register(self, contract, row_count):
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                INSERT INTO shards (contract_hcr_number, path, row_count, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(contract_hcr_number) DO UPDATE SET
+                    path = excluded.path, row_count = excluded.row_count, updated_at = excluded.updated_at
+            """, (contract or UNASSIGNED, os.path.basename(self.path_for(contract)), row_count))
+            conn.commit()
+
+    def entries(self, contracts=None):
+        """[(contract, path, row_count)] in contract order, optionally limited to some contracts"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT contract_hcr_number, path, row_count FROM shards ORDER BY contract_hcr_number"
+            ).fetchall()
+        wanted = set(contracts) if contracts else None
+        return [(contract, os.path.join(self.shard_dir, path), row_count)
+                for contract, path, row_count in rows
+                if wanted is None or contract in wanted]
+
+
+class SingleStore:
+    """Every contract in the main database (the default)"""
+
+    sharded = False
+
+    def __init__(self, db):
+        self.db = db
+
+    def each(self, fn, contracts=None):
+        return [fn(self.db)]
+
+    def rows(self, query, params=(), contracts=None, key=None):
+        return self.db.execute_query(query, params)
+
+    def stream(self, query, params=(), contracts=None):
+        return self.db.stream_query(query, params)
+
+
+class ShardedStore:
+    """Runs schedule queries against every relevant shard and merges the results
+
+    `db_factory(path)` returns an object with the SimpleDB query methods.
+    """
+
+    sharded = True
+
+    def __init__(self, catalog, db_factory, max_workers=8):
+        self.catalog = catalog
+        self.db_factory = db_factory
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shard-query')
+        self._dbs = {}
+        self._lock = threading.Lock()
+
+    def _db(self, path):
+        with self._lock:
+            if path not in self._dbs:
+                self._dbs[path] = self.db_factory(path)
+            return self._dbs[path]
+
+    def shards(self, contracts=None):
+        return [(contract, self._db(path)) for contract, path, _ in self.catalog.entries(contracts)
+                if os.path.exists(path)]
+
+    def each(self, fn, contracts=None):
+        """Call fn(db) on every shard in parallel; results come back in contract order"""
+        shards = self.shards(contracts)
+        if len(shards) == 1:
+            return [fn(shards[0][1])]
+        return list(self._executor.map(lambda shard: fn(shard[1]), shards))
+
+    def rows(self, query, params=(), contracts=None, key=None):
+        """All matching rows; merged by `key` if given, else concatenated in contract order"""
+        parts = self.each(lambda db: db.execute_query(query, params), contracts)
+        if key is not None:
+            return list(heapq.merge(*parts, key=key))
+        return [row for part in parts for row in part]
+
+    def stream(self, query, params=(), contracts=None):
+        """Rows from one shard after another, so memory stays flat like a single cursor"""
+        shards = self.shards(contracts)
+
+        def rows():
+            for _, db in shards:
+                yield from db.stream_query(query, params)
+
+        return rows()
+
+
+def split(config):
+    """Copy the main database's schedule rows into one shard per contract"""
+    # The importer owns the schedule schema; only this command needs it (and pandas)
+    from csv_to_sqlite import SimpleTruckingDB
+
+    catalog = ShardCatalog(resolve_path(config.database.catalog_path), resolve_path(config.database.shard_dir))
+    with closing(sqlite3.connect(resolve_path(config.database.path))) as main:
+        # Shards copy version ids, so the source needs them first
+        ensure_versioning(main)
+        contracts = [row[0] for row in main.execute(
+            "SELECT DISTINCT contract_hcr_number FROM schedule ORDER BY contract_hcr_number")]
+
+    for contract in contracts:
+        shard = SimpleTruckingDB(catalog.path_for(contract))
+        shard.connect()
+        try:
+            shard.prepare_schema()
+            conn = shard.conn
+            conn.execute("ATTACH DATABASE ? AS source", (os.path.abspath(resolve_path(config.database.path)),))
+            columns = [row[1] for row in conn.execute("PRAGMA main.table_info(schedule)") if row[1] != 'id']
+            column_list = ', '.join(columns)
+            conn.execute("DELETE FROM main.schedule WHERE contract_hcr_number IS ?", (contract,))
+            conn.execute("DELETE FROM main.schedule_versions WHERE contract_hcr_number IS ?", (contract,))
+            conn.execute(f"""
+                INSERT INTO main.schedule ({column_list})
+                SELECT {column_list} FROM source.schedule WHERE contract_hcr_number IS ?
+                ORDER BY trip_id, stop_number
+            """, (contract,))
+            conn.execute("""
+                INSERT INTO main.schedule_versions
+                SELECT * FROM source.schedule_versions WHERE contract_hcr_number IS ?
+            """, (contract,))
+            rebuild_search_index(conn)
+            rows = conn.execute("SELECT COUNT(*) FROM main.schedule WHERE valid_to IS NULL").fetchone()[0]
+            conn.commit()
+            conn.execute("DETACH DATABASE source")
+        finally:
+            shard.close()
+        catalog.register(contract, rows)
+        logger.info(f"Shard for {contract or 'unassigned rows'}: {rows} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage per-contract schedule shards')
+    parser.add_argument('command', choices=['split', 'list'])
+    args = parser.parse_args()
+
+    config = get_config()
+    configure_logging(config.logging, fmt='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'split':
+        split(config)
+        print("✅ Shards written. Set database.sharded to true and restart the app.")
+    else:
+        catalog = ShardCatalog(resolve_path(config.database.catalog_path), resolve_path(config.database.shard_dir))
+        for contract, path, row_count in catalog.entries():
+            print(f"{contract or '(unassigned)':<20} {row_count or 0:>10}  {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Streaming JSON / NDJSON responses for large collections
+Rows are encoded straight from the SQLite cursor so worker memory stays flat
+"""
+
+import json
+import zlib
+
+from flask import Response, request
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+FLUSH_BYTES = 64 * 1024
+
+
+def wants_ndjson():
+    """NDJSON is selected with ?format=ndjson or an Accept header preferring it"""
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def wants_gzip():
+    """Gzip unless the client cannot decode it or opted out with ?gzip=0"""
+    if request.args.get('gzip') == '0':
+        return False
+    return 'gzip' in request.accept_encodings
+
+
+def _encode(row):
+    return json.dumps(row, separators=(',', ':'), default=str)
+
+
+def _json_array_chunks(key, rows):
+    yield '{"' + key + '":['
+    first = True
+    for row in rows:
+        if first:
+            first = False
+            yield _encode(row)
+        else:
+            yield ',' + _encode(row)
+    yield ']}'
+
+
+def _ndjson_chunks(rows):
+    for row in rows:
+        yield _encode(row) + '\n'
+
+
+def _buffered(chunks, compress):
+    """Group small text chunks into ~64KB writes, gzipping them if requested"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    buffer = []
+    size = 0
+    started = False
+
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        # The opening chunk goes out at once so headers are not held for the query
+        if size >= FLUSH_BYTES or not started:
+            started = True
+            data = ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+            if compressor:
+                # Sync flush lets the client inflate what it has received so far
+                data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield data
+
+    data = ''.join(buffer).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush(zlib.Z_FINISH)
+    if data:
+        yield data
+
+
+def stream_collection(key, rows):
+    """Stream `rows` as {"<key>": [...]} or NDJSON, optionally gzip-encoded"""
+    ndjson = wants_ndjson()
+    compress = wants_gzip()
+
+    chunks = _ndjson_chunks(rows) if ndjson else _json_array_chunks(key, rows)
+    response = Response(
+        _buffered(chunks, compress),
+        mimetype=NDJSON_MIMETYPE if ndjson else 'application/json'
+    )
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept')
+    response.vary.add('Accept-Encoding')
+    return response
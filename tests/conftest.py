@@ -0,0 +1,105 @@
+"""
+Shared fixtures: the app runs against a scratch database, upload folder and
+deadhead matrix, and schedules are loaded through the real importer.
+"""
+
+import csv
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix='scheduler-tests-')
+DB_PATH = os.path.join(WORK_DIR, 'schedule.db')
+MATRIX_PATH = os.path.join(WORK_DIR, 'matrix.csv')
+
+# Point the app and importer at scratch files before they load their configuration
+os.environ.update({
+    'SCHEDULER_CONFIG': os.path.join(WORK_DIR, 'none.json'),
+    'SCHEDULER_DATABASE_PATH': DB_PATH,
+    'SCHEDULER_DATABASE_SHARDED': 'false',
+    'SCHEDULER_DATABASE_BACKUP_DIR': os.path.join(WORK_DIR, 'backups'),
+    'SCHEDULER_UPLOAD_FOLDER': os.path.join(WORK_DIR, 'uploads'),
+    'SCHEDULER_EXTRACTION_SERVER_ENABLED': 'false',
+    'SCHEDULER_DEADHEAD_MATRIX_PATH': MATRIX_PATH,
+    'SCHEDULER_LOGGING_LEVEL': 'WARNING',
+})
+sys.path.insert(0, BASE_DIR)
+
+from check_query_plans import IMPORT_COLUMNS
+
+# (origin, destination, minutes); the reverse direction is filled in
+DEADHEAD = [('MAC', 'ATL', 90), ('MAC', 'AUG', 120), ('ATL', 'AUG', 150)]
+
+# contract -> trip id -> stops as (nass code, facility, arrive, depart)
+SCHEDULE = {
+    '031L0001': {
+        1001: [('MAC', 'MACON P&DF', '08:00:00 ET', '08:30:00 ET'),
+               ('ATL', 'ATLANTA P&DC', '10:00:00 ET', '10:30:00 ET')],
+        1002: [('ATL', 'ATLANTA P&DC', '11:00:00 ET', '11:30:00 ET'),
+               ('AUG', 'AUGUSTA GA P&DF', '14:00:00 ET', '14:30:00 ET')],
+        # Leaves Augusta before trip 1001 could drive there
+        1003: [('AUG', 'AUGUSTA GA P&DF', '11:00:00 ET', '11:30:00 ET'),
+               ('MAC', 'MACON P&DF', '13:30:00 ET', '14:00:00 ET')],
+        # An overnight pair: 1005 starts after midnight, after 1004 ends
+        1004: [('MAC', 'MACON P&DF', '22:00:00 ET', '22:15:00 ET'),
+               ('ATL', 'ATLANTA P&DC', '23:30:00 ET', '23:45:00 ET')],
+        1005: [('ATL', 'ATLANTA P&DC', '01:00:00 ET', '01:15:00 ET'),
+               ('MAC', 'MACON P&DF', '02:45:00 ET', '03:00:00 ET')],
+    },
+    '031L0002': {
+        2001: [('SAV', 'SAVANNAH GA P&DC', '06:00:00 ET', '06:30:00 ET'),
+               ('MAC', 'MACON P&DF', '09:30:00 ET', '10:00:00 ET')],
+    },
+}
+
+
+def write_schedule_csv(path, contract, trips):
+    """An extractor-style CSV holding `trips` for one contract"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(IMPORT_COLUMNS)
+        for trip_id, stops in trips.items():
+            for stop_number, (nass, facility, arrive, depart) in enumerate(stops, start=1):
+                writer.writerow([trip_id, stop_number, nass, facility, arrive, depart, '30 min', '53FT',
+                                 f"V{trip_id}", '1.00', '07/01/2024', '06/30/2025',
+                                 f"{trip_id} {stop_number} {facility}", contract, 'MACON',
+                                 'DDA TRANSPORT INC', '555-0100', 'ops@example.com', '1000', '50'])
+
+
+def import_schedule(contract, trips):
+    """Import a new version of one contract the way an upload does, and announce it"""
+    from csv_to_sqlite import SimpleTruckingDB
+    import app as app_module
+
+    path = os.path.join(WORK_DIR, f"{contract}.csv")
+    write_schedule_csv(path, contract, trips)
+    importer = SimpleTruckingDB(DB_PATH)
+    importer.connect()
+    importer.prepare_schema()
+    importer.load_csv_data(path)
+    importer.close()
+    os.remove(path)
+    app_module.events.publish('contract.imported', {'contracts': [contract], 'trip_ids': list(trips)})
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    with open(MATRIX_PATH, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['origin_nass', 'dest_nass', 'minutes'])
+        writer.writerows(DEADHEAD)
+
+    import app as app_module
+    for contract, trips in SCHEDULE.items():
+        import_schedule(contract, trips)
+    yield app_module
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
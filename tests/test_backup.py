@@ -0,0 +1,47 @@
+"""Online backups: POST /api/backups snapshots the live database and restore() brings it back"""
+
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+import backup
+from conftest import DB_PATH
+
+
+def shift_names():
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        return {row[0] for row in conn.execute("SELECT shift_name FROM shifts")}
+
+
+def test_backup_and_restore(app_module, client):
+    client.post('/api/shifts', json={'trip_ids': [1001], 'shift_name': 'Before backup'})
+
+    response = client.post('/api/backups')
+    assert response.status_code == 201
+    metrics = response.get_json()['backup']
+    assert metrics['databases'] == 1
+    assert metrics['pages'] > 0
+
+    listing = client.get('/api/backups').get_json()
+    assert [snapshot['file'] for snapshot in listing['snapshots']] == [metrics['file']]
+    assert 'path' not in listing['snapshots'][0]
+
+    client.post('/api/shifts', json={'trip_ids': [1002], 'shift_name': 'After backup'})
+    assert {'Before backup', 'After backup'} <= shift_names()
+
+    snapshot = app_module.backup_service.snapshots()[0]
+    backup.restore(snapshot['path'], DB_PATH)
+    names = shift_names()
+    assert 'Before backup' in names
+    assert 'After backup' not in names
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+        assert conn.execute("SELECT COUNT(*) FROM schedule WHERE valid_to IS NULL").fetchone()[0] > 0
+
+
+def test_restore_refuses_a_sharded_snapshot_into_a_single_database(app_module, tmp_path):
+    snapshot = tmp_path / 'trucking_schedule-20240101-000000.tar.gz'
+    snapshot.write_bytes(b'')
+    with pytest.raises(RuntimeError, match='database.sharded'):
+        backup.restore(str(snapshot), DB_PATH)
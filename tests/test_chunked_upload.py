@@ -0,0 +1,75 @@
+"""Resumable uploads: chunks land at the reported offset and a dropped upload picks up where it stopped"""
+
+import hashlib
+import os
+
+import pytest
+
+from chunked_upload import UploadSessionError
+
+PDF = b'%PDF-1.4\n' + os.urandom(64 * 1024) + b'\n%%EOF\n'
+
+
+def open_session(client, data=PDF, **extra):
+    response = client.post('/api/uploads', json={'filename': 'schedule.pdf', 'size': len(data), **extra})
+    assert response.status_code == 201
+    return response.get_json()['session_id']
+
+
+def put(client, session_id, offset, chunk):
+    return client.put(f'/api/uploads/{session_id}', query_string={'offset': offset}, data=chunk)
+
+
+def test_resume_after_a_partial_upload(app_module, client, tmp_path):
+    session_id = open_session(client)
+    half = len(PDF) // 2
+
+    assert put(client, session_id, 0, PDF[:half]).get_json()['offset'] == half
+    # A client that lost track asks where to resume
+    assert client.get(f'/api/uploads/{session_id}').get_json()['offset'] == half
+
+    stale = put(client, session_id, 0, PDF[:half])
+    assert stale.status_code == 409
+    assert stale.get_json()['offset'] == half
+
+    early = client.post(f'/api/uploads/{session_id}/complete')
+    assert early.status_code == 409
+    assert early.get_json()['offset'] == half
+
+    assert put(client, session_id, half, PDF[half:]).get_json()['offset'] == len(PDF)
+
+    destination = tmp_path / 'schedule.pdf'
+    meta = app_module.upload_sessions.complete(session_id, str(destination))
+    assert meta['sha256'] == hashlib.sha256(PDF).hexdigest()
+    assert destination.read_bytes() == PDF
+
+    # A retried complete is answered from the first one and moves nothing
+    again = app_module.upload_sessions.complete(session_id, str(tmp_path / 'other.pdf'))
+    assert again['repeated'] and again['path'] == str(destination)
+    assert not (tmp_path / 'other.pdf').exists()
+    assert put(client, session_id, len(PDF), b'x').status_code == 409
+
+
+def test_chunk_past_declared_size_is_refused(client):
+    session_id = open_session(client)
+    response = put(client, session_id, 0, PDF + b'extra')
+    assert response.status_code == 400
+    assert client.get(f'/api/uploads/{session_id}').get_json()['offset'] <= len(PDF)
+
+
+def test_checksum_mismatch_discards_the_upload(client):
+    session_id = open_session(client, sha256='0' * 64)
+    put(client, session_id, 0, PDF)
+    assert client.post(f'/api/uploads/{session_id}/complete').status_code == 422
+    assert client.get(f'/api/uploads/{session_id}').status_code == 404
+
+
+def test_non_pdf_and_unknown_sessions(app_module, client, tmp_path):
+    assert client.post('/api/uploads', json={'filename': 'notes.txt', 'size': 10}).status_code == 400
+    assert client.get('/api/uploads/not-a-session').status_code == 404
+
+    data = b'plain text, not a PDF'
+    session_id = open_session(client, data=data)
+    put(client, session_id, 0, data)
+    with pytest.raises(UploadSessionError, match='not a PDF'):
+        app_module.upload_sessions.complete(session_id, str(tmp_path / 'notes.pdf'))
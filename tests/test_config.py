@@ -0,0 +1,97 @@
+"""Typed settings from config.json plus SCHEDULER_<SECTION>_<KEY> overrides"""
+
+import json
+
+import pytest
+
+from config import BASE_DIR, ConfigError, load_config, resolve_path
+
+
+def load(tmp_path, environ=None, data=None):
+    path = tmp_path / 'config.json'
+    if data is not None:
+        path.write_text(json.dumps(data))
+    return load_config(str(path), environ=environ or {})
+
+
+def test_defaults_without_a_file(tmp_path):
+    config = load(tmp_path)
+    assert config.server.workers == 2
+    assert config.database.journal_mode == 'WAL'
+    assert config.logging.file is None
+
+
+def test_environment_values_are_coerced_to_field_types(tmp_path):
+    config = load(tmp_path, {
+        'SCHEDULER_SERVER_WORKERS': '8',
+        'SCHEDULER_DATABASE_SHARDED': 'yes',
+        'SCHEDULER_DATABASE_BACKUP_ENABLED': 'off',
+        'SCHEDULER_CACHE_EVENT_POLL_SECONDS': '0.25',
+        'SCHEDULER_UPLOAD_ALLOWED_EXTENSIONS': '.pdf, .PDF,',
+        'SCHEDULER_LOGGING_FILE': '',
+        'SCHEDULER_EXTRACTION_SPILL_DIR': '/tmp/spill',
+    })
+    assert config.server.workers == 8
+    assert config.database.sharded is True
+    assert config.database.backup_enabled is False
+    assert config.cache.event_poll_seconds == 0.25
+    assert config.upload.allowed_extensions == ['.pdf', '.PDF']
+    assert config.logging.file is None
+    assert config.extraction.spill_dir == '/tmp/spill'
+
+
+def test_environment_overrides_the_file(tmp_path):
+    config = load(tmp_path, {'SCHEDULER_SERVER_THREADS': '4', 'WEB_CONCURRENCY': '3'},
+                  data={'server': {'threads': 32, 'timeout': 30}})
+    assert config.server.threads == 4
+    assert config.server.timeout == 30
+    assert config.server.workers == 3
+
+
+@pytest.mark.parametrize('environ, message', [
+    ({'SCHEDULER_SERVER_WORKERS': 'many'}, "SCHEDULER_SERVER_WORKERS server.workers: cannot use 'many' as int"),
+    ({'SCHEDULER_DATABASE_SHARDED': 'maybe'}, "cannot use 'maybe' as bool"),
+    ({'SCHEDULER_CACHE_EVENT_POLL_SECONDS': 'soon'}, "cannot use 'soon' as float"),
+])
+def test_values_of_the_wrong_type_are_rejected(tmp_path, environ, message):
+    with pytest.raises(ConfigError, match=message):
+        load(tmp_path, environ)
+
+
+def test_json_booleans_are_not_integers(tmp_path):
+    with pytest.raises(ConfigError, match="server.workers: cannot use True as int"):
+        load(tmp_path, data={'server': {'workers': True}})
+
+
+def test_unknown_sections_and_settings_are_rejected(tmp_path):
+    with pytest.raises(ConfigError, match="unknown section 'sever'"):
+        load(tmp_path, data={'sever': {'workers': 2}})
+    with pytest.raises(ConfigError, match="unknown setting server.wrokers"):
+        load(tmp_path, data={'server': {'wrokers': 2}})
+
+
+def test_unreadable_file_is_a_config_error(tmp_path):
+    (tmp_path / 'config.json').write_text('{"server": ')
+    with pytest.raises(ConfigError, match="Could not read config file"):
+        load_config(str(tmp_path / 'config.json'), environ={})
+
+
+def test_validation_reports_every_problem(tmp_path):
+    with pytest.raises(ConfigError) as excinfo:
+        load(tmp_path, {
+            'SCHEDULER_SERVER_WORKERS': '0',
+            'SCHEDULER_DATABASE_JOURNAL_MODE': 'fast',
+            'SCHEDULER_PROFILING_SAMPLE_RATE': '1.5',
+            'SCHEDULER_UPLOAD_CHUNK_SIZE_MB': '64',
+        })
+    message = str(excinfo.value)
+    assert "server.workers must be positive" in message
+    assert "database.journal_mode must be one of" in message
+    assert "profiling.sample_rate must be between 0 and 1" in message
+    assert "upload.chunk_size_mb must be below upload.max_file_size_mb" in message
+
+
+def test_relative_paths_resolve_from_the_project_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert resolve_path('profiles') == f"{BASE_DIR}/profiles"
+    assert resolve_path('/var/lib/profiles') == '/var/lib/profiles'
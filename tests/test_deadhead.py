@@ -0,0 +1,69 @@
+"""Shift feasibility against the deadhead matrix, including shifts that cross midnight"""
+
+import numpy as np
+
+from deadhead import past_midnight_offsets
+
+
+def check(client, trip_ids):
+    response = client.post('/api/shifts/check', json={'trip_ids': trip_ids})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_same_facility_connection_is_feasible(client):
+    result = check(client, [1002, 1001])
+    assert result['feasible']
+    assert result['order'] == [1001, 1002]
+    leg, = result['legs']
+    assert (leg['gap_minutes'], leg['deadhead_minutes'], leg['slack_minutes']) == (30, 0, 30)
+
+
+def test_short_gap_for_the_drive_is_infeasible(client):
+    result = check(client, [1001, 1003])
+    assert not result['feasible']
+    leg, = result['legs']
+    assert (leg['from_nass'], leg['to_nass'], leg['deadhead_minutes']) == ('ATL', 'AUG', 150)
+
+    response = client.post('/api/shifts', json={'trip_ids': [1001, 1003], 'shift_name': 'Too tight'})
+    assert response.status_code == 409
+    assert 'needs 150 min deadhead' in response.get_json()['error']
+
+
+def test_shift_across_midnight_runs_in_driving_order(client):
+    result = check(client, [1005, 1004])
+    assert result['feasible']
+    assert result['order'] == [1004, 1005]
+    assert result['legs'][0]['gap_minutes'] == 75
+
+
+def test_missing_trips_are_reported(client):
+    result = check(client, [1001, 999999])
+    assert result['missing_trips'] == [999999]
+    assert result['legs'] == []
+
+
+def test_connections_and_matrix_lookup(client):
+    connections = client.get('/api/trips/1001/connections').get_json()['connections']
+    assert [c['trip_id'] for c in connections] == [1002, 1004]
+    assert client.get('/api/trips/999999/connections').status_code == 404
+    # Missing reverse directions are mirrored from the forward ones
+    assert client.get('/api/deadhead?from=ATL&to=MAC').get_json()['minutes'] == 90
+    assert client.get('/api/deadhead?from=ATL&to=SAV').get_json()['minutes'] is None
+
+
+def test_past_midnight_offsets():
+    day = 24 * 60
+    # 22:00 then 01:00: the shift starts at 22:00
+    assert past_midnight_offsets(np.array([60.0, 1320.0])).tolist() == [day, 0]
+    # A daytime shift is left alone
+    assert past_midnight_offsets(np.array([480.0, 660.0, 900.0])).tolist() == [0, 0, 0]
+    assert past_midnight_offsets(np.array([np.nan, 60.0, 1320.0])).tolist() == [0, day, 0]
+
+
+def test_malformed_trip_ids_are_rejected(client):
+    for trip_ids in ('abc', [1001, 'x'], [None]):
+        assert client.post('/api/shifts/check', json={'trip_ids': trip_ids}).status_code == 400
+        response = client.post('/api/shifts', json={'trip_ids': trip_ids, 'shift_name': 'Bad'})
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'trip_ids must be a list of trip ids'
@@ -0,0 +1,41 @@
+"""Upload outcomes reach clients on every worker: durable progress events and the session status fallback"""
+
+import sqlite3
+import threading
+import time
+
+from conftest import DB_PATH
+
+
+def hold_write_lock(seconds):
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn.execute("BEGIN IMMEDIATE")
+    timer = threading.Timer(seconds, lambda: (conn.rollback(), conn.close()))
+    timer.start()
+    return timer
+
+
+def test_terminal_progress_waits_for_the_log(app_module):
+    timer = hold_write_lock(0.5)
+    try:
+        assert app_module.events.publish('upload.progress', {'upload_id': 'u1', 'stage': 'import'}) is None
+        started = time.perf_counter()
+        app_module.publish_progress('u1', 'failed', {'error': 'boom'})
+        assert time.perf_counter() - started >= 0.3
+    finally:
+        timer.join()
+    logged = [event for event in app_module.event_log.since(0) if event['type'] == 'upload.progress']
+    assert logged[-1]['data'] == {'upload_id': 'u1', 'stage': 'failed', 'error': 'boom'}
+
+
+def test_session_reports_the_processing_result(app_module, client, tmp_path):
+    data = b'%PDF-1.4\n%%EOF\n'
+    session_id = client.post('/api/uploads', json={'filename': 'a.pdf', 'size': len(data)}).get_json()['session_id']
+    client.put(f'/api/uploads/{session_id}?offset=0', data=data)
+    app_module.upload_sessions.complete(session_id, str(tmp_path / 'a.pdf'))
+    assert 'result' not in client.get(f'/api/uploads/{session_id}').get_json()
+
+    app_module.upload_sessions.record_result(session_id, {'error': 'PDF extraction failed: boom'}, 500)
+    status = client.get(f'/api/uploads/{session_id}').get_json()
+    assert status['offset'] == len(data)
+    assert status['result'] == {'ok': False, 'error': 'PDF extraction failed: boom'}
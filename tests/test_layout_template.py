@@ -0,0 +1,82 @@
+"""Layout templates learned from synthetic pdfplumber word boxes"""
+
+import json
+import os
+
+from layout_template import LayoutTemplate, LayoutTemplateCache
+
+# Column x positions of the synthetic layout
+COLUMNS = {'trip': 10, 'stop': 60, 'nass': 100, 'facility': 150, 'arrive': 300, 'depart': 380}
+HEADER = [('Trip', 'trip'), ('Stop', 'stop'), ('NASS', 'nass'), ('Facility', 'facility'),
+          ('Arrive', 'arrive'), ('Depart', 'depart')]
+
+
+def word(text, x0, top):
+    return {'text': text, 'x0': x0, 'x1': x0 + 6 * len(text), 'top': top, 'bottom': top + 8}
+
+
+def row(top, trip, stop, nass, facility, arrive, depart):
+    words = [word(trip, COLUMNS['trip'], top), word(stop, COLUMNS['stop'], top),
+             word(nass, COLUMNS['nass'], top), word(arrive, COLUMNS['arrive'], top),
+             word(depart, COLUMNS['depart'], top)]
+    x = COLUMNS['facility']
+    for part in facility.split():
+        words.append(word(part, x, top))
+        x += 6 * len(part) + 4
+    return words
+
+
+def page(extra=()):
+    words = [word(text, COLUMNS[column], 100) for text, column in HEADER]
+    words += row(120, '1001', '1', 'MAC01', 'MACON P&DF', '08:00', '08:30')
+    words += row(140, '1001', '2', 'ATL01', 'ATLANTA P&DC', '10:00', '10:30')
+    words += list(extra)
+    return words
+
+
+def test_learn_finds_columns_from_the_header_and_gutters():
+    template = LayoutTemplate.learn(page(), 612)
+    assert template.fields == ['trip_id', 'stop_number', 'nass_code', 'facility', 'arrive_time', 'depart_time']
+    assert len(template.boundaries) == 5
+    assert template.boundaries == sorted(template.boundaries)
+    assert template.key.endswith('@612')
+    assert LayoutTemplate.from_dict(template.to_dict()).fields == template.fields
+
+
+def test_learn_needs_a_header_with_rows():
+    assert LayoutTemplate.learn(row(120, '1001', '1', 'MAC01', 'MACON', '08:00', '08:30'), 612) is None
+    header_only = [word(text, COLUMNS[column], 100) for text, column in HEADER]
+    assert LayoutTemplate.learn(header_only, 612) is None
+
+
+def test_parse_page_slices_rows_and_joins_wrapped_cells():
+    template = LayoutTemplate.learn(page(), 612)
+    extra = [word('ANNEX', COLUMNS['facility'], 152),  # wraps the Atlanta facility name
+             word('1002', COLUMNS['trip'], 180), word('7', COLUMNS['nass'], 180)]  # stop in the wrong column
+    parsed = list(template.parse_page(page(extra)))
+
+    assert [fields['stop_number'] for fields, _ in parsed[:2]] == ['1', '2']
+    first, raw = parsed[0]
+    assert first == {'trip_id': '1001', 'stop_number': '1', 'nass_code': 'MAC01', 'facility': 'MACON P&DF',
+                     'arrive_time': '08:00', 'depart_time': '08:30'}
+    assert raw == '1001 1 MAC01 MACON P&DF 08:00 08:30'
+    assert parsed[1][0]['facility'] == 'ATLANTA P&DC ANNEX'
+    # A line that looks like a row but does not fit goes to the regular-expression parser
+    assert parsed[2] == (None, '1002 7')
+    assert len(parsed) == 3
+
+
+def test_cache_merges_templates_saved_by_other_processes(tmp_path):
+    path = str(tmp_path / 'layout_templates.json')
+    first, second = LayoutTemplateCache(path), LayoutTemplateCache(path)
+    # Each has read the (empty) file before the other saves
+    first._load(), second._load()
+    narrow = first.template_for(page(), 612)
+    wide = second.template_for(page(), 792)
+    assert narrow.key != wide.key
+
+    with open(path) as f:
+        assert set(json.load(f)) == {narrow.key, wide.key}
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+    # A third process reuses them without learning again
+    assert LayoutTemplateCache(path).template_for(page(), 792).to_dict() == wide.to_dict()
@@ -0,0 +1,68 @@
+"""Spilled extraction rows merge back into one sorted CSV, with a bounded number of open runs"""
+
+import builtins
+import csv
+import os
+import random
+
+import pandas as pd
+
+import memory_budget
+from memory_budget import MemoryTracker, SpillingRowBuffer, MIN_SPILL_ROWS
+
+
+class OverBudget:
+    """A tracker that is always over budget, so every batch spills"""
+
+    def over_budget(self):
+        return True
+
+
+def test_budget_is_measured_from_the_starting_rss():
+    tracker = MemoryTracker(budget_mb=1)
+    assert tracker.baseline_rss > memory_budget.MB
+    assert not tracker.over_budget()
+    assert tracker.summary()['baseline_rss_mb'] > 0
+
+
+def test_many_runs_merge_in_bounded_groups(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_budget, 'MERGE_FAN_IN', 4)
+    reading = []
+    most_open = 0
+    real_open = builtins.open
+
+    def tracking_open(path, mode='r', *args, **kwargs):
+        nonlocal most_open
+        f = real_open(path, mode, *args, **kwargs)
+        if os.path.basename(str(path)).startswith('extract-run-') and mode == 'r':
+            reading.append(f)
+            most_open = max(most_open, sum(not run.closed for run in reading))
+        return f
+
+    buffer = SpillingRowBuffer(OverBudget(), extra_columns={'hcr_number': '031L0001'}, spill_dir=str(tmp_path))
+    rows = [(trip, stop) for trip in range(1, 1001) for stop in (1, 2, 3)]
+    random.Random(3).shuffle(rows)
+    for start in range(0, len(rows), MIN_SPILL_ROWS):
+        chunk = rows[start:start + MIN_SPILL_ROWS]
+        buffer.add(pd.DataFrame({'trip_id': [r[0] for r in chunk], 'stop_number': [r[1] for r in chunk]}))
+    assert len(buffer._runs) == 3
+
+    # Smaller batches than a spill keep adding to the buffer; force more runs
+    for _ in range(7):
+        buffer.add(pd.DataFrame({'trip_id': [5000] * MIN_SPILL_ROWS, 'stop_number': range(MIN_SPILL_ROWS)}))
+    assert len(buffer._runs) == 10
+
+    monkeypatch.setattr(builtins, 'open', tracking_open)
+    output = tmp_path / 'out.csv'
+    buffer.write(str(output))
+    monkeypatch.setattr(builtins, 'open', real_open)
+
+    with open(output, newline='') as f:
+        written = [(int(row['trip_id']), int(row['stop_number'])) for row in csv.DictReader(f)]
+    expected = sorted(rows) + [(5000, stop) for stop in range(MIN_SPILL_ROWS) for _ in range(7)]
+    assert written == sorted(expected)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('extract-run-')]
+    # 10 runs were read, never more than MERGE_FAN_IN at once
+    assert len(reading) > 10
+    assert most_open == 4
+    assert all(f.closed for f in reading)
@@ -0,0 +1,70 @@
+"""Opt-in request profiling through ProfilingMiddleware"""
+
+import os
+import pstats
+
+import pytest
+from flask import Flask, Response, request
+
+from config import BASE_DIR, ProfilingConfig
+from profiling import PROFILE_REQUESTED, ProfileStore, ProfilingMiddleware
+
+
+def build_client(tmp_path, **settings):
+    settings = ProfilingConfig(enabled=True, **settings)
+    store = ProfileStore(str(tmp_path / 'profiles'), retention=settings.retention)
+    app = Flask(__name__)
+    seen = {}
+
+    @app.route('/trips')
+    def trips():
+        seen['requested'] = request.environ.get(PROFILE_REQUESTED)
+        return Response((f"{trip_id}\n" for trip_id in range(1000)), mimetype='text/plain')
+
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app, store, settings)
+    return app.test_client(), store, seen
+
+
+def test_unrequested_requests_are_not_profiled(tmp_path):
+    client, store, seen = build_client(tmp_path)
+    response = client.get('/trips', headers={'X-Profile': '0'})
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+    assert seen == {'requested': None}
+    assert store.list() == []
+    assert not os.path.exists(store.directory)
+
+
+@pytest.mark.parametrize('ask', [{'headers': {'X-Profile': '1'}}, {'query_string': {'profile': 'true'}}])
+def test_requested_profile_is_stored(tmp_path, ask):
+    client, store, seen = build_client(tmp_path)
+    response = client.get('/trips', **ask)
+    assert response.get_data(as_text=True).count('\n') == 1000
+    response.close()
+    assert seen['requested'] is True
+
+    [meta] = store.list()
+    assert meta['name'] == response.headers['X-Profile-Id']
+    assert meta['label'] == 'GET /trips'
+    assert meta['file'].endswith('.pstats')
+    stats = pstats.Stats(store.path(meta['file']))
+    assert stats.total_calls > 0
+
+
+def test_sampled_requests_use_the_sampling_profiler(tmp_path):
+    client, store, seen = build_client(tmp_path, mode='sample', sample_rate=1.0, retention=2)
+    for _ in range(3):
+        client.get('/trips').close()
+    assert seen['requested'] is False
+
+    profiles = store.list()
+    assert len(profiles) == 2
+    assert all(meta['file'].endswith('.collapsed') for meta in profiles)
+    assert store.path(profiles[0]['file']) is not None
+    assert store.path('../' + profiles[0]['file']) is None
+
+
+def test_relative_profile_directory_is_under_the_project(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert ProfileStore.from_config(ProfilingConfig(directory='profiles')).directory == f"{BASE_DIR}/profiles"
+    assert ProfileStore.from_config(ProfilingConfig(directory=str(tmp_path))).directory == str(tmp_path)
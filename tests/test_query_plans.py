@@ -0,0 +1,35 @@
+"""Every statement the API and the importer issue is served by an index (see check_query_plans.py)"""
+
+import queue
+
+from check_query_plans import trace_statements, check_statements, exercise_app
+from conftest import DB_PATH, import_schedule
+
+CONTRACT = '031L0009'
+TRIPS = {
+    9001: [('MAC', 'MACON P&DF', '04:00:00 ET', '04:30:00 ET'),
+           ('ATL', 'ATLANTA P&DC', '06:00:00 ET', '06:30:00 ET')],
+    9002: [('ATL', 'ATLANTA P&DC', '07:00:00 ET', '07:30:00 ET'),
+           ('COL', 'COLUMBUS GA P&DF', '10:00:00 ET', '10:30:00 ET')],
+}
+
+
+def test_no_unexpected_query_plans(app_module):
+    import_schedule(CONTRACT, TRIPS)
+    # Pooled connections were opened before tracing; later ones are traced
+    while True:
+        try:
+            app_module.db._pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+    with trace_statements() as statements:
+        # A second version, so the import retires one
+        import_schedule(CONTRACT, {**TRIPS, 9003: TRIPS[9002]})
+        failures = exercise_app([9001, 9002, 9003, 1001], CONTRACT)
+
+    assert failures == []
+    results = check_statements(DB_PATH, statements)
+    assert len(results) > 30
+    unexpected = {key: problems for key, plan, problems in results if problems}
+    assert unexpected == {}
@@ -0,0 +1,64 @@
+"""GET /api/reports: driver hours, idle gaps and utilization from the current schedule and shifts"""
+
+from analytics import ScheduleAnalytics, ScheduleTrips, load_stops
+from conftest import import_schedule
+
+
+def test_report_for_a_shift_across_midnight(client):
+    response = client.post('/api/shifts', json={'shift_name': 'Overnight report', 'trip_ids': [1005, 1004]})
+    shift_id = response.get_json()['shift']['id']
+
+    report = client.get('/api/reports', query_string={'contract': '031L0001'}).get_json()
+    contract, = report['contracts']
+    assert contract['contract_hcr_number'] == '031L0001'
+    assert contract['trips'] == report['totals']['trips'] == 5
+
+    shift = next(shift for shift in report['shifts'] if shift['shift_id'] == shift_id)
+    # 22:00 until 03:00 the next morning, with 75 minutes idle in Atlanta
+    assert (shift['start_minute'], shift['end_minute']) == (1320, 1620)
+    assert shift['driver_hours'] == 5
+    assert (shift['idle_gaps'], shift['longest_gap_minutes']) == (1, 75)
+    assert shift['missing_trips'] == 0
+
+
+def test_contract_totals_and_hourly_load(client):
+    report = client.get('/api/reports', query_string={'contract': '031L0001'}).get_json()
+    contract, = report['contracts']
+    # 150 + 210 + 180 + 105 + 120 minutes between first and last stop; ten 30-minute stops
+    assert contract['trip_hours'] == report['totals']['trip_hours'] == 12.75
+    assert contract['stop_hours'] == 5
+    assert contract['assigned_trips'] + contract['unassigned_trips'] == 5
+
+    macon = next(f for f in report['facilities'] if f['facility'] == 'MACON P&DF')
+    # Trip 1001 runs 08:00-10:30 and trip 1004 runs 22:00-23:45
+    assert macon['trips'] == 2
+    assert [hour for hour, count in enumerate(macon['hourly']) if count] == [8, 9, 10, 22, 23]
+
+
+def test_shift_changes_reuse_the_trip_spans(app_module, client):
+    client.get('/api/reports')
+    schedule = app_module.get_schedule_analytics().schedule
+    before = client.get('/api/reports').get_json()['totals']
+
+    client.post('/api/shifts', json={'shift_name': 'Reuse check', 'trip_ids': [1002]})
+    after = client.get('/api/reports').get_json()['totals']
+    assert app_module.get_schedule_analytics().schedule is schedule
+    assert after['shifts'] == before['shifts'] + 1
+    assert after['trips'] == before['trips']
+
+    import_schedule('031L0004', {4001: [('MAC', 'MACON P&DF', '12:00:00 ET', '12:30:00 ET')]})
+    imported = client.get('/api/reports').get_json()['totals']
+    assert app_module.get_schedule_analytics().schedule is not schedule
+    assert imported['trips'] == after['trips'] + 1
+
+
+def test_report_for_an_unknown_contract_is_empty(client):
+    report = client.get('/api/reports', query_string={'contract': 'NONE'}).get_json()
+    assert report['contracts'] == [] and report['totals']['trips'] == 0
+
+
+def test_report_before_the_first_import(app_module, tmp_path):
+    stops = load_stops(app_module.SimpleDB(str(tmp_path / 'empty.db')))
+    assert stops.empty
+    report = ScheduleAnalytics(ScheduleTrips(stops), []).report()
+    assert report['totals']['trips'] == 0 and report['shifts'] == [] and report['facilities'] == []
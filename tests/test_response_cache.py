@@ -0,0 +1,94 @@
+"""ETag/304 response caching keyed on the data generation"""
+
+import gzip
+import json
+
+import pytest
+from flask import Flask, jsonify
+
+from response_cache import ResponseCache, cached_response
+from streaming import stream_collection
+
+ROWS = [{'trip_id': trip_id, 'stops': 2} for trip_id in range(50)]
+
+
+@pytest.fixture
+def cached_app():
+    app = Flask(__name__)
+    cache = ResponseCache(max_entries=8)
+    calls = {'items': 0, 'stream': 0}
+
+    @app.route('/items')
+    @cached_response(cache)
+    def items():
+        calls['items'] += 1
+        return jsonify({'generation': cache.generation})
+
+    @app.route('/stream')
+    @cached_response(cache)
+    def stream():
+        calls['stream'] += 1
+        return stream_collection('trips', iter(ROWS))
+
+    return app.test_client(), cache, calls
+
+
+def test_entries_are_reused_until_the_generation_is_bumped(cached_app):
+    client, cache, calls = cached_app
+    first = client.get('/items')
+    second = client.get('/items')
+    assert calls['items'] == 1
+    assert second.get_json() == first.get_json() == {'generation': 0}
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert second.headers['Cache-Control'] == 'no-cache'
+
+    cache.bump()
+    third = client.get('/items')
+    assert calls['items'] == 2
+    assert third.get_json() == {'generation': 1}
+    assert third.headers['ETag'] != first.headers['ETag']
+    assert cache.stats()['hits'] == 1
+
+
+def test_workers_agree_on_bumps_from_the_event_log(cached_app):
+    _, cache, _ = cached_app
+    assert cache.bump(5) == 5
+    # An older or repeated event id leaves the generation alone
+    assert cache.bump(3) == 5
+    cache.put(('/old', b'', ('', False), 4), {'body': b'stale'})
+    assert cache.stats()['entries'] == 0
+
+
+def test_if_none_match_gets_a_304_without_running_the_view(cached_app):
+    client, cache, calls = cached_app
+    etag = client.get('/items').headers['ETag']
+
+    response = client.get('/items', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert {'Accept', 'Accept-Encoding'} <= set(response.vary)
+    assert calls['items'] == 1
+
+    cache.bump()
+    assert client.get('/items', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_streamed_gzip_body_is_replayed_with_its_headers(cached_app):
+    client, _, calls = cached_app
+    headers = {'Accept-Encoding': 'gzip'}
+    first = client.get('/stream', headers=headers)
+    assert first.headers['Content-Encoding'] == 'gzip'
+    first_body = first.get_data()
+
+    replayed = client.get('/stream', headers=headers)
+    assert calls['stream'] == 1
+    assert replayed.headers['Content-Encoding'] == 'gzip'
+    assert {'Accept', 'Accept-Encoding'} <= set(replayed.vary)
+    assert replayed.get_data() == first_body
+    assert json.loads(gzip.decompress(replayed.get_data())) == {'trips': ROWS}
+
+    # Clients that cannot decode gzip get their own identity-encoded entry
+    plain = client.get('/stream')
+    assert calls['stream'] == 2
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.get_json() == {'trips': ROWS}
@@ -0,0 +1,30 @@
+"""GET /api/search ranks current trips from the FTS5 index"""
+
+
+def search(client, query, **params):
+    response = client.get('/api/search', query_string={'q': query, **params})
+    assert response.status_code == 200
+    return response.get_json()['trips']
+
+
+def test_search_finds_trips_by_facility(client):
+    trips = search(client, 'savannah')
+    assert [trip['trip_id'] for trip in trips] == [2001]
+    assert trips[0]['contract_hcr_number'] == '031L0002'
+    assert trips[0]['matched_facilities'] == ['SAVANNAH GA P&DC']
+
+
+def test_search_matches_prefixes_and_every_term(client):
+    assert {trip['trip_id'] for trip in search(client, 'augu')} == {1002, 1003}
+    # Every word has to match the same stop
+    assert [trip['trip_id'] for trip in search(client, 'augusta v1003')] == [1003]
+    assert search(client, 'augusta savannah') == []
+
+
+def test_search_limit(client):
+    assert len(search(client, 'macon', limit=2)) == 2
+
+
+def test_search_without_matches_or_query(client):
+    assert search(client, 'nowhere') == []
+    assert client.get('/api/search').status_code == 400
@@ -0,0 +1,87 @@
+"""Per-contract shard catalog and the merged reads of ShardedStore"""
+
+import os
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from sharding import ShardCatalog, ShardedStore
+
+# contract -> trip ids in that contract's shard
+SHARDS = {
+    '031L0002': [2001, 1004],
+    '031L0001': [1001, 1003, 1005],
+    '031L0003': [1002],
+}
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = ShardCatalog(str(tmp_path / 'catalog.db'), str(tmp_path / 'shards'))
+    for contract, trip_ids in SHARDS.items():
+        with closing(sqlite3.connect(catalog.path_for(contract))) as conn:
+            conn.execute("CREATE TABLE schedule (trip_id INTEGER, contract_hcr_number TEXT)")
+            conn.executemany("INSERT INTO schedule VALUES (?, ?)", [(trip_id, contract) for trip_id in trip_ids])
+            conn.commit()
+        catalog.register(contract, len(trip_ids))
+    return catalog
+
+
+@pytest.fixture
+def store(app_module, catalog):
+    store = ShardedStore(catalog, lambda path: app_module.SimpleDB(path, pool_size=2), max_workers=4)
+    yield store
+    store._executor.shutdown()
+
+
+def test_catalog_lists_shards_in_contract_order(catalog):
+    entries = catalog.entries()
+    assert [contract for contract, _, _ in entries] == ['031L0001', '031L0002', '031L0003']
+    assert [row_count for _, _, row_count in entries] == [3, 2, 1]
+    assert all(path == catalog.path_for(contract) for contract, path, _ in entries)
+
+    assert [contract for contract, _, _ in catalog.entries(['031L0003', '031L0002'])] == ['031L0002', '031L0003']
+    assert catalog.entries(['031L9999']) == []
+
+
+def test_catalog_paths_are_stable_and_unique(catalog):
+    assert catalog.path_for('031L0001') == catalog.path_for('031L0001')
+    # Both sanitise to the same name, so only the hash tells them apart
+    assert catalog.path_for('A/1') != catalog.path_for('A_1')
+    assert os.path.basename(catalog.path_for(None)).startswith('unassigned-')
+
+    catalog.register('031L0001', 10)
+    assert catalog.entries(['031L0001'])[0][2] == 10
+
+
+def test_rows_concatenate_in_contract_order(store):
+    rows = store.rows("SELECT trip_id, contract_hcr_number FROM schedule ORDER BY trip_id")
+    assert [(row['contract_hcr_number'], row['trip_id']) for row in rows] == [
+        ('031L0001', 1001), ('031L0001', 1003), ('031L0001', 1005),
+        ('031L0002', 1004), ('031L0002', 2001),
+        ('031L0003', 1002),
+    ]
+
+
+def test_rows_merge_by_key_across_shards(store):
+    rows = store.rows("SELECT trip_id FROM schedule ORDER BY trip_id", key=lambda row: row['trip_id'])
+    assert [row['trip_id'] for row in rows] == [1001, 1002, 1003, 1004, 1005, 2001]
+
+    rows = store.rows("SELECT trip_id FROM schedule ORDER BY trip_id", contracts=['031L0002', '031L0003'],
+                      key=lambda row: row['trip_id'])
+    assert [row['trip_id'] for row in rows] == [1002, 1004, 2001]
+
+
+def test_each_and_stream_keep_contract_order(store):
+    counts = store.each(lambda db: db.execute_query("SELECT COUNT(*) AS n FROM schedule")[0]['n'])
+    assert counts == [3, 2, 1]
+
+    streamed = store.stream("SELECT contract_hcr_number FROM schedule", contracts=['031L0003', '031L0001'])
+    assert [row['contract_hcr_number'] for row in streamed] == ['031L0001'] * 3 + ['031L0003']
+
+
+def test_shards_missing_on_disk_are_skipped(store, catalog):
+    os.remove(catalog.path_for('031L0002'))
+    assert [contract for contract, _ in store.shards()] == ['031L0001', '031L0003']
+    assert len(store.rows("SELECT trip_id FROM schedule")) == 4
@@ -0,0 +1,72 @@
+"""POST /api/shifts/bulk applies every operation or none of them"""
+
+import sqlite3
+from contextlib import closing
+
+from conftest import DB_PATH
+
+
+def shifts():
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        return {row[0]: (row[1], row[2]) for row in conn.execute("SELECT id, shift_name, trip_ids FROM shifts")}
+
+
+def create_shift(client, name, trip_ids):
+    response = client.post('/api/shifts', json={'shift_name': name, 'trip_ids': trip_ids})
+    assert response.status_code == 200
+    return response.get_json()['shift']['id']
+
+
+def bulk(client, *operations):
+    return client.post('/api/shifts/bulk', json={'operations': list(operations)})
+
+
+def test_one_invalid_operation_rolls_back_the_rest(client):
+    shift_id = create_shift(client, 'Night', [1004])
+    before = shifts()
+
+    response = bulk(client,
+                    {'op': 'create', 'shift_name': 'Bulk morning', 'trip_ids': [1001, 1002]},
+                    {'op': 'update', 'shift_id': shift_id, 'shift_name': 'Night renamed'},
+                    {'op': 'create', 'shift_name': 'Bulk bad', 'trip_ids': [999999]},
+                    {'op': 'create', 'shift_name': 'Bulk tight', 'trip_ids': [1001, 1003]})
+    assert response.status_code == 409
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == ['ok', 'ok', 'error', 'error']
+    assert 'Trips not found: 999999' in results[2]['error']
+    assert 'not feasible' in results[3]['error']
+    assert shifts() == before
+
+
+def test_bulk_create_update_and_delete(client):
+    keep = create_shift(client, 'Keep', [1002])
+    drop = create_shift(client, 'Drop', [1003])
+
+    response = bulk(client,
+                    {'op': 'create', 'shift_name': 'Overnight', 'trip_ids': [1004, 1005]},
+                    {'op': 'update', 'shift_id': keep, 'shift_name': 'Kept', 'trip_ids': [1001, 1002]},
+                    {'op': 'delete', 'shift_id': drop})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['created'], body['updated'], body['deleted']) == (1, 1, 1)
+
+    after = shifts()
+    assert after[keep] == ('Kept', '1001,1002')
+    assert drop not in after
+    assert after[body['results'][0]['shift']['id']] == ('Overnight', '1004,1005')
+
+
+def test_bulk_rejects_malformed_requests(client):
+    shift_id = create_shift(client, 'Twice', [1001])
+    assert bulk(client).status_code == 400
+    assert client.post('/api/shifts/bulk', json={'operations': ['create']}).status_code == 400
+
+    response = bulk(client,
+                    {'op': 'delete', 'shift_id': shift_id},
+                    {'op': 'update', 'shift_id': shift_id, 'shift_name': 'Again'},
+                    {'op': 'archive'})
+    assert response.status_code == 409
+    errors = [result.get('error', '') for result in response.get_json()['results']]
+    assert 'more than one operation' in errors[1]
+    assert 'op must be one of' in errors[2]
+    assert shift_id in shifts()
@@ -0,0 +1,67 @@
+"""JSON array / NDJSON framing and gzip chunking of streamed collections"""
+
+import json
+import zlib
+
+import pytest
+from flask import Flask
+
+import streaming
+from streaming import NDJSON_MIMETYPE, stream_collection
+
+ROWS = [{'trip_id': trip_id, 'facility': 'MACON P&DF'} for trip_id in range(200)]
+
+
+@pytest.fixture
+def stream_client():
+    app = Flask(__name__)
+
+    @app.route('/trips')
+    @app.route('/trips/<int:count>')
+    def trips(count=len(ROWS)):
+        return stream_collection('trips', iter(ROWS[:count]))
+
+    return app.test_client()
+
+
+@pytest.mark.parametrize('count', [0, 1, len(ROWS)])
+def test_json_array_framing(stream_client, count):
+    response = stream_client.get(f"/trips/{count}")
+    assert response.mimetype == 'application/json'
+    assert 'Content-Encoding' not in response.headers
+    assert json.loads(response.get_data()) == {'trips': ROWS[:count]}
+
+
+@pytest.mark.parametrize('count', [0, 1, len(ROWS)])
+def test_ndjson_framing(stream_client, count):
+    for response in (stream_client.get(f"/trips/{count}?format=ndjson"),
+                     stream_client.get(f"/trips/{count}", headers={'Accept': NDJSON_MIMETYPE})):
+        assert response.mimetype == NDJSON_MIMETYPE
+        body = response.get_data(as_text=True)
+        assert body.count('\n') == count
+        assert [json.loads(line) for line in body.splitlines()] == ROWS[:count]
+
+
+def test_gzip_can_be_declined(stream_client):
+    response = stream_client.get('/trips?gzip=0', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert {'Accept', 'Accept-Encoding'} <= set(response.vary)
+    assert response.get_json() == {'trips': ROWS}
+
+
+def test_gzip_chunks_inflate_as_they_arrive(monkeypatch):
+    monkeypatch.setattr(streaming, 'FLUSH_BYTES', 512)
+    plain = b''.join(streaming._buffered(streaming._json_array_chunks('trips', ROWS), False))
+    chunks = list(streaming._buffered(streaming._json_array_chunks('trips', ROWS), True))
+    assert len(chunks) > 3
+
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    received = b''
+    for chunk in chunks[:-1]:
+        received += inflater.decompress(chunk)
+        # Every sync-flushed chunk decodes to a prefix of the document on its own
+        assert received and plain.startswith(received)
+    received += inflater.decompress(chunks[-1]) + inflater.flush()
+    assert inflater.eof
+    assert received == plain
+    assert json.loads(received) == {'trips': ROWS}
@@ -0,0 +1,55 @@
+"""Each import becomes a new version of its contract; reads see the current one and diffs compare any two"""
+
+from conftest import import_schedule
+
+CONTRACT = '031L0003'
+FIRST = {
+    3001: [('MAC', 'MACON P&DF', '05:00:00 ET', '05:30:00 ET'),
+           ('ATL', 'ATLANTA P&DC', '07:00:00 ET', '07:30:00 ET')],
+    3002: [('ATL', 'ATLANTA P&DC', '15:00:00 ET', '15:30:00 ET'),
+           ('MAC', 'MACON P&DF', '17:00:00 ET', '17:30:00 ET')],
+}
+SECOND = {
+    # Leaves an hour later than in the first version
+    3001: [('MAC', 'MACON P&DF', '06:00:00 ET', '06:30:00 ET'),
+           ('ATL', 'ATLANTA P&DC', '08:00:00 ET', '08:30:00 ET')],
+    3003: [('ATL', 'ATLANTA P&DC', '09:00:00 ET', '09:30:00 ET'),
+           ('AUG', 'AUGUSTA GA P&DF', '12:00:00 ET', '12:30:00 ET')],
+}
+
+
+def trip_ids(response):
+    assert response.status_code == 200
+    return [trip['trip_id'] for trip in response.get_json()['trips']]
+
+
+def test_versions_and_diff(app_module, client):
+    assert client.get(f'/api/contracts/{CONTRACT}/versions').status_code == 404
+
+    import_schedule(CONTRACT, FIRST)
+    assert client.get(f'/api/contracts/{CONTRACT}/versions/diff').status_code == 400
+
+    import_schedule(CONTRACT, SECOND)
+    versions = client.get(f'/api/contracts/{CONTRACT}/versions').get_json()['versions']
+    assert [version['current'] for version in versions] == [True, False]
+    assert [version['row_count'] for version in versions] == [4, 4]
+    new_id, old_id = versions[0]['id'], versions[1]['id']
+
+    diff = client.get(f'/api/contracts/{CONTRACT}/versions/diff').get_json()
+    assert (diff['from']['id'], diff['to']['id']) == (old_id, new_id)
+    assert (diff['added'], diff['removed'], diff['retimed']) == ([3003], [3002], [3001])
+    assert diff['counts'] == {'added': 1, 'removed': 1, 'retimed': 1}
+
+    backwards = client.get(f'/api/contracts/{CONTRACT}/versions/diff',
+                           query_string={'from': new_id, 'to': old_id}).get_json()
+    assert (backwards['added'], backwards['removed']) == ([3002], [3003])
+    assert client.get(f'/api/contracts/{CONTRACT}/versions/diff?from=1&to=999999').status_code == 404
+
+    # Superseded versions stay readable; everything else sees only the current one
+    assert trip_ids(client.get(f'/api/contracts/{CONTRACT}/versions/{old_id}/trips')) == [3001, 3002]
+    assert trip_ids(client.get('/api/trips', query_string={'contract': CONTRACT})) == [3001, 3003]
+    assert [trip['trip_id'] for trip in client.get('/api/search?q=v3002').get_json()['trips']] == []
+    assert client.get('/api/trips/3002').status_code == 404
+    # The feasibility endpoints are rebuilt for the new schedule
+    result = client.post('/api/shifts/check', json={'trip_ids': [3001, 3003]}).get_json()
+    assert result['feasible'] and result['legs'][0]['gap_minutes'] == 30
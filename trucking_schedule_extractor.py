@@ -9,30 +9,65 @@ import tabula
 import pdfplumber
 import re
 import sys
+import json
 import logging
+import os
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, Iterator
+
+from config import get_config, configure_logging, resolve_path
+from layout_template import FIELDS, LayoutTemplateCache
+from memory_budget import MemoryTracker, SpillingRowBuffer
 
 # Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging(get_config().logging, fmt='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+VEHICLE_TYPE_PATTERN = re.compile(r'^\d+[A-Z]{2}$')
+
+_layout_cache = None
+
+def get_layout_cache() -> Optional[LayoutTemplateCache]:
+    """Shared template cache, or None when the layout engine is switched off"""
+    global _layout_cache
+    settings = get_config().extraction
+    if not settings.layout_engine:
+        return None
+    if _layout_cache is None:
+        path = settings.layout_cache
+        _layout_cache = LayoutTemplateCache(resolve_path(path) if path else None)
+    return _layout_cache
+
 class TruckingScheduleExtractor:
     """Extract trucking schedule data from PDF files"""
     
-    def __init__(self, pdf_path: str):
+    def __init__(self, pdf_path: str, progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 page_batch_size: Optional[int] = None):
         self.pdf_path = Path(pdf_path)
         if not self.pdf_path.exists():
             raise FileNotFoundError(f"PDF file not found: {pdf_path}")
         
         self.all_data = []
         self.contract_info = {}
+        self.page_count = 0
+        self.progress_callback = progress_callback
+        # 0 reads every page in one tabula call
+        self.page_batch_size = get_config().extraction.page_batch_size if page_batch_size is None else page_batch_size
+        # Peak memory per phase of the last extract_to_csv call
+        self.memory = None
+    
+    def _report_progress(self, phase: str, **fields):
+        """Forward a progress event to the caller, if one is listening"""
+        if self.progress_callback:
+            self.progress_callback({'phase': phase, 'pages': self.page_count, **fields})
         
     def extract_contract_info(self) -> Dict[str, str]:
         """Extract contract header information"""
         logger.info("Extracting contract information...")
         
         with pdfplumber.open(self.pdf_path) as pdf:
+            self.page_count = len(pdf.pages)
+            self._report_progress('contract_info', page=1)
             first_page = pdf.pages[0]
             text = first_page.extract_text()
             
@@ -76,29 +111,9 @@ class TruckingScheduleExtractor:
             return info
     
     def extract_data_with_tabula(self) -> pd.DataFrame:
-        """Extract schedule data using tabula"""
-        logger.info("Extracting data using tabula...")
-        
+        """Extract schedule data using tabula, as one DataFrame (extract_to_csv streams _tabula_batches)"""
         try:
-            # Extract all tables from all pages
-            all_tables = tabula.read_pdf(
-                str(self.pdf_path),
-                pages='all',
-                multiple_tables=True,
-                pandas_options={'header': 0}
-            )
-            
-            combined_data = []
-            
-            for i, df in enumerate(all_tables):
-                if df.empty:
-                    continue
-                
-                logger.info(f"Processing table {i+1} with shape {df.shape}")
-                processed_df = self._process_table(df, i+1)
-                if not processed_df.empty:
-                    combined_data.append(processed_df)
-            
+            combined_data = list(self._tabula_batches())
             if combined_data:
                 final_df = pd.concat(combined_data, ignore_index=True)
                 logger.info(f"Combined data shape: {final_df.shape}")
@@ -110,6 +125,119 @@ class TruckingScheduleExtractor:
             logger.error(f"Tabula extraction failed: {e}")
             return self._extract_with_text_parsing()
     
+    def _tabula_batches(self) -> Iterator[pd.DataFrame]:
+        """Yield each tabula table as parsed rows; the raw table is released before the next is read"""
+        logger.info("Extracting data using tabula...")
+        rows_parsed = 0
+        for i, df in enumerate(self._read_tables()):
+            if df.empty:
+                continue
+            
+            logger.info(f"Processing table {i+1} with shape {df.shape}")
+            processed_df = self._process_table(df, i+1)
+            del df
+            rows_parsed += len(processed_df)
+            self._report_progress('tables', table=i + 1, rows=rows_parsed)
+            if not processed_df.empty:
+                yield processed_df
+    
+    def extract_data_with_layout(self) -> Optional[pd.DataFrame]:
+        """Slice rows into fields by column position, using a template learned from page 1
+
+        Returns None when no template fits, so the caller can use tabula instead.
+        Lines that look like rows but do not fit the template go through the
+        regular-expression parser.
+        """
+        batches = list(self._layout_batches())
+        if not batches:
+            return None
+        return pd.concat(batches, ignore_index=True)
+    
+    def _layout_batches(self) -> Iterator[pd.DataFrame]:
+        """Yield parsed rows one page batch at a time; yields nothing if no template fits"""
+        cache = get_layout_cache()
+        if cache is None:
+            return
+        logger.info("Extracting data using the layout engine...")
+        
+        rows = []
+        total_rows = 0
+        fallback_rows = 0
+        batch_size = self.page_batch_size or 1
+        with pdfplumber.open(self.pdf_path) as pdf:
+            self.page_count = len(pdf.pages)
+            template = None
+            for page_num, page in enumerate(pdf.pages, start=1):
+                words = page.extract_words(x_tolerance=1.5, keep_blank_chars=False)
+                if template is None:
+                    template = cache.template_for(words, page.width)
+                    if template is None:
+                        logger.info("No layout template matched page 1")
+                        return
+                
+                for fields, raw in template.parse_page(words):
+                    if fields is None:
+                        fields = self._parse_row_text(raw)
+                        if fields is None:
+                            continue
+                        fallback_rows += 1
+                    else:
+                        fields = self._complete_fields(fields, raw)
+                    fields['page_number'] = page_num
+                    rows.append(fields)
+                # pdfplumber caches each page's objects; drop them once the page is parsed
+                page.flush_cache()
+                self._report_progress('layout_parsing', page=page_num, rows=total_rows + len(rows))
+                if page_num % batch_size == 0 and rows:
+                    total_rows += len(rows)
+                    yield pd.DataFrame(rows)
+                    rows = []
+        
+        if rows:
+            total_rows += len(rows)
+            yield pd.DataFrame(rows)
+        if total_rows:
+            logger.info(f"Layout engine parsed {total_rows} rows ({fallback_rows} via regex fallback)")
+    
+    def _complete_fields(self, fields: Dict[str, Any], raw: str) -> Dict[str, Any]:
+        """Fill every output column and split a combined vehicle cell such as '45FT V123'"""
+        row = {name: fields.get(name, '') for name in FIELDS}
+        if not row['vehicle_type'] and ' ' in row['vehicle_id']:
+            first, rest = row['vehicle_id'].split(' ', 1)
+            if VEHICLE_TYPE_PATTERN.match(first):
+                row['vehicle_type'], row['vehicle_id'] = first, rest
+        row['raw_data'] = raw
+        return row
+    
+    def _read_tables(self) -> Iterator[pd.DataFrame]:
+        """Read tables in page batches, reporting progress after each batch
+
+        tabula runs in the JVM that jpype keeps inside this process, so after the
+        first batch every further call is cheap. Only one batch of tables is
+        held at a time.
+        """
+        if not self.page_batch_size or not self.page_count:
+            self._report_progress('reading_tables')
+            yield from tabula.read_pdf(
+                str(self.pdf_path),
+                pages='all',
+                multiple_tables=True,
+                pandas_options={'header': 0}
+            )
+            return
+        
+        for first in range(1, self.page_count + 1, self.page_batch_size):
+            last = min(first + self.page_batch_size - 1, self.page_count)
+            self._report_progress('reading_tables', page=first)
+            tables = tabula.read_pdf(
+                str(self.pdf_path),
+                pages=list(range(first, last + 1)),
+                multiple_tables=True,
+                pandas_options={'header': 0}
+            )
+            while tables:
+                yield tables.pop(0)
+    
     def _process_table(self, df: pd.DataFrame, table_num: int) -> pd.DataFrame:
         """Process and clean individual table data"""
         
@@ -142,6 +270,10 @@ class TruckingScheduleExtractor:
         
         # Convert row to string for parsing
         row_str = ' '.join([str(val) for val in row.values if pd.notna(val)])
+        return self._parse_row_text(row_str)
+    
+    def _parse_row_text(self, row_str: str) -> Optional[Dict[str, Any]]:
+        """Find the trip and stop fields in a flattened row with regular expressions"""
         
         # Skip empty or header rows
         if not row_str.strip() or 'Trip Stop' in row_str or 'ID #' in row_str:
@@ -205,34 +337,46 @@ class TruckingScheduleExtractor:
         }
     
     def _extract_with_text_parsing(self) -> pd.DataFrame:
-        """Fallback method using text parsing"""
+        """Fallback method using text parsing, as one DataFrame"""
+        batches = list(self._text_batches())
+        if batches:
+            return pd.concat(batches, ignore_index=True)
+        else:
+            return pd.DataFrame()
+    
+    def _text_batches(self) -> Iterator[pd.DataFrame]:
+        """Yield text-parsed rows one page batch at a time"""
         logger.info("Using text parsing fallback method...")
         
         all_rows = []
+        total_rows = 0
+        batch_size = self.page_batch_size or 1
         
         with pdfplumber.open(self.pdf_path) as pdf:
+            self.page_count = len(pdf.pages)
             for page_num, page in enumerate(pdf.pages):
+                self._report_progress('text_parsing', page=page_num + 1, rows=total_rows + len(all_rows))
                 text = page.extract_text()
-                if not text:
-                    continue
-                
-                lines = text.split('\n')
+                page.flush_cache()
+                if text:
+                    for line in text.split('\n'):
+                        line = line.strip()
+                        if not line:
+                            continue
+                        
+                        # Look for trip data lines
+                        if re.match(r'^\d+\s+\d+\s+[A-Z0-9]+', line):
+                            row_data = self._parse_text_line(line, page_num + 1)
+                            if row_data:
+                                all_rows.append(row_data)
                 
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    # Look for trip data lines
-                    if re.match(r'^\d+\s+\d+\s+[A-Z0-9]+', line):
-                        row_data = self._parse_text_line(line, page_num + 1)
-                        if row_data:
-                            all_rows.append(row_data)
+                if (page_num + 1) % batch_size == 0 and all_rows:
+                    total_rows += len(all_rows)
+                    yield pd.DataFrame(all_rows)
+                    all_rows = []
         
         if all_rows:
-            return pd.DataFrame(all_rows)
-        else:
-            return pd.DataFrame()
+            yield pd.DataFrame(all_rows)
     
     def _parse_text_line(self, line: str, page_num: int) -> Optional[Dict[str, Any]]:
         """Parse a text line to extract trip information"""
@@ -286,61 +430,93 @@ class TruckingScheduleExtractor:
             output_path = self.pdf_path.stem + '_schedule_data.csv'
         
         logger.info(f"Starting extraction of {self.pdf_path}")
+        settings = get_config().extraction
+        tracker = MemoryTracker(settings.memory_budget_mb, settings.memory_tracemalloc, settings.memory_sample_ms)
         
-        # Extract contract information
-        contract_info = self.extract_contract_info()
-        
-        # Extract main schedule data
-        main_data = self.extract_data_with_tabula()
-        
-        # Add contract information to each row
-        for key, value in contract_info.items():
-            main_data[f'contract_{key}'] = value
-        
-        # Clean final dataframe
-        main_data = main_data.dropna(how='all')
-        
-        # Sort by trip_id and stop_number
-        if 'trip_id' in main_data.columns and 'stop_number' in main_data.columns:
-            main_data['trip_id'] = pd.to_numeric(main_data['trip_id'], errors='coerce')
-            main_data['stop_number'] = pd.to_numeric(main_data['stop_number'], errors='coerce')
-            main_data = main_data.sort_values(['trip_id', 'stop_number'])
+        with tracker:
+            # Extract contract information
+            with tracker.phase('contract_info'):
+                contract_info = self.extract_contract_info()
+            
+            # Rows arrive one table or page batch at a time, get the contract columns
+            # added, and spill to sorted run files once the memory budget is passed
+            rows = SpillingRowBuffer(
+                tracker,
+                extra_columns=contract_info,
+                spill_dir=settings.spill_dir or os.path.dirname(os.path.abspath(output_path)),
+                on_spill=lambda spilled: self._report_progress('spilling', rows=spilled)
+            )
+            
+            # Extract main schedule data
+            with tracker.phase('layout'):
+                for batch in self._layout_batches():
+                    rows.add(batch)
+            if not rows.rows:
+                try:
+                    with tracker.phase('tabula'):
+                        for batch in self._tabula_batches():
+                            rows.add(batch)
+                    if not rows.rows:
+                        raise ValueError("No data could be extracted")
+                except Exception as e:
+                    logger.error(f"Tabula extraction failed: {e}")
+                    rows.clear()
+                    with tracker.phase('text_parsing'):
+                        for batch in self._text_batches():
+                            rows.add(batch)
+            
+            # Save to CSV, sorted by trip_id and stop_number
+            self._report_progress('writing', rows=rows.rows)
+            with tracker.phase('writing'):
+                rows.write(output_path)
         
-        # Save to CSV
-        main_data.to_csv(output_path, index=False)
-        logger.info(f"Data successfully extracted to {output_path}")
+        self.memory = tracker.summary()
+        self.memory['spilled_rows'] = rows.spilled_rows
+        logger.info(f"Data successfully extracted to {output_path} "
+                    f"(peak RSS {self.memory['peak_rss_mb']} MB, {rows.spilled_rows} rows spilled)")
         
         # Print summary
-        self._print_summary(main_data, output_path)
+        self._print_summary(rows, output_path)
         
         return output_path
     
-    def _print_summary(self, df: pd.DataFrame, output_path: str):
+    def _print_summary(self, rows: SpillingRowBuffer, output_path: str):
         """Print extraction summary"""
         print("\n" + "="*80)
         print("TRUCKING SCHEDULE EXTRACTION SUMMARY")
         print("="*80)
         print(f"Source PDF: {self.pdf_path}")
         print(f"Output CSV: {output_path}")
-        print(f"Total records: {len(df)}")
-        print(f"Columns: {len(df.columns)}")
+        print(f"Total records: {rows.rows}")
+        print(f"Columns: {len(rows.columns)}")
         
-        if 'trip_id' in df.columns:
-            unique_trips = df['trip_id'].nunique()
-            print(f"Unique trips: {unique_trips}")
+        if 'trip_id' in rows.columns:
+            print(f"Unique trips: {len(rows.trip_ids)}")
         
         print(f"\nContract Information:")
         for key, value in self.contract_info.items():
             print(f"  {key}: {value}")
         
         print(f"\nColumn names:")
-        for col in df.columns:
+        for col in rows.columns:
             print(f"  - {col}")
         
+        print(f"\nMemory:")
+        budget = self.memory['budget_mb']
+        print(f"  Peak RSS: {self.memory['peak_rss_mb']} MB (budget: {f'{budget} MB' if budget else 'none'})")
+        print(f"  Rows spilled to disk: {self.memory['spilled_rows']}")
+        for phase, stats in self.memory['phases'].items():
+            traced = f", traced peak {stats['peak_traced_mb']} MB" if 'peak_traced_mb' in stats else ''
+            print(f"  {phase}: peak RSS {stats['peak_rss_mb']} MB{traced}, {stats['seconds']}s")
+        
         print(f"\nFirst 5 records:")
-        print(df.head().to_string())
+        print(rows.head(output_path).to_string())
         print("="*80)
 
+def print_progress(event: Dict[str, Any]):
+    """Write a progress event as a single PROGRESS line for the parent process"""
+    print(f"PROGRESS {json.dumps(event)}", flush=True)
+
 def main():
     """Main function"""
     import argparse
@@ -349,6 +525,8 @@ def main():
     parser.add_argument('pdf_path', help='Path to the PDF file')
     parser.add_argument('-o', '--output', help='Output CSV file path')
     parser.add_argument('-v', '--verbose', action='store_true', help='Verbose logging')
+    parser.add_argument('--progress', action='store_true', help='Emit PROGRESS json lines on stdout')
+    parser.add_argument('--profile', action='store_true', help='Save a profile of the extraction')
     
     args = parser.parse_args()
     
@@ -356,8 +534,17 @@ def main():
         logging.getLogger().setLevel(logging.DEBUG)
     
     try:
-        extractor = TruckingScheduleExtractor(args.pdf_path)
-        output_file = extractor.extract_to_csv(args.output)
+        extractor = TruckingScheduleExtractor(
+            args.pdf_path,
+            progress_callback=print_progress if args.progress else None
+        )
+        if args.profile:
+            from profiling import profile_extraction
+            output_file, profile_file = profile_extraction(
+                get_config().profiling, extractor, args.output, f"extract {Path(args.pdf_path).name}")
+            print(f"Profile saved: {profile_file}")
+        else:
+            output_file = extractor.extract_to_csv(args.output)
         print(f"\nSuccess! Schedule data extracted to: {output_file}")
         
     except Exception as e:
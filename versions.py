@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Schedule versions per contract
+Every import of a contract creates a version: a schedule_versions row with
+valid_from/valid_to whose id is stamped on the schedule rows it inserted. When
+the import commits, the contract's previous version is closed and its rows get
+the same valid_to. App reads filter on `valid_to IS NULL`, which partial indexes
+serve without touching superseded rows. Diffs between two versions are set
+operations over the (version_id, trip_id, stop_number, times) index.
+"""
+
+import logging
+
+from search_index import unindex_version
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schedule_versions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    contract_hcr_number TEXT,
+    source TEXT,
+    row_count INTEGER,
+    valid_from TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    valid_to TIMESTAMP
+)
+"""
+
+# The current-version indexes only hold rows with valid_to IS NULL; a query
+# uses them when its WHERE clause says so too. valid_to is also indexed (always
+# NULL) because SQLite only counts an index as covering if it holds every column
+# the query mentions.
+VERSION_INDEXES = [
+    # Trip lookups by id; stops come back in order, grouped per contract
+    "CREATE INDEX IF NOT EXISTS idx_schedule_current_trip ON schedule("
+    "trip_id, contract_hcr_number, stop_number, valid_to) WHERE valid_to IS NULL;",
+    # Covers the per-contract trip summaries, so /api/trips never touches the table
+    "CREATE INDEX IF NOT EXISTS idx_schedule_current_contract_trip ON schedule("
+    "contract_hcr_number, trip_id, arrive_time, depart_time, facility, vehicle_type, vehicle_id, valid_to) "
+    "WHERE valid_to IS NULL;",
+    "CREATE INDEX IF NOT EXISTS idx_schedule_current_facility ON schedule(facility, valid_to) "
+    "WHERE valid_to IS NULL;",
+    # Covers version diffs, and finds a version's rows when it is superseded
+    "CREATE INDEX IF NOT EXISTS idx_schedule_version ON schedule("
+    "version_id, trip_id, stop_number, arrive_time, depart_time);",
+    "CREATE INDEX IF NOT EXISTS idx_versions_contract ON schedule_versions(contract_hcr_number);"
+]
+
+# Replaced by the partial indexes above
+SUPERSEDED_INDEXES = ['idx_schedule_trip', 'idx_schedule_contract_trip', 'idx_facility']
+
+# Trips present in one version and not the other
+TRIPS_ONLY_IN_SQL = """
+    SELECT trip_id FROM schedule WHERE version_id = ?
+    EXCEPT
+    SELECT trip_id FROM schedule WHERE version_id = ?
+    ORDER BY trip_id
+"""
+
+# Trips in both versions whose stop numbers or times differ in either direction
+RETIMED_TRIPS_SQL = """
+    SELECT trip_id FROM (
+        SELECT trip_id, stop_number, arrive_time, depart_time FROM schedule WHERE version_id = :new
+        EXCEPT
+        SELECT trip_id, stop_number, arrive_time, depart_time FROM schedule WHERE version_id = :old
+    )
+    UNION
+    SELECT trip_id FROM (
+        SELECT trip_id, stop_number, arrive_time, depart_time FROM schedule WHERE version_id = :old
+        EXCEPT
+        SELECT trip_id, stop_number, arrive_time, depart_time FROM schedule WHERE version_id = :new
+    )
+    INTERSECT
+    SELECT trip_id FROM schedule WHERE version_id = :old
+    INTERSECT
+    SELECT trip_id FROM schedule WHERE version_id = :new
+    ORDER BY trip_id
+"""
+
+
+def ensure_versioning(conn):
+    """Add version columns, table and indexes; returns True if the schema changed
+
+    Rows imported before versioning become one version per contract.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='schedule'").fetchone():
+        return False
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(schedule)")}
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    if 'version_id' in columns and 'idx_schedule_version' in indexes \
+            and not indexes & set(SUPERSEDED_INDEXES):
+        return False
+
+    # Several workers may start at once; only the first one migrates
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(schedule)")}
+    conn.execute(VERSIONS_TABLE_SQL)
+    if 'version_id' not in columns:
+        conn.execute("ALTER TABLE schedule ADD COLUMN version_id INTEGER")
+        conn.execute("ALTER TABLE schedule ADD COLUMN valid_to TIMESTAMP")
+        contracts = conn.execute("""
+            SELECT contract_hcr_number, MIN(created_at), COUNT(*) FROM schedule
+            GROUP BY contract_hcr_number
+        """).fetchall()
+        for contract, valid_from, row_count in contracts:
+            version_id = conn.execute("""
+                INSERT INTO schedule_versions (contract_hcr_number, source, row_count, valid_from)
+                VALUES (?, 'before versioning', ?, COALESCE(?, CURRENT_TIMESTAMP))
+            """, (contract, row_count, valid_from)).lastrowid
+            conn.execute("UPDATE schedule SET version_id = ? WHERE contract_hcr_number IS ?",
+                         (version_id, contract))
+        logger.info(f"Versioned existing schedule rows: {len(contracts)} contracts")
+    for index_sql in VERSION_INDEXES:
+        conn.execute(index_sql)
+    for index_name in SUPERSEDED_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+    conn.commit()
+    return True
+
+
+def begin_version(conn, contract, source):
+    """Open a version for rows about to be imported; returns its id (caller commits)"""
+    return conn.execute(
+        "INSERT INTO schedule_versions (contract_hcr_number, source) VALUES (?, ?)",
+        (contract, source)
+    ).lastrowid
+
+
+def finish_version(conn, version_id, row_count):
+    """Make a version current and close the contract's older ones; returns their ids
+
+    Runs in the import's transaction, so readers switch versions at commit.
+    """
+    contract, valid_from = conn.execute(
+        "SELECT contract_hcr_number, valid_from FROM schedule_versions WHERE id = ?", (version_id,)
+    ).fetchone()
+    conn.execute("UPDATE schedule_versions SET row_count = ? WHERE id = ?", (row_count, version_id))
+    retired = [row[0] for row in conn.execute("""
+        SELECT id FROM schedule_versions
+        WHERE contract_hcr_number IS ? AND valid_to IS NULL AND id != ?
+    """, (contract, version_id))]
+    for old_id in retired:
+        # Search only ever returns current rows
+        unindex_version(conn, old_id)
+        conn.execute("UPDATE schedule SET valid_to = ? WHERE version_id = ?", (valid_from, old_id))
+        conn.execute("UPDATE schedule_versions SET valid_to = ? WHERE id = ?", (valid_from, old_id))
+    return retired
+
+
+def list_versions(database, contract):
+    """Versions of one contract, newest first"""
+    return database.execute_query("""
+        SELECT id, contract_hcr_number, source, row_count, valid_from, valid_to,
+               valid_to IS NULL AS current
+        FROM schedule_versions
+        WHERE contract_hcr_number = ?
+        ORDER BY id DESC
+    """, (contract,))
+
+
+def diff_versions(database, old_id, new_id):
+    """Trip ids added, removed and retimed going from one version to another"""
+    with database.connection() as conn:
+        return {
+            'added': [row[0] for row in conn.execute(TRIPS_ONLY_IN_SQL, (new_id, old_id))],
+            'removed': [row[0] for row in conn.execute(TRIPS_ONLY_IN_SQL, (old_id, new_id))],
+            'retimed': [row[0] for row in conn.execute(RETIMED_TRIPS_SQL, {'old': old_id, 'new': new_id})]
+        }
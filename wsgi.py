@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+"""
+WSGI entry point for production servers
+Example: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from app import app
+
+application = app